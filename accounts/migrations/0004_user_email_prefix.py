@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_is_subscribed_user_storage_quota'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['email'], name='accounts_user_email_prefix', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -31,3 +31,9 @@ class User(AbstractUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
     objects = UserManager()
+
+    class Meta(AbstractUser.Meta):
+        # Prefix search on email in the admin (core.changelist).
+        indexes = [
+            models.Index(fields=["email"], name="accounts_user_email_prefix", opclasses=["varchar_pattern_ops"]),
+        ]
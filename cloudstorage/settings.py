@@ -51,7 +51,7 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'django.contrib.staticfiles',
+    'core.apps.StaticFilesConfig',
     'django.contrib.sites',
     'django.contrib.humanize',
     'allauth',
@@ -62,7 +62,6 @@ INSTALLED_APPS = [
     'storages',
 ]
 
-DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_STORAGE_BUCKET_NAME")
@@ -72,6 +71,134 @@ AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
 AWS_S3_OBJECT_PARAMETERS = {"ACL": "private"}
 AWS_QUERYSTRING_AUTH = True
 
+# Object key layout for new uploads (core.keys.LegacyLayout keeps the old
+# u/<owner>/<filename> scheme). Hashed keys are unique, so S3 can overwrite
+# blindly instead of probing for a free name; legacy keys repeat filenames
+# and must not.
+STORAGE_KEY_LAYOUT = os.getenv("STORAGE_KEY_LAYOUT", "core.keys.HashedLayout")
+AWS_S3_FILE_OVERWRITE = STORAGE_KEY_LAYOUT == "core.keys.HashedLayout"
+
+# S3 client and transfer tuning (see core.s3.TunedS3Storage).
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_S3_MAX_POOL_CONNECTIONS", "50"))
+AWS_S3_RETRY_MODE = os.getenv("AWS_S3_RETRY_MODE", "adaptive")
+AWS_S3_MAX_ATTEMPTS = int(os.getenv("AWS_S3_MAX_ATTEMPTS", "5"))
+AWS_S3_TCP_KEEPALIVE = True
+AWS_S3_CONNECT_TIMEOUT = 5
+AWS_S3_READ_TIMEOUT = 60
+AWS_S3_MULTIPART_THRESHOLD = int(os.getenv("AWS_S3_MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+AWS_S3_MULTIPART_CHUNKSIZE = int(os.getenv("AWS_S3_MULTIPART_CHUNKSIZE", str(16 * 1024 * 1024)))
+AWS_S3_MAX_CONCURRENCY = int(os.getenv("AWS_S3_MAX_CONCURRENCY", "8"))
+UPLOAD_PART_SIZE = AWS_S3_MULTIPART_CHUNKSIZE
+
+# DEFAULT_FILE_STORAGE is no longer read by Django 5.1+, so the bucket is
+# wired through STORAGES; without a bucket files stay under MEDIA_ROOT.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    # Hashed names, plus .gz/.br variants written by collectstatic.
+    "staticfiles": {
+        "BACKEND": "core.staticfiles.CompressedManifestStorage",
+    },
+}
+if AWS_STORAGE_BUCKET_NAME:
+    STORAGES["default"] = {"BACKEND": "core.s3.TunedS3Storage"}
+
+# Django cache: process-local by default, shared Redis when CACHE_URL is set
+# (e.g. redis://127.0.0.1:6379/1) so every worker sees the same entries.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "cloudstorage",
+    }
+}
+if os.getenv("CACHE_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_URL"),
+    }
+
+# Drop links: metadata cache lifetime (also capped by the link expiry),
+# negative cache for unknown tokens and the expired-link sweep interval.
+DROP_CACHE_TTL = 3600
+DROP_NEGATIVE_CACHE_TTL = 30
+DROP_CLEANUP_INTERVAL = 300
+DROP_MAX_UPLOAD_SIZE = int(os.getenv("DROP_MAX_UPLOAD_SIZE", str(2 * 1024 ** 3)))
+
+# Admission control (core.admission), applied per client IP and, when
+# logged in, per user: a token bucket of per_minute requests with up to
+# burst at once, and at most concurrency transfers in flight. State is in
+# CACHES, so it needs the shared Redis cache when running several workers.
+ADMISSION_RULES = {
+    "drop_upload": {"per_minute": 6, "burst": 10, "concurrency": 2},
+    "download": {"per_minute": 120, "burst": 60, "concurrency": 8},
+    # Thumbnails, previews and Range requests of players: one gallery page
+    # alone makes dozens of these, so they get their own, wider bucket.
+    "inline": {"per_minute": 1200, "burst": 300},
+}
+# Reverse proxies in front of the app that append to X-Forwarded-For.
+ADMISSION_PROXY_COUNT = int(os.getenv("ADMISSION_PROXY_COUNT", "0"))
+
+# Staff can profile a request with ?_profile=1 or an X-Profile header
+# (core.middleware.ProfilingMiddleware); the newest PROFILE_KEEP are kept.
+PROFILE_SAMPLE_INTERVAL = 0.001
+PROFILE_KEEP = 200
+
+# Admin changelists for large tables (core.changelist): planner estimates
+# replace COUNT(*) past ADMIN_EXACT_COUNT_LIMIT rows, filtered lists are
+# counted up to ADMIN_COUNT_CAP, and related prefix searches match at most
+# ADMIN_SEARCH_RELATED_LIMIT ids.
+ADMIN_EXACT_COUNT_LIMIT = 10000
+ADMIN_COUNT_CAP = 100000
+ADMIN_SEARCH_RELATED_LIMIT = 1000
+
+# Lifetime window of signed /t/<token> download links, in seconds.
+DOWNLOAD_TOKEN_TTL = int(os.getenv("DOWNLOAD_TOKEN_TTL", "3600"))
+# Live updates (/events, core.events). Off by default: every open tab keeps
+# a stream, and under WSGI each stream blocks a worker thread for up to
+# EVENTS_STREAM_TIMEOUT seconds, so a few tabs can exhaust a sync
+# gunicorn/uwsgi pool. Turn on when serving through ASGI.
+EVENTS_ENABLED = os.getenv("EVENTS_ENABLED", "0") == "1"
+# LocalBackend reaches streams in the same process only, so with several
+# workers or nodes (CACHE_URL set) the default is RedisBackend.
+EVENTS_BACKEND = os.getenv(
+    "EVENTS_BACKEND",
+    "core.events.RedisBackend" if os.getenv("CACHE_URL") else "core.events.LocalBackend",
+)
+EVENTS_REDIS_URL = os.getenv("EVENTS_REDIS_URL") or os.getenv("CACHE_URL", "")
+EVENTS_HEARTBEAT = 15
+EVENTS_STREAM_TIMEOUT = 600
+EVENTS_QUEUE_SIZE = 500
+EVENTS_PROGRESS_INTERVAL = 0.5
+
+# Service worker (templates/sw.js) caching the static shell, the files and
+# trash pages and up to SERVICE_WORKER_PREVIEW_LIMIT previews per browser.
+# Turning it off makes signed-in pages unregister it. On S3, previews are
+# only cached when the bucket allows CORS GETs from the site.
+SERVICE_WORKER = os.getenv("SERVICE_WORKER", "1") != "0"
+SERVICE_WORKER_PREVIEW_LIMIT = 500
+
+# Presigned S3 redirects are reused until this many seconds before expiry.
+PRESIGN_CACHE_MARGIN = 60
+
+# Rendered file/trash grids are cached per user and invalidated through a
+# per-user library version (core.library). Every worker must see the same
+# version, so this is on by default only with the shared Redis cache.
+FRAGMENT_CACHE = os.getenv("FRAGMENT_CACHE", "1" if os.getenv("CACHE_URL") else "0") != "0"
+
+# At-rest compression of text-like uploads: "zstd" (needs the optional
+# zstandard package, gzip is used without it), "gzip", or empty to disable.
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "")
+STORAGE_COMPRESSION_LEVEL = int(os.getenv("STORAGE_COMPRESSION_LEVEL", "3"))
+
+# How long ZIP/tar listings read with ranged requests stay cached.
+ARCHIVE_LISTING_TTL = 86400
+
+# HLS renditions made by the transcode_videos worker.
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+HLS_SEGMENT_SECONDS = 6
+
 AUTH_USER_MODEL = 'accounts.User'
 SITE_ID = 1
 
@@ -94,10 +221,13 @@ SERVER_EMAIL = DEFAULT_FROM_EMAIL
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Outside SessionMiddleware so session reads and saves are routed too.
+    'core.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -114,13 +244,22 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept per process (the autoreloader
+            # clears them when a template changes in development).
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.service_worker',
+                'core.context_processors.live_events',
             ],
         },
     },
@@ -128,16 +267,42 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'cloudstorage.wsgi.application'
 
+# Warm each worker up before it serves (core.warmup, run from wsgi.py):
+# URLconf, templates, DB connections, storage client and GETs of
+# WARMUP_PATHS. `manage.py startup_profile` measures the effect.
+WARMUP = os.getenv("WARMUP", "0") != "0"
+WARMUP_PATHS = ["/"]
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DB_TUNING=0 turns off the connection settings below; bench_db uses it to
+# measure the difference.
+DB_TUNING = os.getenv('DB_TUNING', '1') != '0'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH') or BASE_DIR / 'db.sqlite3',
     }
 }
+if DB_TUNING:
+    DATABASES['default']['OPTIONS'] = {
+        # WAL lets readers proceed while a write is in progress. IMMEDIATE
+        # takes the write lock when a transaction starts, so concurrent
+        # writers queue on the busy timeout instead of failing with
+        # "database is locked" when a read lock cannot be upgraded.
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA temp_store=MEMORY;'
+            'PRAGMA cache_size=-20000;'
+            'PRAGMA mmap_size=134217728'
+        ),
+    }
 
 
 # Password validation
@@ -175,6 +340,11 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'var' / 'static'
+# Serve STATIC_ROOT from Django (core.staticfiles.serve) when no front web
+# server does; hashed files get immutable caching, others STATIC_MAX_AGE.
+STATIC_SERVE = os.getenv('STATIC_SERVE', '0') == '1'
+STATIC_MAX_AGE = 300
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -193,3 +363,38 @@ if os.getenv('POSTGRES_NAME'):
             'PORT': os.getenv('POSTGRES_PORT', '5432'),
         }
     }
+    if DB_TUNING:
+        DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+        if os.getenv('POSTGRES_POOL_SIZE'):
+            # psycopg's pool hands connections between threads; Django
+            # requires CONN_MAX_AGE to stay 0 when it is enabled.
+            DATABASES['default']['OPTIONS'] = {
+                'pool': {
+                    'min_size': int(os.getenv('POSTGRES_POOL_MIN', '2')),
+                    'max_size': int(os.getenv('POSTGRES_POOL_SIZE')),
+                    'timeout': int(os.getenv('POSTGRES_POOL_TIMEOUT', '10')),
+                },
+            }
+        else:
+            DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('POSTGRES_CONN_MAX_AGE', '60'))
+
+
+# Read replicas, kept up to date outside Django (streaming replication, or
+# LiteFS/Litestream for SQLite). Safe requests read from them, see
+# core.routers; tests read through the primary.
+if os.getenv('POSTGRES_NAME'):
+    _replicas = [
+        {**DATABASES['default'], 'HOST': host.strip()}
+        for host in os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',') if host.strip()
+    ]
+else:
+    _replicas = [
+        {**DATABASES['default'], 'NAME': path.strip()}
+        for path in os.getenv('SQLITE_REPLICA_PATHS', '').split(',') if path.strip()
+    ]
+DATABASE_REPLICAS = []
+for _i, _replica in enumerate(_replicas, 1):
+    DATABASES[f'replica{_i}'] = {**_replica, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{_i}')
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
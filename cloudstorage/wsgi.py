@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cloudstorage.settings')
 
 application = get_wsgi_application()
+
+# Warm-up runs in each worker as it imports this module, before it serves.
+# Under gunicorn --preload the import happens before the fork; call
+# core.warmup.warm_up from a post_fork hook instead.
+from django.conf import settings  # noqa: E402
+
+if settings.WARMUP:
+    from core.warmup import warm_up
+
+    warm_up(application)
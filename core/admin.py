@@ -1,14 +1,28 @@
+import gzip
+
 from django.contrib import admin
-from .models import File, PromoCode, PromoRedemption
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
+from .changelist import LargeTableAdmin
+from .models import File, PromoCode, PromoRedemption, RequestProfile, UsageRollup
 @admin.register(File)
-class FileAdmin(admin.ModelAdmin):
+class FileAdmin(LargeTableAdmin):
     list_display = ("id","owner","name","size","uploaded_at")
     list_filter = ("uploaded_at",)
-    search_fields = ("name", "owner__email")
+    list_select_related = ("owner",)
+    list_only = ("id", "name", "size", "uploaded_at", "owner__email")
+    sortable_by = ("id", "uploaded_at")
+    prefix_search_fields = ("name", "owner__email")
+    raw_id_fields = ("owner", "folder")
+    export_fields = ("id", "owner__email", "folder_id", "name", "size", "stored_size",
+                     "content_type", "uploaded_at", "is_deleted", "deleted_at")
 
 
 @admin.register(PromoCode)
-class PromoCodeAdmin(admin.ModelAdmin):
+class PromoCodeAdmin(LargeTableAdmin):
     list_display = (
         "code",
         "discount_percent",
@@ -20,13 +34,17 @@ class PromoCodeAdmin(admin.ModelAdmin):
         "active",
     )
     list_filter = ("active", "grant_subscription", "valid_until")
-    search_fields = ("code", "description")
+    prefix_search_fields = ("code",)
+    # Promo codes are created by hand and stay few.
+    contains_search_fields = ("description",)
     readonly_fields = ("use_count", "created_at")
-    ordering = ("-created_at",)
+    # Same order as -created_at, but served by the primary key index.
+    ordering = ("-pk",)
+    sortable_by = ("code",)
 
 
 @admin.register(PromoRedemption)
-class PromoRedemptionAdmin(admin.ModelAdmin):
+class PromoRedemptionAdmin(LargeTableAdmin):
     list_display = (
         "promo",
         "user",
@@ -36,4 +54,118 @@ class PromoRedemptionAdmin(admin.ModelAdmin):
         "granted_subscription",
     )
     list_filter = ("redeemed_at", "granted_subscription")
-    search_fields = ("promo__code", "user__email")
\ No newline at end of file
+    list_select_related = ("promo", "user")
+    list_only = (
+        "promo__code",
+        "user__email",
+        "redeemed_at",
+        "discount_percent",
+        "extra_storage_bytes",
+        "granted_subscription",
+    )
+    ordering = ("-pk",)
+    sortable_by = ("redeemed_at",)
+    prefix_search_fields = ("promo__code", "user__email")
+    raw_id_fields = ("promo", "user")
+    export_fields = ("id", "promo__code", "user__email", "redeemed_at", "discount_percent",
+                     "extra_storage_bytes", "granted_subscription")
+
+
+@admin.register(UsageRollup)
+class UsageRollupAdmin(LargeTableAdmin):
+    list_display = ("user", "family", "month", "live_bytes", "live_files", "trash_bytes", "trash_files")
+    list_filter = ("family", "month")
+    list_select_related = ("user",)
+    list_only = ("user__email", "family", "month", "live_bytes", "live_files", "trash_bytes", "trash_files")
+    sortable_by = ("month",)
+    prefix_search_fields = ("user__email",)
+    export_fields = ("user__email", "family", "month", "live_bytes", "live_files", "trash_bytes", "trash_files")
+
+    # Maintained by the file lifecycle and rebuild_usage_rollups only.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        "created_at",
+        "method",
+        "path",
+        "status",
+        "duration_ms",
+        "query_count",
+        "query_ms",
+        "storage_count",
+        "storage_ms",
+        "user",
+    )
+    list_filter = ("method", "status")
+    search_fields = ("path", "user__email")
+    date_hierarchy = "created_at"
+    exclude = ("queries", "storage_calls", "speedscope")
+    readonly_fields = (
+        "user",
+        "method",
+        "path",
+        "status",
+        "duration_ms",
+        "query_count",
+        "query_ms",
+        "storage_count",
+        "storage_ms",
+        "created_at",
+        "flamegraph",
+        "slowest_queries",
+        "storage_table",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:pk>/speedscope/",
+                self.admin_site.admin_view(self.speedscope_view),
+                name="core_requestprofile_speedscope",
+            ),
+        ] + super().get_urls()
+
+    def speedscope_view(self, request, pk):
+        obj = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(gzip.decompress(bytes(obj.speedscope)), content_type="application/json")
+        response["Content-Disposition"] = f'attachment; filename="profile-{obj.pk}.speedscope.json"'
+        return response
+
+    @admin.display(description="Flamegraph")
+    def flamegraph(self, obj):
+        return format_html(
+            '<a href="{}">profile-{}.speedscope.json</a> '
+            '(<a href="https://www.speedscope.app/" target="_blank" rel="noopener">speedscope.app</a>)',
+            reverse("admin:core_requestprofile_speedscope", args=[obj.pk]),
+            obj.pk,
+        )
+
+    @admin.display(description="Slowest queries")
+    def slowest_queries(self, obj):
+        rows = sorted(obj.queries, key=lambda q: q["ms"], reverse=True)[:50]
+        return format_html(
+            "<table>{}</table>",
+            format_html_join("", "<tr><td>{} ms</td><td>{}</td><td><code>{}</code></td></tr>",
+                             ((f"{q['ms']:.2f}", q["db"], q["sql"]) for q in rows)),
+        )
+
+    @admin.display(description="Storage calls")
+    def storage_table(self, obj):
+        return format_html(
+            "<table>{}</table>",
+            format_html_join("", "<tr><td>{} ms</td><td>{}</td><td>{}</td></tr>",
+                             ((f"{c['ms']:.2f}", c["op"], c["name"]) for c in obj.storage_calls)),
+        )
@@ -0,0 +1,143 @@
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+REJECT_MESSAGE = "Слишком много запросов. Повторите позже."
+
+
+def client_ip(request) -> str:
+    # With N trusted proxies in front, the client is the N-th address from
+    # the right of X-Forwarded-For; anything left of it is client supplied.
+    proxies = getattr(settings, "ADMISSION_PROXY_COUNT", 0)
+    if proxies:
+        hops = [h.strip() for h in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if h.strip()]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def take_token(key: str, per_minute: float, burst: int, cost: float = 1) -> float:
+    """Token bucket kept as a single timestamp (GCRA). Returns 0 when the
+    request is admitted, otherwise seconds until it would be.
+
+    The read and write are not atomic, so simultaneous requests from one
+    client on different workers may both pass; the bucket still bounds the
+    sustained rate."""
+    interval = 60.0 / per_minute
+    now = time.time()
+    tat = max(cache.get(key) or now, now)
+    new_tat = tat + cost * interval
+    allow_at = new_tat - burst * interval
+    if allow_at > now:
+        return allow_at - now
+    cache.set(key, new_tat, math.ceil(new_tat - now) + 1)
+    return 0
+
+
+class Slot:
+    """One unit of a per-client concurrency counter, released exactly once."""
+
+    def __init__(self, key):
+        self.key = key
+        self._held = True
+
+    def release(self):
+        if not self._held:
+            return
+        self._held = False
+        try:
+            if cache.decr(self.key) < 0:
+                cache.delete(self.key)
+        except ValueError:
+            # Expired while held; the counter has started over.
+            pass
+
+
+def acquire_slot(key: str, limit: int):
+    # The TTL bounds how long slots leaked by a killed worker stay taken.
+    cache.add(key, 0, getattr(settings, "ADMISSION_SLOT_TTL", 3600))
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, getattr(settings, "ADMISSION_SLOT_TTL", 3600))
+        count = cache.incr(key)
+    if count > limit:
+        cache.decr(key)
+        return None
+    return Slot(key)
+
+
+def _clients(request):
+    clients = [f"ip:{client_ip(request)}"]
+    if request.user.is_authenticated:
+        clients.append(f"user:{request.user.pk}")
+    return clients
+
+
+def admit(request, scope, clients=None):
+    """Check the ADMISSION_RULES for ``scope``. Returns ``(slots, None)`` when
+    admitted or ``(None, retry_after)`` when not. ``clients`` are the bucket
+    keys to charge, by default the IP and the signed-in user."""
+    rule = getattr(settings, "ADMISSION_RULES", {}).get(scope)
+    if not rule:
+        return [], None
+    if clients is None:
+        clients = _clients(request)
+    for client in clients:
+        wait = take_token(f"admit:rate:{scope}:{client}", rule["per_minute"], rule["burst"])
+        if wait:
+            return None, wait
+    slots = []
+    if rule.get("concurrency"):
+        for client in clients:
+            slot = acquire_slot(f"admit:slots:{scope}:{client}", rule["concurrency"])
+            if slot is None:
+                for taken in slots:
+                    taken.release()
+                return None, rule.get("busy_retry_after", 5)
+            slots.append(slot)
+    return slots, None
+
+
+def too_many_requests(retry_after, as_json=False):
+    if as_json:
+        response = JsonResponse({"error": REJECT_MESSAGE}, status=429)
+    else:
+        response = HttpResponse(REJECT_MESSAGE, status=429, content_type="text/plain; charset=utf-8")
+    response["Retry-After"] = str(max(math.ceil(retry_after), 1))
+    return response
+
+
+def admission(scope, as_json=False, clients=None):
+    """Rate-limit a view and cap transfers in flight per IP and per user.
+    Slots are held until the response is closed, i.e. until a streamed
+    download has been sent. ``scope`` may be a callable taking the view's
+    arguments, for views whose requests fall under different rules.
+    ``clients``, also called with the view's arguments, replaces the default
+    bucket keys; views that must not load the session pass it."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            name = scope(request, *args, **kwargs) if callable(scope) else scope
+            keys = clients(request, *args, **kwargs) if clients else None
+            slots, retry_after = admit(request, name, keys)
+            if slots is None:
+                return too_many_requests(retry_after, as_json)
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                for slot in slots:
+                    slot.release()
+                raise
+            for slot in slots:
+                response._resource_closers.append(slot.release)
+            return response
+
+        return wrapped
+
+    return decorator
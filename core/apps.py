@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.contrib.staticfiles.apps import StaticFilesConfig as BaseStaticFilesConfig
 
 
 class CoreConfig(AppConfig):
+    default = True
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+
+class StaticFilesConfig(BaseStaticFilesConfig):
+    # static/src holds stylesheet sources; only the built files are collected.
+    ignore_patterns = [*BaseStaticFilesConfig.ignore_patterns, "src"]
@@ -0,0 +1,206 @@
+import datetime
+import tarfile
+import zipfile
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .storage import RangedReader
+
+# Enough for a ZIP end-of-central-directory record plus a typical directory,
+# or a few dozen tar headers, in one request.
+LIST_BLOCK = 64 * 1024
+STREAM_BLOCK = 1024 * 1024
+MAX_ENTRIES = 10000
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _reader(obj, block_size):
+    return RangedReader(obj.file.storage, obj.file.name, obj.stored_size or obj.size, block_size)
+
+
+def _is_tar(reader) -> bool:
+    reader.seek(257)
+    magic = reader.read(5)
+    reader.seek(0)
+    return magic == b"ustar"
+
+
+def _is_zip(reader) -> bool:
+    try:
+        return zipfile.is_zipfile(reader)
+    finally:
+        reader.seek(0)
+
+
+def _open(reader):
+    if _is_zip(reader):
+        return "zip", zipfile.ZipFile(reader)
+    if _is_tar(reader):
+        # Plain tar only: members are reached by seeking from header to header.
+        return "tar", tarfile.open(fileobj=reader, mode="r:")
+    raise ArchiveError("unsupported archive")
+
+
+def _zip_entries(archive):
+    for info in archive.infolist():
+        yield {
+            "name": info.filename,
+            "size": info.file_size,
+            "compressed": info.compress_size,
+            "modified": datetime.datetime(*info.date_time).isoformat(),
+            "dir": info.is_dir(),
+        }
+
+
+def _tar_entries(archive, offsets):
+    for info in archive:
+        if not (info.isfile() or info.isdir()):
+            continue
+        if info.isfile() and not info.issparse():
+            offsets[info.name] = (info.offset_data, info.size)
+        yield {
+            "name": info.name + ("/" if info.isdir() else ""),
+            "size": info.size,
+            "compressed": info.size,
+            "modified": datetime.datetime.fromtimestamp(info.mtime, datetime.timezone.utc).isoformat(),
+            "dir": info.isdir(),
+        }
+
+
+def _cache_key(obj, kind="archive") -> str:
+    # The key and size change whenever the content does.
+    return f"{kind}:{obj.pk}:{obj.file.name}:{obj.size}"
+
+
+def _scan(obj):
+    """Read the archive directory once; cache the listing and, for tar, the
+    data offset of each regular member so it can be served with one seek."""
+    if obj.codec:
+        raise ArchiveError("unsupported archive")
+    reader = _reader(obj, LIST_BLOCK)
+    offsets = {}
+    try:
+        kind, archive = _open(reader)
+        with archive:
+            entries = []
+            if kind == "zip":
+                found = _zip_entries(archive)
+            else:
+                found = _tar_entries(archive, offsets)
+            for entry in found:
+                if len(entries) == MAX_ENTRIES:
+                    break
+                entries.append(entry)
+            truncated = len(entries) == MAX_ENTRIES
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as exc:
+        raise ArchiveError(str(exc)) from exc
+    finally:
+        reader.close()
+    listing = {"format": kind, "entries": entries, "truncated": truncated}
+    index = {"format": kind, "offsets": offsets, "truncated": truncated}
+    ttl = getattr(settings, "ARCHIVE_LISTING_TTL", 86400)
+    cache.set_many({_cache_key(obj): listing, _cache_key(obj, "archive-index"): index}, ttl)
+    return listing, index
+
+
+def list_archive(obj) -> dict:
+    """Entries of a stored ZIP or tar, read with ranged requests and cached."""
+    if obj.codec:
+        raise ArchiveError("unsupported archive")
+    listing = cache.get(_cache_key(obj))
+    if listing is None:
+        listing, _ = _scan(obj)
+    return listing
+
+
+def _open_indexed(obj, index, name):
+    found = index["offsets"].get(name)
+    if found is None:
+        # Members past MAX_ENTRIES were never indexed; look those up.
+        if index["truncated"]:
+            return None
+        raise ArchiveError("member not found")
+    offset, size = found
+    reader = _reader(obj, STREAM_BLOCK)
+    reader.seek(offset)
+    return _MemberStream(_Slice(reader, size), None, reader), size
+
+
+def open_member(obj, name):
+    """Return ``(stream, size)`` for one regular member. The stream reads the
+    member's bytes only; closing it releases the underlying object."""
+    if obj.codec:
+        raise ArchiveError("unsupported archive")
+    index = cache.get(_cache_key(obj, "archive-index"))
+    if index is None:
+        _, index = _scan(obj)
+    if index["format"] == "tar":
+        member = _open_indexed(obj, index, name)
+        if member is not None:
+            return member
+    reader = _reader(obj, STREAM_BLOCK)
+    try:
+        kind, archive = _open(reader)
+        if kind == "zip":
+            try:
+                info = archive.getinfo(name)
+            except KeyError:
+                raise ArchiveError("member not found")
+            if info.is_dir():
+                raise ArchiveError("member not found")
+            if info.flag_bits & 0x1:
+                raise ArchiveError("encrypted member")
+            stream, size = archive.open(info), info.file_size
+        else:
+            try:
+                info = archive.getmember(name)
+            except KeyError:
+                raise ArchiveError("member not found")
+            if not info.isfile():
+                raise ArchiveError("member not found")
+            stream, size = archive.extractfile(info), info.size
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, NotImplementedError) as exc:
+        reader.close()
+        raise ArchiveError(str(exc)) from exc
+    except ArchiveError:
+        reader.close()
+        raise
+    return _MemberStream(stream, archive, reader), size
+
+
+class _MemberStream:
+    def __init__(self, stream, archive, reader):
+        self._stream = stream
+        self._archive = archive
+        self._reader = reader
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def close(self):
+        self._stream.close()
+        if self._archive is not None:
+            self._archive.close()
+        self._reader.close()
+
+
+class _Slice:
+    """``size`` bytes of ``reader`` from its current position."""
+
+    def __init__(self, reader, size):
+        self._reader = reader
+        self._left = size
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._left:
+            size = self._left
+        data = self._reader.read(size) if size else b""
+        self._left -= len(data)
+        return data
+
+    def close(self):
+        pass
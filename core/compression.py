@@ -0,0 +1,160 @@
+import mimetypes
+import zlib
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/sql",
+    "application/x-sh",
+    "application/x-yaml",
+    "application/yaml",
+    "application/toml",
+    "application/rtf",
+    "application/x-tex",
+    "image/svg+xml",
+}
+
+
+def is_compressible(content_type: str, filename: str = "") -> bool:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if not content_type or content_type == "application/octet-stream":
+        content_type = (mimetypes.guess_type(filename or "")[0] or "").lower()
+    if filename.lower().endswith((".log", ".csv", ".tsv", ".ndjson", ".jsonl")):
+        return True
+    return (
+        content_type.startswith("text/")
+        or content_type in COMPRESSIBLE_TYPES
+        or content_type.endswith(("+json", "+xml"))
+    )
+
+
+class GzipCodec:
+    name = "gzip"
+    content_encoding = "gzip"
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def decompressor(self):
+        return zlib.decompressobj(31)
+
+
+class ZstdCodec:
+    name = "zstd"
+    content_encoding = "zstd"
+
+    def __init__(self, level=3):
+        self.level = level
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def decompressor(self):
+        return _ZstdDecompressor()
+
+
+class _ZstdDecompressor:
+    # Uploads are written as a single frame, which is all decompressobj reads;
+    # the wrapper only adds the zlib-style flush().
+    def __init__(self):
+        self._obj = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data):
+        return self._obj.decompress(data)
+
+    def flush(self):
+        return b""
+
+
+def get_codec(name: str, level=None):
+    if name == "gzip":
+        return GzipCodec(level or 6)
+    if name == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required for zstd-compressed files")
+        return ZstdCodec(level or 3)
+    return None
+
+
+def upload_codec(content_type: str, filename: str):
+    """Codec new uploads of this type are stored with, or None."""
+    name = getattr(settings, "STORAGE_COMPRESSION", "")
+    if not name or not is_compressible(content_type, filename):
+        return None
+    if name == "zstd" and zstandard is None:
+        name = "gzip"
+    return get_codec(name, getattr(settings, "STORAGE_COMPRESSION_LEVEL", None))
+
+
+class CompressingWriter:
+    """Wraps a storage writer from ``open_writer`` and compresses on the way."""
+
+    def __init__(self, writer, codec):
+        self.writer = writer
+        self.codec = codec
+        self.stored_size = 0
+        self._compressor = codec.compressor()
+
+    @property
+    def name(self):
+        return self.writer.name
+
+    def write(self, data):
+        out = self._compressor.compress(data)
+        if out:
+            self.stored_size += len(out)
+            self.writer.write(out)
+
+    def close(self) -> str:
+        tail = self._compressor.flush()
+        if tail:
+            self.stored_size += len(tail)
+            self.writer.write(tail)
+        return self.writer.close()
+
+    def abort(self):
+        self.writer.abort()
+
+
+def iter_decompressed(fileobj, codec, block_size=64 * 1024):
+    decompressor = codec.decompressor()
+    try:
+        while True:
+            data = fileobj.read(block_size)
+            if not data:
+                break
+            out = decompressor.decompress(data)
+            if out:
+                yield out
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+    finally:
+        fileobj.close()
+
+
+def accepts_encoding(request, encoding: str) -> bool:
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        token, _, params = item.strip().partition(";")
+        if token.strip().lower() != encoding:
+            continue
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
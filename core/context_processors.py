@@ -0,0 +1,9 @@
+from django.conf import settings
+
+
+def service_worker(request):
+    return {"service_worker": getattr(settings, "SERVICE_WORKER", False)}
+
+
+def live_events(request):
+    return {"live_events": getattr(settings, "EVENTS_ENABLED", False)}
@@ -0,0 +1,299 @@
+import hashlib
+import io
+import json
+
+from django.core.files.base import File as DjangoFile
+from django.db import transaction
+
+from .storage import is_s3, s3_client, s3_key
+
+# Content-defined chunking (gear hash, FastCDC-style cut points). Boundaries
+# depend only on the preceding 64 bytes, so an insert or delete shifts at most
+# a couple of chunks instead of every fixed-size block after it.
+MIN_CHUNK = 64 * 1024
+AVG_CHUNK = 256 * 1024
+MAX_CHUNK = 1024 * 1024
+
+_MASK_BITS = AVG_CHUNK.bit_length() - 1
+_MASK = ((1 << _MASK_BITS) - 1) << (64 - _MASK_BITS)
+_U64 = (1 << 64) - 1
+_GEAR = [
+    int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=8).digest(), "big")
+    for i in range(256)
+]
+
+# S3 multipart limits: every part but the last must be at least 5 MiB and a
+# single UploadPartCopy may not exceed 5 GiB.
+S3_MIN_PART = 5 * 1024 * 1024
+S3_MAX_COPY_PART = 5 * 1024 ** 3
+
+
+class DeltaError(Exception):
+    pass
+
+
+def _find_cut(buf, limit: int) -> int:
+    if limit <= MIN_CHUNK:
+        return limit
+    h = 0
+    gear, mask, u64 = _GEAR, _MASK, _U64
+    with memoryview(buf) as view:
+        for i, byte in enumerate(view[MIN_CHUNK:limit], MIN_CHUNK):
+            h = ((h << 1) + gear[byte]) & u64
+            if not h & mask:
+                return i + 1
+    return limit
+
+
+def iter_chunks(fileobj, read_size: int = MAX_CHUNK):
+    """Yield ``(offset, data)`` content-defined chunks of a binary stream."""
+    buf = bytearray()
+    offset = 0
+    eof = False
+    while True:
+        while not eof and len(buf) < MAX_CHUNK:
+            block = fileobj.read(read_size)
+            if not block:
+                eof = True
+                break
+            buf += block
+        if not buf:
+            return
+        cut = _find_cut(buf, min(len(buf), MAX_CHUNK))
+        data = bytes(buf[:cut])
+        del buf[:cut]
+        yield offset, data
+        offset += len(data)
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def compute_signatures(fileobj) -> list[dict]:
+    return [
+        {"offset": offset, "size": len(data), "digest": digest(data)}
+        for offset, data in iter_chunks(fileobj)
+    ]
+
+
+def parse_manifest(raw) -> list[dict]:
+    try:
+        items = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+        chunks = [
+            {"digest": str(item["digest"]).lower(), "size": int(item["size"])}
+            for item in items
+        ]
+    except (TypeError, ValueError, KeyError):
+        raise DeltaError("invalid manifest")
+    for item in chunks:
+        if len(item["digest"]) != 64 or not 0 < item["size"] <= MAX_CHUNK:
+            raise DeltaError("invalid manifest")
+    return chunks
+
+
+def _hash_stream(fileobj) -> tuple[str, int]:
+    h = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(1024 * 1024), b""):
+        h.update(block)
+        size += len(block)
+    fileobj.seek(0)
+    return h.hexdigest(), size
+
+
+def build_plan(manifest: list[dict], known: dict[str, tuple[int, int]], blobs: dict):
+    """Turn the client manifest into ("copy", offset, size) / ("data", file)
+    segments, merging copies of adjacent ranges of the old object."""
+    segments = []
+    for item in manifest:
+        found = known.get(item["digest"])
+        if found and found[1] == item["size"]:
+            offset, size = found
+            last = segments[-1] if segments else None
+            if last and last[0] == "copy" and last[1] + last[2] == offset:
+                segments[-1] = ("copy", last[1], last[2] + size)
+            else:
+                segments.append(("copy", offset, size))
+            continue
+        blob = blobs.get(item["digest"])
+        if blob is None:
+            raise DeltaError(f"missing chunk {item['digest']}")
+        if _hash_stream(blob) != (item["digest"], item["size"]):
+            raise DeltaError(f"corrupt chunk {item['digest']}")
+        segments.append(("data", blob))
+    return segments
+
+
+def load_manifest(obj) -> list[tuple[str, int, int]]:
+    """(digest, offset, size) rows of the stored version of ``obj`` from
+    FileChunk. Empty until ``manage.py index_chunks`` has chunked the object:
+    chunking reads all of it, which is no work for a request. Until then a
+    delta upload simply sends every chunk."""
+    return list(obj.chunks.values_list("digest", "offset", "size"))
+
+
+def index_file(obj) -> bool:
+    """Chunk the stored object of ``obj`` into FileChunk unless it changed
+    meanwhile. Returns whether rows were written."""
+    from .models import File
+
+    name = obj.file.name
+    with obj.file.open("rb") as fh:
+        signatures = compute_signatures(fh)
+    with transaction.atomic():
+        # A delta commit that replaced the object writes its own manifest;
+        # this one would describe the old content.
+        current = File.objects.select_for_update().filter(pk=obj.pk).values_list("file", flat=True).first()
+        if current != name or obj.chunks.exists():
+            return False
+        store_manifest(obj, signatures)
+    return True
+
+
+def manifest_version(rows) -> str:
+    # Storage keys may be reused when the backend overwrites in place, so the
+    # base version a client planned against is identified by content.
+    return hashlib.sha256("".join(row[0] for row in rows).encode()).hexdigest()[:32]
+
+
+def chunk_index(rows) -> dict[str, tuple[int, int]]:
+    index = {}
+    for row_digest, offset, size in rows:
+        index.setdefault(row_digest, (offset, size))
+    return index
+
+
+def store_manifest(obj, chunks: list[dict]):
+    from .models import FileChunk
+
+    obj.chunks.all().delete()
+    offset = 0
+    rows = []
+    for position, item in enumerate(chunks):
+        rows.append(FileChunk(
+            file=obj,
+            position=position,
+            offset=offset,
+            size=item["size"],
+            digest=item["digest"],
+        ))
+        offset += item["size"]
+    FileChunk.objects.bulk_create(rows, batch_size=500)
+
+
+class _SegmentReader(io.RawIOBase):
+    def __init__(self, source, segments):
+        self._source = source
+        self._pieces = self._iter_pieces(segments)
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def _iter_pieces(self, segments):
+        for segment in segments:
+            if segment[0] == "data":
+                yield segment[1].read()
+                continue
+            _, offset, size = segment
+            self._source.seek(offset)
+            while size > 0:
+                piece = self._source.read(min(size, MAX_CHUNK))
+                if not piece:
+                    raise DeltaError("base object is shorter than its manifest")
+                size -= len(piece)
+                yield piece
+
+    def readinto(self, target):
+        while not self._pending:
+            self._pending = next(self._pieces, b"")
+            if not self._pending:
+                return 0
+        n = min(len(target), len(self._pending))
+        target[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def assemble(storage, old_name: str, new_name: str, segments) -> str:
+    if is_s3(storage):
+        return _assemble_s3(storage, old_name, new_name, segments)
+    with storage.open(old_name, "rb") as source:
+        stream = io.BufferedReader(_SegmentReader(source, segments), MAX_CHUNK)
+        return storage.save(new_name, DjangoFile(stream, name=new_name))
+
+
+def _assemble_s3(storage, old_name: str, new_name: str, segments) -> str:
+    # Unchanged ranges are copied inside the bucket with UploadPartCopy; only
+    # new chunks (plus padding needed to reach the 5 MiB part minimum) are
+    # sent from the app server.
+    client = s3_client(storage)
+    bucket = storage.bucket_name
+    new_name = storage.get_available_name(new_name)
+    source_key = s3_key(storage, old_name)
+    key = s3_key(storage, new_name)
+    params = storage._get_write_parameters(new_name)
+    upload = client.create_multipart_upload(Bucket=bucket, Key=key, **params)
+    upload_id = upload["UploadId"]
+    parts = []
+    buf = bytearray()
+
+    def read_range(offset, size):
+        resp = client.get_object(
+            Bucket=bucket, Key=source_key, Range=f"bytes={offset}-{offset + size - 1}"
+        )
+        return resp["Body"].read()
+
+    def flush():
+        number = len(parts) + 1
+        resp = client.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=bytes(buf)
+        )
+        parts.append({"PartNumber": number, "ETag": resp["ETag"]})
+        buf.clear()
+
+    def copy(offset, size):
+        number = len(parts) + 1
+        resp = client.upload_part_copy(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            CopySource={"Bucket": bucket, "Key": source_key},
+            CopySourceRange=f"bytes={offset}-{offset + size - 1}",
+        )
+        parts.append({"PartNumber": number, "ETag": resp["CopyPartResult"]["ETag"]})
+
+    try:
+        for segment in segments:
+            if segment[0] == "data":
+                buf += segment[1].read()
+                if len(buf) >= S3_MIN_PART:
+                    flush()
+                continue
+            _, offset, size = segment
+            if buf:
+                take = min(size, S3_MIN_PART - len(buf))
+                buf += read_range(offset, take)
+                offset, size = offset + take, size - take
+                if len(buf) >= S3_MIN_PART:
+                    flush()
+            while size >= S3_MIN_PART:
+                step = min(size, S3_MAX_COPY_PART)
+                if size - step and size - step < S3_MIN_PART:
+                    step = size - S3_MIN_PART
+                copy(offset, step)
+                offset, size = offset + step, size - step
+            if size:
+                buf += read_range(offset, size)
+        if buf or not parts:
+            flush()
+        client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except Exception:
+        client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return new_name
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.template.defaultfilters import filesizeformat
+from django.utils.module_loading import import_string
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is optional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+USAGE_KINDS = {"create", "delete", "restore", "purge", "update"}
+
+
+class Subscription:
+    """Events for one open stream. Filled from any thread by the broker and
+    read either by a blocking ``get`` (WSGI) or an awaitable ``aget`` (ASGI).
+    A reader that falls ``EVENTS_QUEUE_SIZE`` events behind is marked
+    ``overflowed`` and should tell its client to resync."""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.maxsize = getattr(settings, "EVENTS_QUEUE_SIZE", 500)
+        self.overflowed = False
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = None
+        self._async_ready = None
+
+    def push(self, event):
+        with self._lock:
+            if len(self._events) >= self.maxsize:
+                self.overflowed = True
+            else:
+                self._events.append(event)
+            loop, ready = self._loop, self._async_ready
+        self._ready.set()
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                # The loop has closed; the stream is going away.
+                pass
+
+    def _pop_all(self):
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            self._ready.clear()
+        return events
+
+    def get(self, timeout):
+        self._ready.wait(timeout)
+        return self._pop_all()
+
+    async def aget(self, timeout):
+        if self._loop is None:
+            with self._lock:
+                self._loop = asyncio.get_running_loop()
+                self._async_ready = asyncio.Event()
+        if not self._ready.is_set():
+            try:
+                await asyncio.wait_for(self._async_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._async_ready.clear()
+        return self._pop_all()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """Fans events out to the streams open in this process. Events reach it
+    through the configured backend, so with a cross-node backend every
+    process sees events published by any other."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    backend_class = import_string(getattr(settings, "EVENTS_BACKEND", "core.events.LocalBackend"))
+                    self._backend = backend_class(self.deliver)
+        return self._backend
+
+    def subscribe(self, user_id) -> Subscription:
+        self.backend.start()
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def may_deliver(self, user_id) -> bool:
+        """False when no stream could receive an event for ``user_id``, so
+        callers can skip building it."""
+        if not self.backend.local:
+            return True
+        with self._lock:
+            return user_id in self._subscriptions
+
+    def deliver(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    def publish(self, user_id, event):
+        try:
+            self.backend.publish(user_id, event)
+        except Exception:
+            # Live updates are best effort; the change log is the record.
+            logger.exception("Could not publish %s event", event.get("event"))
+
+
+class LocalBackend:
+    """Delivers within this process only: enough for a single server
+    process, e.g. one ASGI worker."""
+
+    local = True
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def start(self):
+        pass
+
+    def publish(self, user_id, event):
+        self.deliver(user_id, event)
+
+
+class RedisBackend:
+    """Redis pub/sub on one channel for all users. Each process that has
+    streams open runs a listener thread and keeps only events for its own
+    subscribers. Connects to EVENTS_REDIS_URL."""
+
+    CHANNEL = "cloudstorage:events"
+    local = False
+
+    def __init__(self, deliver):
+        if redis is None:
+            raise RuntimeError("RedisBackend needs the redis package")
+        self.deliver = deliver
+        self.client = redis.Redis.from_url(settings.EVENTS_REDIS_URL)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, daemon=True, name="events-redis")
+                self._thread.start()
+
+    def publish(self, user_id, event):
+        self.client.publish(self.CHANNEL, json.dumps([user_id, event], separators=(",", ":")))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    user_id, event = json.loads(message["data"])
+                    self.deliver(user_id, event)
+            except Exception:
+                logger.exception("Event listener lost its Redis connection")
+                time.sleep(1)
+
+
+broker = Broker()
+
+
+def publish(user_id, name, data, event_id=None):
+    broker.publish(user_id, {"event": name, "id": event_id, "data": data})
+
+
+def usage(user_id) -> dict:
+    from .models import File
+
+    user_model = File._meta.get_field("owner").related_model
+    quota = user_model.objects.values_list("storage_quota", flat=True).get(pk=user_id)
+    used = File.objects.filter(owner_id=user_id, is_deleted=False).aggregate(s=Sum("size"))["s"] or 0
+    return {
+        "used": used,
+        "quota": quota,
+        "percent": 0 if quota == 0 else min(int(used * 100 / quota), 100),
+        "display": f"{filesizeformat(used)} / {filesizeformat(quota)}",
+    }
+
+
+def publish_change(change):
+    """Push a ChangeEvent (and the owner's new usage when it can have
+    changed) to their streams once the transaction commits."""
+
+    def send():
+        publish(change.user_id, "change", change.as_dict(), event_id=change.seq)
+        if change.kind in USAGE_KINDS and broker.may_deliver(change.user_id):
+            publish(change.user_id, "usage", usage(change.user_id))
+
+    transaction.on_commit(send)
+
+
+class UploadProgress:
+    """Publishes "upload" events for one request body, at most every
+    EVENTS_PROGRESS_INTERVAL seconds while data arrives."""
+
+    def __init__(self, user_id, upload_id, total):
+        self.user_id = user_id
+        self.upload_id = upload_id
+        self.total = total
+        self.interval = getattr(settings, "EVENTS_PROGRESS_INTERVAL", 0.5)
+        self._last = None
+
+    def __call__(self, name, received, state="running"):
+        now = time.monotonic()
+        if state == "running" and self._last is not None and now - self._last < self.interval:
+            return
+        self._last = now
+        publish(self.user_id, "upload", {
+            "id": self.upload_id,
+            "name": name,
+            "received": received,
+            "total": self.total,
+            "state": state,
+        })
+
+
+def format_sse(event) -> str:
+    lines = []
+    if event.get("id") is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['event']}")
+    lines.append("data: " + json.dumps(event["data"], ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+def _live_frames(events, last_id):
+    # Change events carry the per-user sequence number; those at or below
+    # what the client already has (e.g. from the backlog) are duplicates.
+    frames = []
+    for event in events:
+        if event.get("id") is not None:
+            if event["id"] <= last_id:
+                continue
+            last_id = event["id"]
+        frames.append(format_sse(event))
+    return frames, last_id
+
+
+def _backlog_frames(backlog, has_more, last_id):
+    frames = ["retry: 3000\n\n"]
+    if has_more:
+        frames.append(format_sse({"event": "resync", "data": {}}))
+    for change in backlog:
+        frames.append(format_sse({"event": "change", "id": change.seq, "data": change.as_dict()}))
+        last_id = change.seq
+    return frames, last_id
+
+
+def stream(subscription, backlog, has_more, last_id):
+    """Server-Sent Events body for a WSGI server (one thread per stream)."""
+    heartbeat = getattr(settings, "EVENTS_HEARTBEAT", 15)
+    deadline = time.monotonic() + getattr(settings, "EVENTS_STREAM_TIMEOUT", 600)
+    try:
+        frames, last_id = _backlog_frames(backlog, has_more, last_id)
+        yield from frames
+        while time.monotonic() < deadline:
+            events = subscription.get(heartbeat)
+            if subscription.overflowed:
+                yield format_sse({"event": "resync", "data": {}})
+                return
+            if not events:
+                yield ": ping\n\n"
+                continue
+            frames, last_id = _live_frames(events, last_id)
+            yield from frames
+    finally:
+        subscription.close()
+
+
+async def astream(subscription, backlog, has_more, last_id):
+    """Server-Sent Events body for an ASGI server."""
+    heartbeat = getattr(settings, "EVENTS_HEARTBEAT", 15)
+    deadline = time.monotonic() + getattr(settings, "EVENTS_STREAM_TIMEOUT", 600)
+    try:
+        frames, last_id = _backlog_frames(backlog, has_more, last_id)
+        for frame in frames:
+            yield frame
+        while time.monotonic() < deadline:
+            events = await subscription.aget(heartbeat)
+            if subscription.overflowed:
+                yield format_sse({"event": "resync", "data": {}})
+                return
+            if not events:
+                yield ": ping\n\n"
+                continue
+            frames, last_id = _live_frames(events, last_id)
+            for frame in frames:
+                yield frame
+    finally:
+        subscription.close()
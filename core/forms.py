@@ -99,6 +99,20 @@ class PromoCodeGenerateForm(forms.Form):
         return None
 
 
+class FolderForm(forms.Form):
+    name = forms.CharField(label="Название", max_length=255, strip=True)
+
+
+class FileNameForm(forms.Form):
+    name = forms.CharField(label="Имя файла", max_length=255, strip=True)
+
+    def clean_name(self):
+        name = self.cleaned_data["name"]
+        if "/" in name or "\\" in name or name in (".", ".."):
+            raise forms.ValidationError("Недопустимое имя файла")
+        return name
+
+
 class UploadForm(forms.ModelForm):
     class Meta:
         model = File
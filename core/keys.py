@@ -0,0 +1,62 @@
+import functools
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_EXT_RE = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+
+def _extension(filename: str) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if _EXT_RE.match(ext) else ""
+
+
+class LegacyLayout:
+    """``u/<owner_id>/<filename>`` and ``drop/<token>/<filename>``."""
+
+    def file_key(self, instance, filename):
+        return f"u/{instance.owner_id}/{filename}"
+
+    def drop_key(self, instance, filename):
+        return f"drop/{instance.token}/{filename}"
+
+    def is_current(self, name):
+        return name.startswith(("u/", "drop/"))
+
+
+class HashedLayout:
+    """Random, evenly spread keys: ``f/ab/cd/<uuid>.<ext>``.
+
+    The two hex levels spread writes over 65k prefixes, a fresh UUID per
+    upload never collides (so storages can skip existence checks) and the
+    user's filename stays in the database only.
+    """
+
+    file_prefix = "f"
+    drop_prefix = "d"
+    _current = re.compile(r"^[fd]/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}(\.[a-z0-9]{1,10})?$")
+
+    def _key(self, prefix, filename):
+        token = uuid.uuid4().hex
+        return f"{prefix}/{token[:2]}/{token[2:4]}/{token}{_extension(filename)}"
+
+    def file_key(self, instance, filename):
+        return self._key(self.file_prefix, filename)
+
+    def drop_key(self, instance, filename):
+        return self._key(self.drop_prefix, filename)
+
+    def is_current(self, name):
+        return bool(self._current.match(name or ""))
+
+
+@functools.cache
+def _layout(path):
+    return import_string(path)()
+
+
+def get_layout():
+    return _layout(getattr(settings, "STORAGE_KEY_LAYOUT", "core.keys.HashedLayout"))
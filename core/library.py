@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .signing import token_window, token_ttl
+
+
+def _key(user_id) -> str:
+    return f"library:{user_id}"
+
+
+def library_version(user_id) -> int:
+    """Per-user number that changes whenever the user's files or folders do;
+    cached fragments of their pages are keyed by it."""
+    key = _key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1, so a version evicted from the
+        # cache never comes back while fragments made under it still exist.
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_library_version(user_id):
+    # After commit: a page rendered between the bump and the commit would
+    # otherwise cache the old rows under the new version.
+    def bump():
+        try:
+            cache.incr(_key(user_id))
+        except ValueError:
+            cache.add(_key(user_id), time.time_ns(), None)
+
+    transaction.on_commit(bump)
+
+
+def fragment_context(user_id) -> dict:
+    """Template context for ``{% cache %}`` around a user's file tiles. The
+    signed-URL window is part of the key and the timeout ends with it, so
+    cached tiles never carry links closer than one TTL to expiring."""
+    return {
+        "library_version": library_version(user_id),
+        "url_window": token_window(),
+        # A timeout of 0 makes {% cache %} store nothing.
+        "fragment_ttl": token_ttl() if getattr(settings, "FRAGMENT_CACHE", False) else 0,
+    }
@@ -0,0 +1,157 @@
+import json
+import mimetypes
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.compression import get_codec, is_compressible
+
+WORDS = (
+    "storage file folder upload download quota user share link trash restore "
+    "archive report invoice backup photo video document project draft final"
+).split()
+
+
+def _sample_csv(rng, size):
+    rows = ["id,created_at,user,amount,status"]
+    length = len(rows[0])
+    while length < size:
+        row = (
+            f"{len(rows)},2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d},"
+            f"user{rng.randint(1, 5000)},{rng.randint(1, 99999) / 100},"
+            f"{rng.choice(['paid', 'pending', 'refunded'])}"
+        )
+        rows.append(row)
+        length += len(row) + 1
+    return "\n".join(rows).encode()[:size]
+
+
+def _sample_json(rng, size):
+    items, length = [], 0
+    while length < size:
+        item = json.dumps({
+            "id": rng.randint(1, 10 ** 9),
+            "name": " ".join(rng.choices(WORDS, k=3)),
+            "size": rng.randint(0, 10 ** 8),
+            "tags": rng.sample(WORDS, 3),
+            "shared": rng.random() < 0.2,
+        })
+        items.append(item)
+        length += len(item) + 2
+    return ("[" + ",\n".join(items) + "]").encode()[:size]
+
+
+def _sample_log(rng, size):
+    lines, length = [], 0
+    while length < size:
+        line = (
+            f"2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z "
+            f"{rng.choice(['INFO', 'INFO', 'INFO', 'WARN', 'ERROR'])} "
+            f"[worker-{rng.randint(1, 16)}] GET /f/{rng.randint(1, 99999)} "
+            f"{rng.choice([200, 200, 206, 304, 404])} {rng.randint(1, 900)}ms"
+        )
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines).encode()[:size]
+
+
+def _sample_text(rng, size):
+    words, length = [], 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words).encode()[:size]
+
+
+SAMPLES = {
+    "text/csv": _sample_csv,
+    "application/json": _sample_json,
+    "text/x-log": _sample_log,
+    "text/plain": _sample_text,
+    "application/octet-stream": lambda rng, size: rng.randbytes(size),
+}
+
+
+def _codec_list(value):
+    codecs = []
+    for item in value.split(","):
+        name, _, level = item.partition(":")
+        try:
+            codec = get_codec(name.strip(), int(level) if level else None)
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        if codec is None:
+            raise CommandError(f"Unknown codec {name!r}")
+        codecs.append(codec)
+    return codecs
+
+
+class Command(BaseCommand):
+    help = (
+        "Report compression ratio and CPU cost per content type and codec, on "
+        "generated samples or on the files given as arguments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="Files to measure instead of samples.")
+        parser.add_argument("--size-mb", type=int, default=8, help="Size of each generated sample.")
+        parser.add_argument("--codecs", default="zstd:1,zstd:3,zstd:9,gzip:1,gzip:6")
+        parser.add_argument("--block-kb", type=int, default=64, help="Write size, as in uploads.")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        codecs = _codec_list(options["codecs"])
+        block = options["block_kb"] * 1024
+        if options["paths"]:
+            samples = []
+            for path in options["paths"]:
+                with open(path, "rb") as fh:
+                    samples.append((os.path.basename(path), mimetypes.guess_type(path)[0] or "", fh.read()))
+        else:
+            rng = random.Random(options["seed"])
+            size = options["size_mb"] * 1024 * 1024
+            samples = [(ctype, ctype, make(rng, size)) for ctype, make in SAMPLES.items()]
+
+        self.stdout.write(
+            f"{'sample':<26} {'codec':<8} {'ratio':>6} {'saved':>6} "
+            f"{'comp MB/s':>10} {'decomp MB/s':>12} {'auto':>5}"
+        )
+        for label, ctype, data in samples:
+            mb = len(data) / 1e6
+            auto = "yes" if is_compressible(ctype, label) else "no"
+            for codec in codecs:
+                compressed, comp_cpu = self._compress(codec, data, block)
+                decomp_cpu = self._decompress(codec, compressed, block, data)
+                ratio = len(data) / max(len(compressed), 1)
+                saved = 1 - len(compressed) / max(len(data), 1)
+                self.stdout.write(
+                    f"{label[:26]:<26} {codec.name + ':' + str(codec.level):<8} {ratio:>6.2f} "
+                    f"{saved:>6.0%} {mb / comp_cpu:>10.1f} {mb / decomp_cpu:>12.1f} {auto:>5}"
+                )
+        self.stdout.write("MB/s are per CPU second (process time) of one core.")
+
+    @staticmethod
+    def _compress(codec, data, block):
+        compressor = codec.compressor()
+        out = []
+        started = time.process_time()
+        for start in range(0, len(data), block):
+            out.append(compressor.compress(data[start:start + block]))
+        out.append(compressor.flush())
+        return b"".join(out), max(time.process_time() - started, 1e-9)
+
+    @staticmethod
+    def _decompress(codec, compressed, block, original):
+        decompressor = codec.decompressor()
+        out = []
+        started = time.process_time()
+        for start in range(0, len(compressed), block):
+            out.append(decompressor.decompress(compressed[start:start + block]))
+        out.append(decompressor.flush())
+        elapsed = max(time.process_time() - started, 1e-9)
+        if b"".join(out) != original:
+            raise CommandError(f"{codec.name} round trip mismatch")
+        return elapsed
@@ -0,0 +1,237 @@
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import override_settings
+from django.utils.crypto import get_random_string
+
+from core.models import File
+
+PROFILES = {"plain": "0", "tuned": "1"}
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+class _Client:
+    """Calls the WSGI handler directly, like a server worker would: request
+    signals fire, so connections are opened and closed per CONN_MAX_AGE."""
+
+    def __init__(self, handler, session_key, csrf_token):
+        self.handler = handler
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={session_key}; {settings.CSRF_COOKIE_NAME}={csrf_token}"
+        self.csrf_token = csrf_token
+
+    def request(self, method, path, body=b"", content_type=""):
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": "localhost",
+            "HTTP_COOKIE": self.cookie,
+            "HTTP_X_CSRFTOKEN": self.csrf_token,
+            "CONTENT_TYPE": content_type,
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        status = []
+        result = self.handler(environ, lambda s, headers, exc_info=None: status.append(int(s[:3])))
+        try:
+            for _ in result:
+                pass
+        finally:
+            result.close()
+        return status[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent read/write throughput of the files and upload views "
+        "with the database tuning off (plain) and on (tuned). Each profile runs "
+        "in fresh worker processes against its own SQLite file, or against the "
+        "configured Postgres database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", default="plain,tuned")
+        parser.add_argument("--processes", type=int, default=4, help="Like server worker processes.")
+        parser.add_argument("--threads", type=int, default=4, help="Threads per process.")
+        parser.add_argument("--seconds", type=float, default=10)
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="Share of requests that upload.")
+        parser.add_argument("--upload-kb", type=int, default=4)
+        parser.add_argument("--files", type=int, default=200, help="Rows seeded per worker user.")
+        parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+        parser.add_argument("--start-at", type=float, default=0, help=argparse.SUPPRESS)
+        parser.add_argument("--media-root", default="", help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["worker"]:
+            return self._worker(options)
+        profiles = [p.strip() for p in options["profiles"].split(",") if p.strip()]
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+
+        self.stdout.write(
+            f"{'profile':<8} {'req/s':>8} {'reads/s':>8} {'writes/s':>9} {'errors':>7} "
+            f"{'read p50':>9} {'read p95':>9} {'write p50':>10} {'write p95':>10}"
+        )
+        for profile in profiles:
+            results = self._run_profile(profile, options)
+            reads = [ms for r in results for ms in r["read"]]
+            writes = [ms for r in results for ms in r["write"]]
+            errors = sum(r["errors"] for r in results)
+            seconds = options["seconds"]
+            self.stdout.write(
+                f"{profile:<8} {(len(reads) + len(writes)) / seconds:>8.1f} "
+                f"{len(reads) / seconds:>8.1f} {len(writes) / seconds:>9.1f} {errors:>7} "
+                f"{_percentile(reads, 0.5):>7.1f}ms {_percentile(reads, 0.95):>7.1f}ms "
+                f"{_percentile(writes, 0.5):>8.1f}ms {_percentile(writes, 0.95):>8.1f}ms"
+            )
+        self.stdout.write("Errors are 5xx responses, mostly \"database is locked\" on SQLite.")
+
+    def _run_profile(self, profile, options):
+        workdir = tempfile.mkdtemp(prefix=f"bench-db-{profile}-")
+        env = {**os.environ, "DB_TUNING": PROFILES[profile]}
+        if connection.vendor == "sqlite":
+            env["SQLITE_PATH"] = os.path.join(workdir, "bench.sqlite3")
+        manage = os.path.join(settings.BASE_DIR, "manage.py")
+        try:
+            subprocess.run(
+                [sys.executable, manage, "migrate", "--noinput", "--skip-checks", "-v", "0"], env=env, check=True
+            )
+            # Workers seed their own rows first; the shared start time keeps
+            # the measured windows overlapping.
+            start_at = time.time() + 3 + options["processes"] * 0.5
+            args = [
+                sys.executable, manage, "bench_db", "--worker", "--skip-checks",
+                "--start-at", str(start_at),
+                "--media-root", os.path.join(workdir, "media"),
+            ]
+            for name in ("threads", "seconds", "write_ratio", "upload_kb", "files"):
+                args += [f"--{name.replace('_', '-')}", str(options[name])]
+            workers = [
+                subprocess.Popen(args, env=env, stdout=subprocess.PIPE, text=True)
+                for _ in range(options["processes"])
+            ]
+            results = []
+            for worker in workers:
+                out, _ = worker.communicate()
+                if worker.returncode != 0:
+                    raise CommandError(f"{profile} worker exited with {worker.returncode}")
+                results.append(json.loads(out.strip().splitlines()[-1]))
+            return results
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _worker(self, options):
+        # 5xx responses are counted, not logged.
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+        storages = {
+            **settings.STORAGES,
+            "default": {
+                "BACKEND": "django.core.files.storage.FileSystemStorage",
+                "OPTIONS": {"location": options["media_root"]},
+            },
+        }
+        with override_settings(DEBUG=False, STORAGES=storages, MEDIA_ROOT=options["media_root"]):
+            client, user = self._setup(options)
+            try:
+                result = self._load(client, options)
+            finally:
+                user.delete()
+                connections.close_all()
+        self.stdout.write(json.dumps(result))
+
+    @staticmethod
+    def _setup(options):
+        from django.contrib.sessions.backends.db import SessionStore
+
+        user = get_user_model().objects.create_user(
+            email=f"bench-{uuid.uuid4().hex[:12]}@example.com", is_subscribed=True
+        )
+        File.objects.bulk_create(
+            File(owner=user, file=f"bench/{user.pk}/{i}.txt", name=f"{i}.txt", size=1024)
+            for i in range(options["files"])
+        )
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        connections.close_all()
+        return _Client(WSGIHandler(), session.session_key, get_random_string(32)), user
+
+    @staticmethod
+    def _load(client, options):
+        payload = os.urandom(options["upload_kb"] * 1024)
+        reads, writes, errors = [], [], [0]
+        lock = threading.Lock()
+        time.sleep(max(options["start_at"] - time.time(), 0))
+        deadline = time.time() + options["seconds"]
+
+        def run(seed):
+            rng = random.Random(seed)
+            local_reads, local_writes, local_errors = [], [], 0
+            while time.time() < deadline:
+                write = rng.random() < options["write_ratio"]
+                if write:
+                    body = encode_multipart(BOUNDARY, {
+                        "file": SimpleUploadedFile(f"{rng.getrandbits(32):08x}.bin", payload),
+                    })
+                    started = time.perf_counter()
+                    status = client.request("POST", "/upload", body, MULTIPART_CONTENT)
+                else:
+                    started = time.perf_counter()
+                    status = client.request("GET", "/files")
+                elapsed = (time.perf_counter() - started) * 1000
+                if status >= 500:
+                    local_errors += 1
+                else:
+                    (local_writes if write else local_reads).append(elapsed)
+            connections.close_all()
+            with lock:
+                reads.extend(local_reads)
+                writes.extend(local_writes)
+                errors[0] += local_errors
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(options["threads"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            "read": reads,
+            "write": writes,
+            "errors": errors[0],
+        }
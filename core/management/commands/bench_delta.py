@@ -0,0 +1,92 @@
+import io
+import random
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+
+from core import delta
+
+
+class Command(BaseCommand):
+    help = "Measure bytes and time saved by delta uploads at different change ratios."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=int, default=32)
+        parser.add_argument("--ratios", default="0.001,0.01,0.05,0.1,0.25,0.5")
+        parser.add_argument("--edit-kb", type=int, default=16, help="Size of a single edit.")
+        parser.add_argument("--bandwidth-mbit", type=float, default=100.0)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        size = options["size_mb"] * 1024 * 1024
+        edit = options["edit_kb"] * 1024
+        bytes_per_sec = options["bandwidth_mbit"] * 1_000_000 / 8
+        base = rng.randbytes(size)
+
+        with tempfile.TemporaryDirectory() as root:
+            storage = FileSystemStorage(location=root)
+            base_name = storage.save("base.bin", ContentFile(base))
+            started = time.perf_counter()
+            known = {
+                s["digest"]: (s["offset"], s["size"])
+                for s in delta.compute_signatures(io.BytesIO(base))
+            }
+            index_time = time.perf_counter() - started
+            self.stdout.write(
+                f"base {options['size_mb']} MiB, {len(known)} chunks, "
+                f"server-side index {index_time:.2f}s (once per version)"
+            )
+            self.stdout.write(
+                f"{'changed':>8} {'sent MiB':>9} {'saved':>7} {'chunk MB/s':>10} "
+                f"{'assemble s':>10} {'full s':>7} {'delta s':>8}"
+            )
+            for ratio in (float(r) for r in options["ratios"].split(",")):
+                modified = self._mutate(rng, base, ratio, edit)
+
+                started = time.perf_counter()
+                manifest = delta.compute_signatures(io.BytesIO(modified))
+                chunk_time = time.perf_counter() - started
+
+                blobs = {}
+                for item in manifest:
+                    if item["digest"] not in known:
+                        start = item["offset"]
+                        blobs[item["digest"]] = io.BytesIO(modified[start:start + item["size"]])
+                sent = sum(len(b.getvalue()) for b in blobs.values())
+
+                started = time.perf_counter()
+                segments = delta.build_plan(manifest, known, blobs)
+                new_name = delta.assemble(storage, base_name, "new.bin", segments)
+                assemble_time = time.perf_counter() - started
+                with storage.open(new_name, "rb") as fh:
+                    if fh.read() != modified:
+                        raise RuntimeError("assembled object does not match")
+                storage.delete(new_name)
+
+                # Transfer times at the given bandwidth; client-side chunking
+                # speed is reported separately since real clients chunk natively.
+                full_time = len(modified) / bytes_per_sec
+                delta_time = sent / bytes_per_sec + assemble_time
+                self.stdout.write(
+                    f"{ratio:>8.1%} {sent / 2**20:>9.2f} {1 - sent / len(modified):>7.1%} "
+                    f"{len(modified) / 1e6 / chunk_time:>10.1f} {assemble_time:>10.2f} "
+                    f"{full_time:>7.2f} {delta_time:>8.2f}"
+                )
+
+    @staticmethod
+    def _mutate(rng, data, ratio, edit):
+        out = bytearray(data)
+        edits = max(1, int(len(data) * ratio / edit))
+        for i in range(edits):
+            pos = rng.randrange(0, len(out) - edit)
+            if i % 4 == 0:
+                # Inserts shift everything after them; fixed-size blocks
+                # would lose every later match here.
+                out[pos:pos] = rng.randbytes(edit)
+            else:
+                out[pos:pos + edit] = rng.randbytes(edit)
+        return bytes(out)
@@ -0,0 +1,99 @@
+import io
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.storage import build_client_config, build_transfer_config
+
+
+class _NullSink(io.RawIOBase):
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return len(data)
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure S3 put/get throughput for different pool, multipart and "
+        "concurrency settings, e.g. against a local MinIO or moto server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint-url", default=settings.AWS_S3_ENDPOINT_URL)
+        parser.add_argument("--bucket", default=settings.AWS_STORAGE_BUCKET_NAME)
+        parser.add_argument("--create-bucket", action="store_true")
+        parser.add_argument("--size-mb", type=int, default=64)
+        parser.add_argument("--objects", type=int, default=4, help="Objects moved in parallel.")
+        parser.add_argument("--pool", default="10,50", help="max_pool_connections values.")
+        parser.add_argument("--concurrency", default="1,8", help="max_concurrency values.")
+        parser.add_argument("--chunk-mb", default="8,16", help="multipart_chunksize values.")
+
+    def handle(self, *args, **options):
+        import boto3
+
+        if not options["bucket"]:
+            raise CommandError("Pass --bucket or set AWS_STORAGE_BUCKET_NAME.")
+        session = boto3.session.Session(
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=None if settings.AWS_S3_REGION_NAME == "auto" else settings.AWS_S3_REGION_NAME,
+        )
+        bucket = options["bucket"]
+        size = options["size_mb"] * 1024 * 1024
+        payload = os.urandom(size)
+        prefix = f"bench/{uuid.uuid4().hex}"
+
+        self.stdout.write(
+            f"{'pool':>5} {'conc':>5} {'chunk':>6} {'put MB/s':>9} {'get MB/s':>9}"
+        )
+        for pool in _int_list(options["pool"]):
+            client = session.client(
+                "s3",
+                endpoint_url=options["endpoint_url"],
+                config=build_client_config(max_pool_connections=pool),
+            )
+            if options["create_bucket"]:
+                try:
+                    client.create_bucket(Bucket=bucket)
+                except client.exceptions.BucketAlreadyOwnedByYou:
+                    pass
+                options["create_bucket"] = False
+            for concurrency in _int_list(options["concurrency"]):
+                for chunk_mb in _int_list(options["chunk_mb"]):
+                    transfer = build_transfer_config(
+                        max_concurrency=concurrency,
+                        multipart_chunksize=chunk_mb * 1024 * 1024,
+                        multipart_threshold=chunk_mb * 1024 * 1024,
+                    )
+                    keys = [f"{prefix}/{pool}-{concurrency}-{chunk_mb}-{i}" for i in range(options["objects"])]
+                    put = self._timed(options["objects"], lambda key: client.upload_fileobj(
+                        io.BytesIO(payload), bucket, key, Config=transfer
+                    ), keys)
+                    get = self._timed(options["objects"], lambda key: client.download_fileobj(
+                        bucket, key, _NullSink(), Config=transfer
+                    ), keys)
+                    client.delete_objects(
+                        Bucket=bucket, Delete={"Objects": [{"Key": k} for k in keys]}
+                    )
+                    total_mb = size * len(keys) / 1e6
+                    self.stdout.write(
+                        f"{pool:>5} {concurrency:>5} {chunk_mb:>5}M "
+                        f"{total_mb / put:>9.1f} {total_mb / get:>9.1f}"
+                    )
+
+    @staticmethod
+    def _timed(workers, func, keys):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(func, keys))
+        return time.perf_counter() - started
@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from core.media import MediaError, MissingDependency, extract
+from core.models import File, MediaInfo
+
+
+class Command(BaseCommand):
+    help = (
+        "Read capture time, dimensions, duration and orientation of queued "
+        "images and videos (ranged header reads, ffprobe for video) into "
+        "MediaInfo, which the gallery is served from."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+        parser.add_argument("--poll", type=float, default=10.0)
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument(
+            "--enqueue-missing", action="store_true",
+            help="Queue every image and video without a MediaInfo row, then continue.",
+        )
+
+    def handle(self, *args, **options):
+        if options["enqueue_missing"]:
+            self._enqueue_missing(options["batch_size"])
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                batch = list(
+                    MediaInfo.objects.filter(extracted=False)
+                    .select_related("file")
+                    .order_by("file_id")[: options["batch_size"]]
+                )
+                if not batch:
+                    if options["once"]:
+                        return
+                    time.sleep(options["poll"])
+                    continue
+                errors = list(pool.map(self._extract, batch))
+                MediaInfo.objects.bulk_update(
+                    batch,
+                    ["taken_at", "width", "height", "duration", "orientation", "extracted"],
+                )
+                failed = sum(1 for exc in errors if exc is not None)
+                self.stdout.write(f"extracted {len(batch) - failed}, failed {failed}")
+                missing = next((exc for exc in errors if isinstance(exc, MissingDependency)), None)
+                if missing:
+                    # Those rows stay queued; polling would only hit them again.
+                    raise CommandError(f"{missing}; install it and run again")
+
+    def _extract(self, media):
+        try:
+            extract(media)
+        except MissingDependency as exc:
+            return exc
+        except MediaError as exc:
+            # Failures still mark the row done; it stays in the gallery under
+            # its upload time instead of being retried forever.
+            media.extracted = True
+            self.stderr.write(f"file {media.file_id}: {exc}")
+            return exc
+        media.extracted = True
+        return None
+
+    def _enqueue_missing(self, batch_size):
+        files = File.objects.filter(
+            Q(content_type__startswith="image/") | Q(content_type__startswith="video/"),
+            media__isnull=True,
+        )
+        total = 0
+        last = 0
+        while True:
+            rows = list(
+                files.filter(pk__gt=last)
+                .order_by("pk")
+                .values_list("pk", "owner_id", "uploaded_at")[:batch_size]
+            )
+            if not rows:
+                break
+            MediaInfo.objects.bulk_create(
+                [MediaInfo(file_id=pk, owner_id=owner, taken_at=uploaded) for pk, owner, uploaded in rows],
+                ignore_conflicts=True,
+            )
+            total += len(rows)
+            last = rows[-1][0]
+        self.stdout.write(f"queued {total} files")
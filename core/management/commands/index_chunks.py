@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import delta
+from core.models import File
+
+
+class Command(BaseCommand):
+    help = (
+        "Chunk stored files that have no FileChunk rows yet, so delta uploads "
+        "can reuse their content. Walks files by primary key and then keeps "
+        "polling for new uploads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit after one pass.")
+        parser.add_argument("--poll", type=float, default=30.0)
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        # Compressed files only take full uploads, so they are never chunked.
+        queue = File.objects.filter(codec="", size__gt=0, chunks__isnull=True).exclude(file="")
+        last = 0
+        while True:
+            batch = list(queue.filter(pk__gt=last).order_by("pk").only("pk", "file")[: options["batch_size"]])
+            if not batch:
+                if options["once"]:
+                    return
+                time.sleep(options["poll"])
+                continue
+            indexed = failed = 0
+            for obj in batch:
+                try:
+                    indexed += delta.index_file(obj)
+                except Exception as exc:
+                    # Skipped until the next start; delta uploads of it send
+                    # every chunk meanwhile.
+                    self.stderr.write(f"file {obj.pk}: {exc}")
+                    failed += 1
+            last = batch[-1].pk
+            self.stdout.write(f"indexed {indexed}, failed {failed}")
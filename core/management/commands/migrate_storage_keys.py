@@ -0,0 +1,156 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from core.keys import get_layout
+from core.library import bump_library_version
+from core.models import DropFile, File
+from core.signing import token_ttl
+from core.storage import copy_object
+
+MODELS = {model._meta.label: model for model in (File, DropFile)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy stored objects to keys of the configured STORAGE_KEY_LAYOUT and "
+        "update the rows in batches. Old keys are written to --old-keys; run "
+        "again with --delete-old once signed links to them have expired. "
+        "Safe to interrupt: already migrated rows are skipped on the next run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=["file", "drop", "all"], default="all")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--start-after", type=int, default=0, help="Resume after this pk.")
+        parser.add_argument("--keep-old", action="store_true", help="Do not record old keys for deletion.")
+        parser.add_argument(
+            "--old-keys", default="old-storage-keys.tsv",
+            help="File listing replaced keys and when they were replaced.",
+        )
+        parser.add_argument(
+            "--delete-old", action="store_true",
+            help="Only delete recorded old keys that no signed link can reach any more.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["delete_old"]:
+            self._delete_old(options)
+            return
+        layout = get_layout()
+        targets = []
+        if options["model"] in ("file", "all"):
+            targets.append((File, layout.file_key))
+        if options["model"] in ("drop", "all"):
+            targets.append((DropFile, layout.drop_key))
+        for model, make_key in targets:
+            self._migrate(model, make_key, layout, options)
+
+    def _migrate(self, model, make_key, layout, options):
+        storage = model._meta.get_field("file").storage
+        label = model._meta.label
+        cursor = options["start_after"]
+        moved = failed = 0
+        fields = ["pk", "file", "name", "size"]
+        if any(f.name == "stored_size" for f in model._meta.fields):
+            fields.append("stored_size")
+        if model is DropFile:
+            fields.append("token")
+        else:
+            fields.append("owner")
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                batch = list(
+                    model.objects.filter(pk__gt=cursor)
+                    .order_by("pk")
+                    .only(*fields)[: options["batch_size"]]
+                )
+                if not batch:
+                    break
+                cursor = batch[-1].pk
+                pending = [
+                    obj for obj in batch
+                    if obj.file.name and not layout.is_current(obj.file.name)
+                ]
+                if options["dry_run"]:
+                    moved += len(pending)
+                    continue
+                results = list(pool.map(
+                    lambda obj: self._copy(storage, obj, make_key(obj, obj.name)), pending
+                ))
+                done, changed = [], []
+                for obj, old, new in results:
+                    if not new:
+                        failed += 1
+                    elif self._switch(model, obj, old, new):
+                        done.append((obj, old, new))
+                    else:
+                        changed.append(new)
+                # A row that got a new key during the copy (delta commit,
+                # another run) keeps it; the copy made here is dropped.
+                list(pool.map(storage.delete, changed))
+                if done and not options["keep_old"]:
+                    # Download tokens, presigned URLs and cached grids made
+                    # before the switch still name the old keys.
+                    now = int(time.time())
+                    with open(options["old_keys"], "a") as log:
+                        log.writelines(f"{label}\t{old}\t{now}\n" for _, old, _ in done)
+                moved += len(done)
+                self.stdout.write(f"{label}: {moved} moved, {failed} failed, cursor {cursor}")
+        verb = "would move" if options["dry_run"] else "moved"
+        self.stdout.write(self.style.SUCCESS(f"{label}: {verb} {moved}, failed {failed}"))
+
+    @staticmethod
+    def _switch(model, obj, old, new):
+        if not model.objects.filter(pk=obj.pk, file=old).update(file=new):
+            return False
+        obj.file.name = new
+        if model is DropFile:
+            cache.delete(DropFile.cache_key(obj.token))
+        else:
+            bump_library_version(obj.owner_id)
+        return True
+
+    def _copy(self, storage, obj, target):
+        old = obj.file.name
+        try:
+            new = copy_object(storage, old, target)
+            expected = getattr(obj, "stored_size", 0) or obj.size or storage.size(old)
+            if storage.size(new) != expected:
+                storage.delete(new)
+                raise ValueError(f"size mismatch for {new}")
+        except Exception as exc:
+            self.stderr.write(f"{obj.pk}: {old}: {exc}")
+            return obj, old, None
+        return obj, old, new
+
+    def _delete_old(self, options):
+        path = options["old_keys"]
+        if not os.path.exists(path):
+            self.stdout.write("no old keys recorded")
+            return
+        # A token issued just before the switch is valid for up to two TTL
+        # windows; cached fragments and presigned URLs expire with it.
+        cutoff = time.time() - 2 * token_ttl()
+        with open(path) as log:
+            entries = [line.rstrip("\n").split("\t") for line in log if line.strip()]
+        pending, deleted = [], 0
+        for label, key, switched in entries:
+            if int(switched) > cutoff:
+                pending.append((label, key, switched))
+                continue
+            model = MODELS[label]
+            # Never delete a key a row points at again.
+            if not options["dry_run"] and not model.objects.filter(file=key).exists():
+                model._meta.get_field("file").storage.delete(key)
+            deleted += 1
+        if not options["dry_run"]:
+            with open(path, "w") as log:
+                log.writelines(f"{label}\t{key}\t{switched}\n" for label, key, switched in pending)
+        verb = "would delete" if options["dry_run"] else "deleted"
+        self.stdout.write(self.style.SUCCESS(f"old keys: {verb} {deleted}, {len(pending)} not expired yet"))
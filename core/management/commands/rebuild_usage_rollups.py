@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute usage rollups from File, one user per transaction, so only "
+        "that user's changes wait for it. Run once after deploying rollups and "
+        "whenever they are suspected to have drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users", help="Only this user id.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="User ids read per query.")
+
+    def handle(self, *args, **options):
+        users = rows = 0
+        for user_id in self._user_ids(options["users"], options["batch_size"]):
+            rows += rollups.rebuild(user_id)
+            users += 1
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"user {user_id} done")
+        self.stdout.write(f"users: {users}, rollup rows: {rows}")
+
+    @staticmethod
+    def _user_ids(only, batch_size):
+        qs = get_user_model().objects.order_by("pk").values_list("pk", flat=True)
+        if only:
+            qs = qs.filter(pk__in=only)
+        last = None
+        while True:
+            page = list((qs if last is None else qs.filter(pk__gt=last))[:batch_size])
+            yield from page
+            if len(page) < batch_size:
+                return
+            last = page[-1]
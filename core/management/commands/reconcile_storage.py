@@ -0,0 +1,177 @@
+import heapq
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce, Collate, NullIf
+
+from core.models import DropFile, File, Transcode
+from core.storage import delete_objects, iter_stored_keys
+
+# Byte-order collations, so the database sorts keys exactly like S3 listings
+# and Python string comparison do.
+BINARY_COLLATIONS = {
+    "postgresql": "C",
+    "sqlite": "BINARY",
+    "mysql": "utf8mb4_bin",
+}
+
+
+def iter_row_keys(model, prefix="", batch_size=5000):
+    """Yield ``(key, size, pk, model)`` ordered by key using keyset pagination,
+    so memory stays flat however many rows there are."""
+    collation = BINARY_COLLATIONS.get(connection.vendor)
+    key = Collate("file", collation) if collation else "file"
+    size = F("size")
+    if any(f.name == "stored_size" for f in model._meta.fields):
+        # Compressed files take stored_size bytes in the bucket, not size.
+        size = Coalesce(NullIf("stored_size", 0), "size")
+    qs = model.objects.annotate(key=key, stored=size).exclude(file="")
+    if prefix:
+        qs = qs.filter(file__startswith=prefix)
+    page = qs
+    while True:
+        rows = list(page.order_by("key", "pk").values_list("key", "stored", "pk")[:batch_size])
+        for name, size, pk in rows:
+            yield name, size or 0, pk, model
+        if len(rows) < batch_size:
+            return
+        last_key, _, last_pk = rows[-1]
+        page = qs.filter(Q(key__gt=last_key) | Q(key=last_key, pk__gt=last_pk))
+
+
+def iter_output_prefixes(batch_size=5000):
+    """Sorted storage prefixes of derived objects (HLS renditions)."""
+    collation = BINARY_COLLATIONS.get(connection.vendor)
+    key = Collate("prefix", collation) if collation else "prefix"
+    qs = Transcode.objects.exclude(prefix="").annotate(key=key)
+    page = qs
+    while True:
+        rows = list(page.order_by("key", "pk").values_list("key", "pk")[:batch_size])
+        for prefix, _ in rows:
+            yield prefix
+        if len(rows) < batch_size:
+            return
+        last_key, last_pk = rows[-1]
+        page = qs.filter(Q(key__gt=last_key) | Q(key=last_key, pk__gt=last_pk))
+
+
+class Command(BaseCommand):
+    help = (
+        "Find objects in storage without a File/DropFile row (orphans) and rows "
+        "whose object is missing (dangling) by merging both sorted key streams."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--prefix", default="", help="Only scan keys starting with this.")
+        parser.add_argument(
+            "--min-age", type=int, default=24 * 3600,
+            help="Ignore orphans younger than this many seconds (uploads in flight).",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--delete-orphans", action="store_true")
+        parser.add_argument("--delete-dangling", action="store_true")
+
+    def handle(self, *args, **options):
+        storage = File._meta.get_field("file").storage
+        prefix = options["prefix"]
+        rows = heapq.merge(
+            iter_row_keys(File, prefix, options["batch_size"]),
+            iter_row_keys(DropFile, prefix, options["batch_size"]),
+            key=lambda row: row[0],
+        )
+        objects = iter_stored_keys(storage, prefix)
+        outputs = iter_output_prefixes(options["batch_size"])
+        output = next(outputs, None)
+        cutoff = time.time() - options["min_age"]
+        stats = {"objects": 0, "rows": 0, "orphans": 0, "orphan_bytes": 0,
+                 "young": 0, "derived": 0, "dangling": 0, "dangling_bytes": 0}
+        orphans, dangling = [], []
+
+        obj = next(objects, None)
+        row = next(rows, None)
+        while obj is not None or row is not None:
+            if row is None or (obj is not None and obj[0] < row[0]):
+                stats["objects"] += 1
+                name, size, mtime = obj
+                # Keys under an output prefix are contiguous in the listing,
+                # so the prefix stream only ever moves forward.
+                while output is not None and output < name and not name.startswith(output):
+                    output = next(outputs, None)
+                if output is not None and name.startswith(output):
+                    stats["derived"] += 1
+                elif mtime > cutoff:
+                    stats["young"] += 1
+                else:
+                    stats["orphans"] += 1
+                    stats["orphan_bytes"] += size
+                    self._report("orphan", name, size, options)
+                    if options["delete_orphans"]:
+                        orphans.append(name)
+                obj = next(objects, None)
+            elif obj is None or row[0] < obj[0]:
+                stats["rows"] += 1
+                name, size, pk, model = row
+                stats["dangling"] += 1
+                stats["dangling_bytes"] += size
+                self._report(f"dangling {model._meta.model_name}#{pk}", name, size, options)
+                if options["delete_dangling"]:
+                    dangling.append((model, pk, name))
+                row = next(rows, None)
+            else:
+                stats["objects"] += 1
+                stats["rows"] += 1
+                # Several rows may share a key after a copy; consume them all.
+                key = row[0]
+                while row is not None and row[0] == key:
+                    row = next(rows, None)
+                    if row is not None and row[0] == key:
+                        stats["rows"] += 1
+                obj = next(objects, None)
+
+            if len(orphans) >= 1000:
+                delete_objects(storage, orphans)
+                orphans = []
+            if len(dangling) >= 1000:
+                self._delete_rows(storage, dangling)
+                dangling = []
+
+        if orphans:
+            delete_objects(storage, orphans)
+        if dangling:
+            self._delete_rows(storage, dangling)
+
+        self.stdout.write(
+            f"objects: {stats['objects']} ({stats['derived']} renditions), rows: {stats['rows']}\n"
+            f"orphans: {stats['orphans']} ({_mb(stats['orphan_bytes'])})"
+            f"{', deleted' if options['delete_orphans'] else ''}; "
+            f"skipped {stats['young']} younger than --min-age\n"
+            f"dangling rows: {stats['dangling']} ({_mb(stats['dangling_bytes'])})"
+            f"{', deleted' if options['delete_dangling'] else ''}"
+        )
+
+    def _report(self, label, name, size, options):
+        if options["verbosity"] >= 2:
+            self.stdout.write(f"{label}: {name} ({size} B)")
+
+    @staticmethod
+    def _delete_rows(storage, items):
+        # Rows and listing are read at different times: a row whose key
+        # changed since (delta commit, key migration) only looked dangling.
+        for model, pk, name in items:
+            obj = model.objects.filter(pk=pk).first()
+            if obj is None or obj.file.name != name or storage.exists(name):
+                continue
+            # File.purge records the change so clients drop the entry too.
+            if model is File:
+                obj.purge(delete_object=False)
+            else:
+                # DropFile.delete would delete the object too.
+                cache.delete(model.cache_key(obj.token))
+                model.objects.filter(pk=pk).delete()
+
+
+def _mb(size):
+    return f"{size / 1024 / 1024:.1f} MiB"
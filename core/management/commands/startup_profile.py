@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORTS = "import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns"
+
+# Runs in a fresh interpreter, so it pays everything a new worker would.
+FIRST_RESPONSE = """
+import json, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+booted = time.perf_counter()
+from core.warmup import get, warm_up
+steps = warm_up(application) if {warm} else {{}}
+warmed = time.perf_counter()
+first_status = get(application, {path!r})
+first = time.perf_counter()
+get(application, {path!r})
+second = time.perf_counter()
+print(json.dumps({{
+    "boot": (booted - started) * 1000,
+    "warmup": (warmed - booted) * 1000,
+    "first": (first - warmed) * 1000,
+    "second": (second - first) * 1000,
+    "status": first_status,
+    "steps": steps,
+}}))
+"""
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+class Command(BaseCommand):
+    help = (
+        "Report where worker start-up time goes: self import time per top-level "
+        "package (python -X importtime) and, in fresh processes, the time to the "
+        "first response with and without core.warmup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=15, help="Packages to list.")
+        parser.add_argument("--path", default="/", help="Request measured as the first response.")
+        parser.add_argument("--runs", type=int, default=3, help="Processes per mode; medians are shown.")
+
+    def _python(self, *args, env=None):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "cloudstorage.settings"),
+               "WARMUP": "0", **(env or {})}
+        result = subprocess.run(
+            [sys.executable, *args], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "child failed")
+        return result
+
+    def handle(self, *args, **options):
+        self._imports(options["top"])
+        self.stdout.write("")
+        self._first_response(options["path"], options["runs"])
+
+    def _imports(self, top):
+        stderr = self._python("-X", "importtime", "-c", IMPORTS).stderr
+        packages = defaultdict(int)
+        total = 0
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            own, _, name = line[len("import time:"):].split("|")
+            packages[name.strip().split(".")[0]] += int(own)
+            total += int(own)
+        self.stdout.write(f"Imports for django.setup() and the URLconf: {total / 1000:.0f} ms")
+        self.stdout.write(f"{'package':<28} {'ms':>8} {'share':>7}")
+        for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"{name:<28} {us / 1000:>8.1f} {us * 100 / total:>6.1f}%")
+
+    def _first_response(self, path, runs):
+        self.stdout.write(f"Fresh worker, GET {path} (median of {runs}):")
+        self.stdout.write(
+            f"{'mode':<8} {'boot':>8} {'warm-up':>9} {'1st req':>9} {'2nd req':>9} {'boot→1st':>9}"
+        )
+        for mode in ("cold", "warm"):
+            results = []
+            for _ in range(runs):
+                code = FIRST_RESPONSE.format(warm=mode == "warm", path=path)
+                results.append(json.loads(self._python("-c", code).stdout.strip().splitlines()[-1]))
+            if results[0]["status"] >= 500:
+                raise CommandError(f"GET {path} returned {results[0]['status']}")
+            boot, warmup, first, second = (
+                _median([r[key] for r in results]) for key in ("boot", "warmup", "first", "second")
+            )
+            self.stdout.write(
+                f"{mode:<8} {boot:>6.0f}ms {warmup:>7.0f}ms {first:>7.1f}ms {second:>7.1f}ms "
+                f"{boot + warmup + first:>7.0f}ms"
+            )
+            if mode == "warm":
+                steps = ", ".join(f"{name} {_median([r['steps'][name] for r in results]):.0f}ms"
+                                  for name in results[0]["steps"])
+                self.stdout.write(f"warm-up steps: {steps}")
+        self.stdout.write("With warm-up the worker only accepts traffic after it; "
+                          "the first request then costs about as much as later ones.")
@@ -0,0 +1,102 @@
+import subprocess
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import File, Transcode
+from core.transcode import TranscodeError, hls_prefix, transcode
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker that turns queued videos into HLS renditions with ffmpeg. Run "
+        "one or more of these next to the web processes; jobs are claimed "
+        "atomically, so workers never pick the same video."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+        parser.add_argument("--poll", type=float, default=10.0, help="Seconds between queue checks.")
+        parser.add_argument("--max-attempts", type=int, default=3)
+        parser.add_argument(
+            "--stale-after", type=int, default=6 * 3600,
+            help="Requeue running jobs not updated for this many seconds (dead worker).",
+        )
+        parser.add_argument(
+            "--enqueue-missing", action="store_true",
+            help="Queue every video that has no job yet, then continue.",
+        )
+
+    def handle(self, *args, **options):
+        if options["enqueue_missing"]:
+            videos = File.objects.filter(
+                is_deleted=False, content_type__startswith="video/", transcode__isnull=True
+            )
+            created = Transcode.objects.bulk_create(
+                [Transcode(file_id=pk) for pk in videos.values_list("pk", flat=True)],
+                ignore_conflicts=True,
+            )
+            self.stdout.write(f"queued {len(created)} videos")
+        while True:
+            job = self._claim(options)
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll"])
+                continue
+            self._run(job, options)
+
+    def _claim(self, options):
+        stale = timezone.now() - timedelta(seconds=options["stale_after"])
+        candidates = Transcode.objects.filter(
+            Q(status=Transcode.PENDING) | Q(status=Transcode.RUNNING, updated_at__lt=stale),
+            attempts__lt=options["max_attempts"],
+            file__is_deleted=False,
+        ).order_by("created_at")
+        for job in candidates.only("pk", "status", "attempts")[:10]:
+            # The status/attempts guard makes the claim a compare-and-swap.
+            claimed = Transcode.objects.filter(
+                pk=job.pk, status=job.status, attempts=job.attempts
+            ).update(status=Transcode.RUNNING, attempts=job.attempts + 1, updated_at=timezone.now())
+            if claimed:
+                return Transcode.objects.select_related("file").get(pk=job.pk)
+        return None
+
+    def _run(self, job, options):
+        started = time.monotonic()
+        old_prefix = job.prefix
+        try:
+            prefix, renditions = transcode(job.file)
+        except (TranscodeError, OSError, subprocess.SubprocessError) as exc:
+            failed = job.attempts >= options["max_attempts"]
+            updated = Transcode.objects.filter(pk=job.pk).update(
+                status=Transcode.FAILED if failed else Transcode.PENDING,
+                error=str(exc)[-2000:],
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                # Purged meanwhile; drop whatever was stored before the error.
+                job.delete_outputs(hls_prefix(job.file.file.name))
+            self.stderr.write(f"file {job.file_id}: {exc}")
+            return
+        updated = Transcode.objects.filter(pk=job.pk).update(
+            status=Transcode.READY,
+            prefix=prefix,
+            renditions=renditions,
+            error="",
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            # The file was purged while ffmpeg ran. Its purge found no
+            # outputs yet, and reconcile_storage skips HLS prefixes, so
+            # nobody else would ever delete these.
+            job.delete_outputs(prefix)
+            self.stdout.write(f"file {job.file_id}: purged during transcode, outputs deleted")
+            return
+        if old_prefix and old_prefix != prefix:
+            job.delete_outputs(old_prefix)
+        heights = ", ".join(f"{r['height']}p" for r in renditions)
+        self.stdout.write(f"file {job.file_id}: {heights} in {time.monotonic() - started:.1f}s")
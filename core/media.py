@@ -0,0 +1,119 @@
+import datetime
+
+from django.utils import timezone
+
+from .storage import RangedReader
+from .transcode import TranscodeError, ffprobe, source_url
+
+try:
+    from PIL import Image, UnidentifiedImageError
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+# Headers and EXIF sit at the start of the file; one ranged read is usually
+# all Pillow needs to report them.
+HEADER_BLOCK = 64 * 1024
+
+EXIF_IFD = 0x8769
+EXIF_DATETIME = 306
+EXIF_ORIENTATION = 274
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_OFFSET_ORIGINAL = 36881
+
+
+class MediaError(Exception):
+    pass
+
+
+class MissingDependency(MediaError):
+    """Pillow or ffprobe is not available; the file itself may be fine."""
+
+
+def _parse_exif_time(value, offset=None):
+    if not value:
+        return None
+    try:
+        naive = datetime.datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    if offset:
+        try:
+            return datetime.datetime.fromisoformat(naive.isoformat() + str(offset).strip("\x00 "))
+        except ValueError:
+            pass
+    # Without an offset tag the camera's local time is taken in TIME_ZONE.
+    return timezone.make_aware(naive)
+
+
+def image_info(storage, name, size) -> dict:
+    if Image is None:
+        raise MissingDependency("Pillow is not installed")
+    reader = RangedReader(storage, name, size, HEADER_BLOCK)
+    try:
+        with Image.open(reader) as img:
+            exif = img.getexif()
+            details = exif.get_ifd(EXIF_IFD)
+            return {
+                "width": img.width,
+                "height": img.height,
+                "orientation": int(exif.get(EXIF_ORIENTATION) or 1),
+                "taken_at": _parse_exif_time(
+                    details.get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME),
+                    details.get(EXIF_OFFSET_ORIGINAL),
+                ),
+            }
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError) as exc:
+        raise MediaError(str(exc)) from exc
+    finally:
+        reader.close()
+
+
+_ROTATION_ORIENTATION = {90: 6, -270: 6, 180: 3, -180: 3, 270: 8, -90: 8}
+
+
+def video_info(storage, name) -> dict:
+    try:
+        data = ffprobe(source_url(storage, name))
+    except FileNotFoundError as exc:
+        raise MissingDependency(f"ffprobe not found: {exc}") from exc
+    except (TranscodeError, OSError, ValueError) as exc:
+        raise MediaError(str(exc)) from exc
+    video = next((s for s in data.get("streams", []) if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise MediaError("no video stream")
+    fmt = data.get("format", {})
+    rotation = video.get("tags", {}).get("rotate")
+    for side in video.get("side_data_list", []):
+        rotation = side.get("rotation", rotation)
+    created = fmt.get("tags", {}).get("creation_time") or video.get("tags", {}).get("creation_time")
+    taken_at = None
+    if created:
+        try:
+            taken_at = datetime.datetime.fromisoformat(created.replace("Z", "+00:00"))
+        except ValueError:
+            pass
+    duration = fmt.get("duration") or video.get("duration")
+    return {
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "duration": float(duration) if duration else None,
+        "orientation": _ROTATION_ORIENTATION.get(int(float(rotation or 0)), 1),
+        "taken_at": taken_at,
+    }
+
+
+def extract(media) -> None:
+    """Fill ``media`` from its file's headers; the caller saves it."""
+    obj = media.file
+    storage = obj.file.storage
+    if obj.is_image:
+        info = image_info(storage, obj.file.name, obj.stored_size or obj.size)
+    elif obj.is_video:
+        info = video_info(storage, obj.file.name)
+    else:
+        raise MediaError("not a media file")
+    for field in ("width", "height", "duration", "orientation"):
+        if info.get(field) is not None:
+            setattr(media, field, info[field])
+    if info.get("taken_at"):
+        media.taken_at = info["taken_at"]
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .models import RequestProfile
+from .profiling import Profile, instrument_storage
+from .routers import replica_aliases, routing
+
+PRIMARY_COOKIE = "db_primary"
+PROFILE_PARAM = "_profile"
+PROFILE_HEADER = "X-Profile"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaMiddleware:
+    """Lets safe requests read from replicas. A request that writes pins the
+    client to the primary for REPLICA_STICKY_SECONDS with a cookie, so it
+    reads its own uploads, deletes and redemptions while replicas catch up."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+        replica_ok = request.method in SAFE_METHODS and PRIMARY_COOKIE not in request.COOKIES
+        with routing(replica_ok) as state:
+            response = self.get_response(request)
+        if state.wrote:
+            response.set_cookie(
+                PRIMARY_COOKIE, "1",
+                max_age=getattr(settings, "REPLICA_STICKY_SECONDS", 10),
+                httponly=True, samesite="Lax",
+            )
+        return response
+
+
+class ProfilingMiddleware:
+    """Profiles requests from staff users that ask for it with ?_profile=1
+    or an X-Profile header, and stores the result as a RequestProfile.
+    Other requests only pay for that check."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_PARAM not in request.GET and PROFILE_HEADER not in request.headers:
+            return self.get_response(request)
+        if not request.user.is_staff:
+            return self.get_response(request)
+        instrument_storage(default_storage)
+        profile = Profile(f"{request.method} {request.path}")
+        with profile.run():
+            response = self.get_response(request)
+        # Streamed bodies are sent after this point and are not included.
+        record = RequestProfile.record(request, response, profile)
+        response["X-Profile-Id"] = str(record.pk)
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_filechunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='codec',
+            field=models.CharField(blank=True, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='stored_size',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_file_codec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Transcode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('ready', 'ready'), ('failed', 'failed')], default='pending', max_length=8)),
+                ('prefix', models.CharField(blank=True, max_length=255)),
+                ('renditions', models.JSONField(blank=True, default=list)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='transcode', to='core.file')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='core_transc_status_fd7f2a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_transcode'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaInfo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('orientation', models.PositiveSmallIntegerField(default=1)),
+                ('extracted', models.BooleanField(default=False)),
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='media', to='core.file')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-taken_at', '-file'], name='core_media_gallery'), models.Index(fields=['extracted', 'file'], name='core_media_pending')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('family', models.CharField(max_length=16)),
+                ('month', models.DateField()),
+                ('live_bytes', models.BigIntegerField(default=0)),
+                ('live_files', models.BigIntegerField(default=0)),
+                ('trash_bytes', models.BigIntegerField(default=0)),
+                ('trash_files', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', '-month', 'family'],
+                'indexes': [models.Index(fields=['month', 'family'], name='core_rollup_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'family', 'month'), name='core_rollup_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_usagerollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['code'], name='core_promocode_code_prefix', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
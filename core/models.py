@@ -1,18 +1,29 @@
 from django.conf import settings
-from django.db import models, transaction
-from django.db.models import F
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
 from datetime import timedelta
+import hashlib
 import mimetypes
 import os
 import secrets
 
+from . import rollups
+from .keys import get_layout
+from .routers import replica_aliases
+from .events import publish_change
+from .library import bump_library_version
+from .signing import signed_download_url
+from .storage import copy_object, delete_objects, iter_stored_keys
+
 def user_upload_path(instance, filename):
-    return f"u/{instance.owner_id}/{filename}"
+    return get_layout().file_key(instance, filename)
 
 
 def drop_upload_path(instance, filename):
-    return f"drop/{instance.token}/{filename}"
+    return get_layout().drop_key(instance, filename)
 
 
 def generate_drop_token(length: int = 10) -> str:
@@ -20,26 +31,194 @@ def generate_drop_token(length: int = 10) -> str:
     return "".join(secrets.choice(alphabet) for _ in range(length))
 
 
+class Folder(models.Model):
+    MAX_DEPTH = 32
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="folders",
+    )
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="children",
+    )
+    name = models.CharField(max_length=255)
+    # Materialized path of primary keys, e.g. "/3/17/42/". Names are not part
+    # of the path, so renames touch a single row and moves a single UPDATE.
+    path = models.CharField(max_length=512, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(default=timezone.now)
+    is_deleted = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["name"]
+        indexes = [
+            models.Index(fields=["owner", "parent", "is_deleted"]),
+            models.Index(
+                fields=["path"],
+                name="core_folder_path_like",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        prefix = self.parent.path if self.parent_id else "/"
+        path = f"{prefix}{self.pk}/"
+        if path != self.path:
+            self.path = path
+            self.depth = path.count("/") - 2
+            super().save(update_fields=["path", "depth"])
+
+    @property
+    def ancestor_ids(self) -> list[int]:
+        return [int(pk) for pk in self.path.strip("/").split("/")[:-1] if pk]
+
+    def ancestors(self):
+        return Folder.objects.filter(pk__in=self.ancestor_ids).order_by("depth")
+
+    def subtree(self):
+        return Folder.objects.filter(owner_id=self.owner_id, path__startswith=self.path)
+
+    def subtree_files(self):
+        return File.objects.filter(
+            owner_id=self.owner_id,
+            folder__path__startswith=self.path,
+        )
+
+    def total_size(self) -> int:
+        return (
+            self.subtree_files()
+            .filter(is_deleted=False)
+            .aggregate(s=Sum("size"))["s"]
+            or 0
+        )
+
+    def can_move_to(self, parent) -> bool:
+        if parent is None:
+            return True
+        if parent.owner_id != self.owner_id or parent.is_deleted:
+            return False
+        if parent.path.startswith(self.path):
+            return False
+        subtree_height = (
+            self.subtree().aggregate(m=models.Max("depth"))["m"] or self.depth
+        ) - self.depth
+        return self.fits_under(parent, subtree_height)
+
+    @classmethod
+    def fits_under(cls, parent, height=0) -> bool:
+        """Whether a subtree ``height`` levels tall may hang under ``parent``:
+        depths run from 0 (top level) to MAX_DEPTH - 1."""
+        return (parent.depth + 1 if parent else 0) + height < cls.MAX_DEPTH
+
+    def move_to(self, parent):
+        old_path = self.path
+        new_path = f"{parent.path if parent else '/'}{self.pk}/"
+        depth_delta = (parent.depth + 1 if parent else 0) - self.depth
+        with transaction.atomic():
+            self.subtree().update(
+                path=Concat(Value(new_path), Substr("path", len(old_path) + 1)),
+                depth=F("depth") + depth_delta,
+            )
+            self.parent = parent
+            self.path = new_path
+            self.depth += depth_delta
+            super().save(update_fields=["parent"])
+            ChangeEvent.record(self.owner_id, ChangeEvent.MOVE, self)
+
+    def trash(self):
+        now = timezone.now()
+        with transaction.atomic():
+            subtree = self.subtree()
+            live = self.subtree_files().filter(is_deleted=False)
+            rows = rollups.queryset_rows(live)
+            live.update(is_deleted=True, deleted_at=now)
+            subtree.filter(is_deleted=False).update(is_deleted=True, deleted_at=now)
+            self.is_deleted = True
+            self.deleted_at = now
+            ChangeEvent.record(self.owner_id, ChangeEvent.DELETE, self)
+            rollups.move(self.owner_id, rows, is_deleted=True)
+
+    def restore(self):
+        # Only items trashed together with this folder come back; anything
+        # deleted on its own earlier stays in the trash.
+        stamp = self.deleted_at
+        with transaction.atomic():
+            if self.parent_id and self.parent.is_deleted:
+                self.move_to(None)
+            trashed = self.subtree_files().filter(is_deleted=True, deleted_at=stamp)
+            rows = rollups.queryset_rows(trashed)
+            trashed.update(is_deleted=False, deleted_at=None)
+            self.subtree().filter(is_deleted=True, deleted_at=stamp).update(
+                is_deleted=False, deleted_at=None
+            )
+            self.is_deleted = False
+            self.deleted_at = None
+            ChangeEvent.record(self.owner_id, ChangeEvent.RESTORE, self)
+            rollups.move(self.owner_id, rows, is_deleted=False)
+
+    def purge(self):
+        for item in self.subtree_files().only("pk", "file"):
+            if item.file:
+                item.file.delete(save=False)
+        for job in Transcode.objects.filter(file__in=self.subtree_files()).exclude(prefix=""):
+            job.delete_outputs()
+        with transaction.atomic():
+            ChangeEvent.record(self.owner_id, ChangeEvent.PURGE, self)
+            rollups.apply(self.owner_id, removed=rollups.queryset_rows(self.subtree_files()))
+            self.subtree_files().delete()
+            self.subtree().delete()
+
+    def __str__(self):
+        return f"{self.owner_id}:{self.name}"
+
+
 class File(models.Model):
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name="files",
     )
+    folder = models.ForeignKey(
+        Folder,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="files",
+    )
     file = models.FileField(upload_to=user_upload_path)
     name = models.CharField(max_length=255, blank=True)
+    # ``size`` is the logical size (what quotas count); ``stored_size`` is
+    # what the object takes in storage when it is kept compressed.
     size = models.BigIntegerField(default=0)
+    codec = models.CharField(max_length=8, blank=True)
+    stored_size = models.BigIntegerField(default=0)
     content_type = models.CharField(max_length=120, blank=True)
     uploaded_at = models.DateTimeField(default=timezone.now)
     is_deleted = models.BooleanField(default=False)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "folder", "is_deleted", "-uploaded_at"]),
+            # Admin changelist: date filter and prefix search (the opclass
+            # lets PostgreSQL use it for LIKE 'x%'; other backends ignore it).
+            models.Index(fields=["uploaded_at"], name="core_file_uploaded_idx"),
+            models.Index(fields=["name"], name="core_file_name_prefix", opclasses=["varchar_pattern_ops"]),
+        ]
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        updated = False
+        # Take the display name before storing: the key no longer carries it.
         if self.file and not self.name:
             self.name = os.path.basename(self.file.name)
-            updated = True
+        super().save(*args, **kwargs)
+        updated = False
         if self.file and not self.size:
             try:
                 self.size = self.file.size
@@ -66,10 +245,323 @@ class File(models.Model):
     def is_pdf(self) -> bool:
         return (self.content_type or "") == "application/pdf"
 
+    @property
+    def is_archive(self) -> bool:
+        return not self.codec and (self.name or "").lower().endswith((".zip", ".tar", ".jar"))
+
+    @property
+    def inline_url(self) -> str:
+        return signed_download_url(self, inline=True)
+
+    @property
+    def preview_url(self) -> str:
+        # The pv stamp changes only when the stored object does, so the
+        # service worker keeps a preview across token windows.
+        stamp = hashlib.sha1(f"{self.pk}:{self.file.name}".encode()).hexdigest()[:16]
+        return f"{self.inline_url}?pv={stamp}"
+
+    def trash(self):
+        self.is_deleted = True
+        self.deleted_at = timezone.now()
+        with transaction.atomic():
+            self.save(update_fields=["is_deleted", "deleted_at"])
+            ChangeEvent.record(self.owner_id, ChangeEvent.DELETE, self)
+            rollups.move(self.owner_id, [rollups.file_row(self, is_deleted=False)], is_deleted=True)
+
+    def restore(self):
+        self.is_deleted = False
+        self.deleted_at = None
+        update_fields = ["is_deleted", "deleted_at"]
+        if self.folder_id and self.folder.is_deleted:
+            self.folder = None
+            update_fields.append("folder")
+        with transaction.atomic():
+            self.save(update_fields=update_fields)
+            ChangeEvent.record(self.owner_id, ChangeEvent.RESTORE, self)
+            rollups.move(self.owner_id, [rollups.file_row(self, is_deleted=True)], is_deleted=False)
+
+    def purge(self, delete_object=True):
+        if self.file and delete_object:
+            self.file.delete(save=False)
+        for job in Transcode.objects.filter(file=self).exclude(prefix=""):
+            job.delete_outputs()
+        with transaction.atomic():
+            ChangeEvent.record(self.owner_id, ChangeEvent.PURGE, self)
+            rollups.apply(self.owner_id, removed=[rollups.file_row(self)])
+            self.delete()
+
+    # Keys do not depend on the name or the folder, so renames and moves only
+    # touch the row; duplicates are copied inside the storage.
+    def rename(self, name):
+        self.name = name
+        with transaction.atomic():
+            self.save(update_fields=["name"])
+            ChangeEvent.record(self.owner_id, ChangeEvent.RENAME, self)
+
+    def move_to(self, folder):
+        self.folder = folder
+        with transaction.atomic():
+            self.save(update_fields=["folder"])
+            ChangeEvent.record(self.owner_id, ChangeEvent.MOVE, self)
+
+    def duplicate(self, name=None, folder=None):
+        name = name or self.name
+        copy = File(
+            owner_id=self.owner_id,
+            folder=folder if folder is not None else self.folder,
+            name=name,
+            size=self.size,
+            codec=self.codec,
+            stored_size=self.stored_size,
+            content_type=self.content_type,
+        )
+        storage = self.file.storage
+        stored = copy_object(storage, self.file.name, self.file.field.generate_filename(copy, name))
+        try:
+            with transaction.atomic():
+                copy.file.name = stored
+                copy.save()
+                FileChunk.objects.bulk_create(
+                    FileChunk(file=copy, position=c.position, offset=c.offset, size=c.size, digest=c.digest)
+                    for c in self.chunks.all()
+                )
+                media = MediaInfo.objects.filter(file=self).first()
+                if media is not None:
+                    media.pk = None
+                    media.file = copy
+                    media.save()
+                ChangeEvent.record(self.owner_id, ChangeEvent.CREATE, copy)
+                rollups.apply(self.owner_id, added=[rollups.file_row(copy)])
+        except Exception:
+            storage.delete(stored)
+            raise
+        return copy
+
     def __str__(self):
         return f"{self.owner_id}:{self.name}"
 
 
+class FileChunk(models.Model):
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name="chunks")
+    position = models.PositiveIntegerField()
+    offset = models.BigIntegerField()
+    size = models.PositiveIntegerField()
+    digest = models.CharField(max_length=64)
+
+    class Meta:
+        ordering = ["position"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["file", "position"], name="core_filechunk_position"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.file_id}[{self.position}]"
+
+
+class Transcode(models.Model):
+    """HLS renditions of a video, produced by the ``transcode_videos`` worker
+    and stored under ``prefix`` next to the original object."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    READY = "ready"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "pending"),
+        (RUNNING, "running"),
+        (READY, "ready"),
+        (FAILED, "failed"),
+    ]
+
+    file = models.OneToOneField(File, on_delete=models.CASCADE, related_name="transcode")
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    prefix = models.CharField(max_length=255, blank=True)
+    renditions = models.JSONField(default=list, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == self.READY and bool(self.prefix)
+
+    def delete_outputs(self, prefix=None):
+        prefix = prefix or self.prefix
+        if not prefix:
+            return
+        storage = File._meta.get_field("file").storage
+        names = []
+        for name, _, _ in iter_stored_keys(storage, prefix):
+            names.append(name)
+            if len(names) == 1000:
+                delete_objects(storage, names)
+                names = []
+        delete_objects(storage, names)
+
+    def __str__(self):
+        return f"{self.file_id}:{self.status}"
+
+
+class MediaInfo(models.Model):
+    """Indexed metadata of images and videos, filled in by ``extract_media``
+    so the gallery never opens stored objects. ``taken_at`` starts as the
+    upload time and becomes the capture time when the file carries one."""
+
+    file = models.OneToOneField(File, on_delete=models.CASCADE, related_name="media")
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    taken_at = models.DateTimeField()
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    orientation = models.PositiveSmallIntegerField(default=1)
+    extracted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "-taken_at", "-file"], name="core_media_gallery"),
+            models.Index(fields=["extracted", "file"], name="core_media_pending"),
+        ]
+
+    @property
+    def display_size(self):
+        # EXIF orientations 5-8 are rotated by 90 degrees.
+        if self.orientation in (5, 6, 7, 8):
+            return self.height, self.width
+        return self.width, self.height
+
+    def __str__(self):
+        return f"{self.file_id}@{self.taken_at:%Y-%m-%d}"
+
+
+class ChangeEvent(models.Model):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    RESTORE = "restore"
+    PURGE = "purge"
+    RENAME = "rename"
+    MOVE = "move"
+    KIND_CHOICES = [
+        (CREATE, "create"),
+        (UPDATE, "update"),
+        (DELETE, "delete"),
+        (RESTORE, "restore"),
+        (PURGE, "purge"),
+        (RENAME, "rename"),
+        (MOVE, "move"),
+    ]
+    FILE = "file"
+    FOLDER = "folder"
+    OBJECT_CHOICES = [(FILE, "file"), (FOLDER, "folder")]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="changes",
+    )
+    # Per-user cursor. Allocated under a lock on the user row, so a client
+    # that has seen seq N can never later miss an event with seq < N.
+    seq = models.BigIntegerField()
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_type = models.CharField(max_length=8, choices=OBJECT_CHOICES)
+    object_id = models.BigIntegerField()
+    parent_id = models.BigIntegerField(null=True, blank=True)
+    name = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["seq"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "seq"], name="core_change_user_seq"),
+        ]
+
+    @classmethod
+    def record(cls, user_id, kind, obj):
+        if isinstance(obj, Folder):
+            object_type, parent_id, size = cls.FOLDER, obj.parent_id, 0
+        else:
+            object_type, parent_id, size = cls.FILE, obj.folder_id, obj.size
+        with transaction.atomic():
+            user_model = cls._meta.get_field("user").related_model
+            list(user_model.objects.select_for_update().filter(pk=user_id).values("pk"))
+            last = cls.objects.filter(user_id=user_id).aggregate(m=models.Max("seq"))["m"]
+            bump_library_version(user_id)
+            change = cls.objects.create(
+                user_id=user_id,
+                seq=(last or 0) + 1,
+                kind=kind,
+                object_type=object_type,
+                object_id=obj.pk,
+                parent_id=parent_id,
+                name=obj.name,
+                size=size,
+            )
+            publish_change(change)
+            return change
+
+    def as_dict(self):
+        return {
+            "cursor": self.seq,
+            "kind": self.kind,
+            "type": self.object_type,
+            "id": self.object_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "size": self.size,
+            "at": self.created_at.isoformat(),
+        }
+
+    def __str__(self):
+        return f"{self.user_id}#{self.seq}:{self.kind}"
+
+
+class UsageRollup(models.Model):
+    """Bytes and file counts per user, content type family and upload
+    month, kept current by the file lifecycle methods (see core.rollups).
+    ``manage.py rebuild_usage_rollups`` recomputes them from File."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="usage_rollups",
+    )
+    family = models.CharField(max_length=16)
+    month = models.DateField()
+    live_bytes = models.BigIntegerField(default=0)
+    live_files = models.BigIntegerField(default=0)
+    trash_bytes = models.BigIntegerField(default=0)
+    trash_files = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ["user", "-month", "family"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "family", "month"], name="core_rollup_key"),
+        ]
+        indexes = [
+            models.Index(fields=["month", "family"], name="core_rollup_month_idx"),
+        ]
+
+    def as_dict(self):
+        return {
+            "family": self.family,
+            "month": self.month.strftime("%Y-%m"),
+            "live_bytes": self.live_bytes,
+            "live_files": self.live_files,
+            "trash_bytes": self.trash_bytes,
+            "trash_files": self.trash_files,
+        }
+
+    def __str__(self):
+        return f"{self.user_id}:{self.family}:{self.month:%Y-%m}"
+
+
 class DropFile(models.Model):
     token = models.CharField(
         max_length=16,
@@ -85,15 +577,52 @@ class DropFile(models.Model):
     expires_at = models.DateTimeField(blank=True)
 
     DEFAULT_LIFETIME = timedelta(hours=72)
+    MISSING = "missing"
+
+    @staticmethod
+    def cache_key(token: str) -> str:
+        return f"drop:{token}"
+
+    @classmethod
+    def resolve(cls, token: str):
+        """Cached token -> metadata lookup; None for unknown tokens."""
+        key = cls.cache_key(token)
+        meta = cache.get(key)
+        if meta == cls.MISSING:
+            return None
+        if meta is not None:
+            return meta
+        obj = cls.objects.filter(token=token).first()
+        if obj is None and replica_aliases():
+            # The read may have hit a replica that has not seen a drop made
+            # a moment ago; only a miss on the primary is cached.
+            obj = cls.objects.using(DEFAULT_DB_ALIAS).filter(token=token).first()
+        if obj is None:
+            cache.set(key, cls.MISSING, getattr(settings, "DROP_NEGATIVE_CACHE_TTL", 30))
+            return None
+        meta = {
+            "key": obj.file.name,
+            "name": obj.name,
+            "size": obj.size,
+            "content_type": obj.content_type,
+            "expires_at": obj.expires_at.timestamp(),
+        }
+        ttl = min(
+            getattr(settings, "DROP_CACHE_TTL", 3600),
+            int(meta["expires_at"] - timezone.now().timestamp()),
+        )
+        if ttl > 0:
+            cache.set(key, meta, ttl)
+        return meta
 
     def save(self, *args, **kwargs):
         if not self.expires_at:
             self.expires_at = timezone.now() + self.DEFAULT_LIFETIME
-        super().save(*args, **kwargs)
-        updated = False
         if self.file and not self.name:
             self.name = os.path.basename(self.file.name)
-            updated = True
+        super().save(*args, **kwargs)
+        cache.delete(self.cache_key(self.token))
+        updated = False
         if self.file and not self.size:
             try:
                 self.size = self.file.size
@@ -113,6 +642,7 @@ class DropFile(models.Model):
         return timezone.now() >= self.expires_at
 
     def delete(self, *args, **kwargs):
+        cache.delete(self.cache_key(self.token))
         stored_file = self.file
         if stored_file:
             stored_file.delete(save=False)
@@ -144,6 +674,9 @@ class PromoCode(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["code"], name="core_promocode_code_prefix", opclasses=["varchar_pattern_ops"]),
+        ]
 
     @staticmethod
     def generate_code(length: int = 10, prefix: str = "") -> str:
@@ -255,6 +788,7 @@ class PromoRedemption(models.Model):
     class Meta:
         unique_together = ("promo", "user")
         ordering = ["-redeemed_at"]
+        indexes = [models.Index(fields=["redeemed_at"], name="core_redemption_at_idx")]
 
     @property
     def extra_storage_display(self) -> str:
@@ -263,4 +797,56 @@ class PromoRedemption(models.Model):
         return PromoCode.format_storage(self.extra_storage_bytes)
 
     def __str__(self):
-        return f"{self.user_id}:{self.promo_id}"
\ No newline at end of file
+        return f"{self.user_id}:{self.promo_id}"
+
+
+class RequestProfile(models.Model):
+    """A profiled request; see core.middleware.ProfilingMiddleware."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    method = models.CharField(max_length=8)
+    path = models.CharField(max_length=500)
+    status = models.PositiveSmallIntegerField(default=0)
+    duration_ms = models.FloatField(default=0)
+    query_count = models.PositiveIntegerField(default=0)
+    query_ms = models.FloatField(default=0)
+    storage_count = models.PositiveIntegerField(default=0)
+    storage_ms = models.FloatField(default=0)
+    queries = models.JSONField(default=list, blank=True)
+    storage_calls = models.JSONField(default=list, blank=True)
+    # Gzipped speedscope JSON; the admin serves it as a download.
+    speedscope = models.BinaryField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    @classmethod
+    def record(cls, request, response, profile):
+        obj = cls.objects.create(
+            user=request.user if request.user.is_authenticated else None,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            status=response.status_code,
+            duration_ms=profile.duration_ms,
+            query_count=profile.query_count,
+            query_ms=sum(q["ms"] for q in profile.queries),
+            storage_count=len(profile.storage_calls),
+            storage_ms=sum(c["ms"] for c in profile.storage_calls),
+            queries=profile.queries,
+            storage_calls=profile.storage_calls,
+            speedscope=profile.speedscope_gz(),
+        )
+        keep = getattr(settings, "PROFILE_KEEP", 200)
+        stale = cls.objects.order_by("-created_at", "-pk").values_list("pk", flat=True)[keep:]
+        cls.objects.filter(pk__in=list(stale)).delete()
+        return obj
@@ -0,0 +1,179 @@
+import contextlib
+import gzip
+import json
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.utils.functional import LazyObject, empty
+
+from .storage import is_s3, s3_client
+
+STORAGE_METHODS = ("open", "save", "delete", "exists", "size", "url", "listdir", "get_modified_time")
+MAX_QUERIES = 1000
+
+# The running Profile, if any. Storage and S3 hooks stay installed once
+# added and cost one lookup here when nothing is being profiled.
+_current = ContextVar("profile", default=None)
+_instrument_lock = threading.Lock()
+
+
+class Sampler(threading.Thread):
+    """Samples the stack of one thread from a background thread. Stacks are
+    stored root first with consecutive repeats merged, as speedscope's
+    sampled format expects."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True, name="profile-sampler")
+        self.target = thread_id
+        self.interval = interval
+        self.frames = {}
+        self.samples = []
+        self.weights = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_qualname, code.co_filename, code.co_firstlineno)
+                index = self.frames.get(key)
+                if index is None:
+                    index = self.frames[key] = len(self.frames)
+                stack.append(index)
+                frame = frame.f_back
+            stack.reverse()
+            elapsed = (now - last) * 1000
+            last = now
+            if self.samples and self.samples[-1] == stack:
+                self.weights[-1] += elapsed
+            else:
+                self.samples.append(stack)
+                self.weights.append(elapsed)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def speedscope(self, name):
+        frames = [None] * len(self.frames)
+        for (func, filename, line), index in self.frames.items():
+            frames[index] = {"name": func, "file": filename, "line": line}
+        total = sum(self.weights)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "cloudstorage",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": self.samples,
+                "weights": [round(w, 3) for w in self.weights],
+            }],
+        }
+
+
+class Profile:
+    def __init__(self, name):
+        self.name = name
+        self.queries = []
+        self.query_count = 0
+        self.storage_calls = []
+        self.duration_ms = 0.0
+        self.sampler = None
+
+    def _record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_count += 1
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({
+                    "sql": sql[:2000],
+                    "ms": round((time.perf_counter() - started) * 1000, 3),
+                    "db": context["connection"].alias,
+                })
+
+    def record_storage(self, op, name, ms):
+        self.storage_calls.append({"op": op, "name": str(name)[:500], "ms": round(ms, 3)})
+
+    @contextlib.contextmanager
+    def run(self):
+        token = _current.set(self)
+        self.sampler = Sampler(threading.get_ident(), getattr(settings, "PROFILE_SAMPLE_INTERVAL", 0.001))
+        started = time.perf_counter()
+        self.sampler.start()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self._record_query))
+                yield self
+        finally:
+            self.duration_ms = (time.perf_counter() - started) * 1000
+            self.sampler.stop()
+            _current.reset(token)
+
+    def speedscope_gz(self) -> bytes:
+        payload = json.dumps(self.sampler.speedscope(self.name), separators=(",", ":"))
+        return gzip.compress(payload.encode(), 6)
+
+
+def _traced(method, op):
+    def wrapper(name=None, *args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return method(name, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return method(name, *args, **kwargs)
+        finally:
+            profile.record_storage(op, name, (time.perf_counter() - started) * 1000)
+
+    return wrapper
+
+
+def _before_s3_call(model, params, context, **kwargs):
+    if _current.get() is not None:
+        context["profile"] = (time.perf_counter(), params.get("Key", ""))
+
+
+def _after_s3_call(model, context, **kwargs):
+    profile = _current.get()
+    started = context.get("profile")
+    if profile is not None and started is not None:
+        profile.record_storage(f"s3:{model.name}", started[1], (time.perf_counter() - started[0]) * 1000)
+
+
+def instrument_storage(storage):
+    """Wrap ``storage`` so calls made while a Profile runs are recorded.
+    Ranged reads that go to the S3 client directly are caught by botocore
+    event hooks."""
+    if isinstance(storage, LazyObject):
+        if storage._wrapped is empty:
+            storage._setup()
+        storage = storage._wrapped
+    with _instrument_lock:
+        if getattr(storage, "_profiled", False):
+            return
+        for op in STORAGE_METHODS:
+            if hasattr(storage, op):
+                setattr(storage, op, _traced(getattr(storage, op), op))
+        if is_s3(storage):
+            events = s3_client(storage).meta.events
+            events.register("before-call.s3", _before_s3_call)
+            events.register("after-call.s3", _after_s3_call)
+        storage._profiled = True
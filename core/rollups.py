@@ -0,0 +1,122 @@
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+Row = namedtuple("Row", "family month is_deleted bytes files")
+
+FIELDS = ("live_bytes", "live_files", "trash_bytes", "trash_files")
+
+DOCUMENT_PREFIXES = (
+    "application/pdf",
+    "application/msword",
+    "application/rtf",
+    "application/vnd.ms-",
+    "application/vnd.openxmlformats-officedocument.",
+    "application/vnd.oasis.opendocument.",
+)
+ARCHIVE_TYPES = {
+    "application/zip",
+    "application/gzip",
+    "application/x-tar",
+    "application/x-gtar",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/vnd.rar",
+    "application/java-archive",
+    "application/zstd",
+}
+
+
+def family(content_type) -> str:
+    content_type = (content_type or "").lower()
+    major = content_type.partition("/")[0]
+    if major in ("image", "video", "audio", "text"):
+        return major
+    if content_type in ARCHIVE_TYPES:
+        return "archive"
+    if content_type.startswith(DOCUMENT_PREFIXES):
+        return "document"
+    return "other"
+
+
+def month(value):
+    # Same boundaries as TruncMonth in the current time zone.
+    return timezone.localtime(value).date().replace(day=1)
+
+
+def file_row(obj, **changes) -> Row:
+    row = Row(family(obj.content_type), month(obj.uploaded_at), obj.is_deleted, obj.size, 1)
+    return row._replace(**changes)
+
+
+def queryset_rows(files) -> list[Row]:
+    """Rows for a File queryset, summed in the database per content type and
+    month, so a folder with thousands of files costs one query."""
+    grouped = (
+        files.order_by()
+        .values("content_type", "is_deleted", period=TruncMonth("uploaded_at", output_field=DateField()))
+        .annotate(total=Sum("size"), count=Count("pk"))
+    )
+    return [
+        Row(family(g["content_type"]), g["period"], g["is_deleted"], g["total"] or 0, g["count"])
+        for g in grouped
+    ]
+
+
+def _totals(added, removed):
+    totals = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    for sign, rows in ((1, added), (-1, removed)):
+        for row in rows:
+            state = "trash" if row.is_deleted else "live"
+            total = totals[(row.family, row.month)]
+            total[f"{state}_bytes"] += sign * row.bytes
+            total[f"{state}_files"] += sign * row.files
+    return totals
+
+
+def apply(user_id, added=(), removed=()):
+    """Add ``added`` and subtract ``removed`` rows from the user's rollups.
+
+    Call it in the transaction that records the ChangeEvent, after
+    ChangeEvent.record: its lock on the user row keeps two writers from
+    creating the same rollup row at once."""
+    from .models import UsageRollup
+
+    for (family_, month_), total in _totals(added, removed).items():
+        total = {field: value for field, value in total.items() if value}
+        if not total:
+            continue
+        updated = UsageRollup.objects.filter(user_id=user_id, family=family_, month=month_).update(
+            **{field: F(field) + value for field, value in total.items()}
+        )
+        if not updated:
+            UsageRollup.objects.create(user_id=user_id, family=family_, month=month_, **total)
+
+
+def move(user_id, rows, is_deleted):
+    """Move rows between the live and trash totals."""
+    apply(user_id, added=[row._replace(is_deleted=is_deleted) for row in rows], removed=rows)
+
+
+def rebuild(user_id) -> int:
+    """Recompute one user's rollups from File. Takes the same user row lock
+    as ChangeEvent.record, so concurrent changes wait for it rather than
+    being lost; other users are not blocked. Returns the rows written."""
+    from .models import File, UsageRollup
+
+    with transaction.atomic():
+        user_model = UsageRollup._meta.get_field("user").related_model
+        list(user_model.objects.select_for_update().filter(pk=user_id).values("pk"))
+        totals = _totals(queryset_rows(File.objects.filter(owner_id=user_id)), ())
+        UsageRollup.objects.filter(user_id=user_id).delete()
+        UsageRollup.objects.bulk_create(
+            UsageRollup(user_id=user_id, family=family_, month=month_, **total)
+            for (family_, month_), total in totals.items()
+            if any(total.values())
+        )
+    return len(totals)
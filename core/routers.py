@@ -0,0 +1,62 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class _Routing:
+    __slots__ = ("replica_ok", "wrote")
+
+    def __init__(self, replica_ok):
+        self.replica_ok = replica_ok
+        self.wrote = False
+
+
+# Set per request by ReplicaMiddleware. A mutable object rather than a flag
+# so a write anywhere in the request is seen by the middleware afterwards.
+_routing = ContextVar("db_routing", default=None)
+
+
+def replica_aliases():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+@contextmanager
+def routing(replica_ok):
+    state = _Routing(replica_ok)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaRouter:
+    """Reads go to a replica only inside a request that allows it (see
+    ReplicaMiddleware), before it has written anything and outside
+    transactions. Everything else, including management commands and
+    workers, uses the primary."""
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        state = _routing.get()
+        if not replicas or state is None or not state.replica_ok or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_aliases()
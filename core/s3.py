@@ -0,0 +1,34 @@
+from storages.backends.s3 import S3Storage
+
+from .storage import build_client_config, build_transfer_config
+
+
+class TunedS3Storage(S3Storage):
+    """S3Storage with an explicit connection pool, adaptive retries,
+    keep-alive and threaded multipart transfers.
+
+    Kept out of core.storage so boto3 is imported only when the storage is
+    first used, not whenever the models are loaded."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("client_config", build_client_config())
+        kwargs.setdefault("transfer_config", build_transfer_config())
+        super().__init__(**kwargs)
+        self._shared_client = None
+
+    @property
+    def shared_client(self):
+        # Low-level clients are thread-safe, so one per process is enough
+        # for the helpers in core.storage; resources stay per thread.
+        if self._shared_client is None:
+            self._shared_client = self.connection.meta.client
+        return self._shared_client
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop("_shared_client", None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._shared_client = None
@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+
+DOWNLOAD_SALT = "core.download"
+HLS_SALT = "core.hls"
+
+
+def token_ttl() -> int:
+    return getattr(settings, "DOWNLOAD_TOKEN_TTL", 3600)
+
+
+def token_window() -> int:
+    return int(time.time()) // token_ttl()
+
+
+def _window_expiry() -> int:
+    # The expiry is rounded up to a TTL window so the same file yields the
+    # same URL for a while and browsers/proxies can reuse cached responses.
+    return (token_window() + 2) * token_ttl()
+
+
+def make_download_token(obj, inline: bool = False) -> str:
+    payload = {
+        "i": obj.pk,
+        "k": obj.file.name,
+        "n": obj.name,
+        "o": obj.owner_id,
+        "s": obj.size,
+        "t": obj.content_type,
+        "d": int(inline),
+        "e": _window_expiry(),
+    }
+    if getattr(obj, "codec", ""):
+        payload["c"] = obj.codec
+    return signing.Signer(salt=DOWNLOAD_SALT).sign_object(payload, compress=True)
+
+
+def read_download_token(token: str, salt: str = DOWNLOAD_SALT):
+    """Return the token payload, or None if it is forged or expired."""
+    try:
+        payload = signing.Signer(salt=salt).unsign_object(token)
+    except (signing.BadSignature, ValueError):
+        return None
+    if payload.get("e", 0) <= time.time():
+        return None
+    return payload
+
+
+def signed_download_url(obj, inline: bool = False) -> str:
+    return reverse("signed_download", args=[make_download_token(obj, inline=inline)])
+
+
+def hls_url(transcode, path: str = "master.m3u8") -> str:
+    # One token covers the whole rendition tree, so the relative segment and
+    # playlist URIs inside the playlists resolve under it.
+    token = signing.Signer(salt=HLS_SALT).sign_object(
+        {"p": transcode.prefix, "e": _window_expiry()}, compress=True
+    )
+    return reverse("hls_asset", args=[token, path])
@@ -0,0 +1,114 @@
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .compression import accepts_encoding
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+COMPRESS_EXTENSIONS = (".css", ".js", ".svg", ".json", ".map", ".txt", ".xml", ".ico", ".html")
+MIN_COMPRESS_SIZE = 256
+# Served variants, best first.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """Content-hashed names from the collectstatic manifest, with .gz and
+    (if brotli is installed) .br files written next to each text asset so
+    they are compressed once at build time rather than per response.
+
+    Without a manifest (development, tests) and for files missing from it,
+    names are served unhashed instead of failing the page."""
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = set()
+        for name, hashed_name, done in super().post_process(paths, dry_run, **options):
+            if done and not isinstance(done, Exception):
+                processed.update((name, hashed_name))
+            yield name, hashed_name, done
+        if dry_run:
+            return
+        for name in sorted(processed | set(paths)):
+            if name and name.endswith(COMPRESS_EXTENSIONS) and self.exists(name):
+                self._compress(name)
+
+    def _compress(self, name):
+        path = self.path(name)
+        with open(path, "rb") as fh:
+            data = fh.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        variants = [(".gz", gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(data, quality=11)))
+        for ext, compressed in variants:
+            # Not worth a second request path if it barely shrinks.
+            if len(compressed) < len(data) * 0.95:
+                with open(path + ext, "wb") as fh:
+                    fh.write(compressed)
+            elif os.path.exists(path + ext):
+                os.remove(path + ext)
+
+    def is_hashed(self, name) -> bool:
+        names = getattr(self, "_hashed_names", None)
+        if names is None or len(names) != len(self.hashed_files):
+            names = self._hashed_names = set(self.hashed_files.values())
+        return name in names
+
+
+def serve(request, path):
+    """Serve collected files from STATIC_ROOT for deployments without a
+    front web server doing it. Picks a precompressed variant the client
+    accepts; hashed names are cached as immutable."""
+    name = posixpath.normpath(path).lstrip("/")
+    if name.startswith("..") or name.endswith((".gz", ".br")):
+        raise Http404("Not found")
+    try:
+        full = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404("Not found")
+    if not os.path.isfile(full):
+        raise Http404("Not found")
+
+    stat = os.stat(full)
+    hashed = getattr(staticfiles_storage, "is_hashed", lambda _: False)(name)
+    if not hashed and not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    encoding = None
+    for candidate, ext in ENCODINGS:
+        if accepts_encoding(request, candidate) and os.path.isfile(full + ext):
+            encoding, full = candidate, full + ext
+            break
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    response = FileResponse(open(full, "rb"), content_type=content_type, filename=posixpath.basename(name))
+    if encoding:
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept-Encoding"])
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    if hashed:
+        response["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response["Cache-Control"] = f"public, max-age={getattr(settings, 'STATIC_MAX_AGE', 300)}"
+    return response
@@ -0,0 +1,345 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import File as DjangoFile
+from django.core.files.storage import FileSystemStorage, default_storage
+
+
+def build_client_config(**overrides):
+    from botocore.config import Config
+
+    options = {
+        "max_pool_connections": getattr(settings, "AWS_S3_MAX_POOL_CONNECTIONS", 50),
+        "retries": {
+            "mode": getattr(settings, "AWS_S3_RETRY_MODE", "adaptive"),
+            "max_attempts": getattr(settings, "AWS_S3_MAX_ATTEMPTS", 5),
+        },
+        "tcp_keepalive": getattr(settings, "AWS_S3_TCP_KEEPALIVE", True),
+        "connect_timeout": getattr(settings, "AWS_S3_CONNECT_TIMEOUT", 5),
+        "read_timeout": getattr(settings, "AWS_S3_READ_TIMEOUT", 60),
+        "s3": {"addressing_style": getattr(settings, "AWS_S3_ADDRESSING_STYLE", None)},
+        "signature_version": getattr(settings, "AWS_S3_SIGNATURE_VERSION", None),
+    }
+    options.update(overrides)
+    return Config(**options)
+
+
+def build_transfer_config(**overrides):
+    from boto3.s3.transfer import TransferConfig
+
+    options = {
+        "multipart_threshold": getattr(settings, "AWS_S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024),
+        "multipart_chunksize": getattr(settings, "AWS_S3_MULTIPART_CHUNKSIZE", 16 * 1024 * 1024),
+        "max_concurrency": getattr(settings, "AWS_S3_MAX_CONCURRENCY", 8),
+        "use_threads": True,
+    }
+    options.update(overrides)
+    return TransferConfig(**options)
+
+
+def is_s3(storage=None) -> bool:
+    storage = storage or default_storage
+    # The S3 backend (and boto3 with it) is imported when such a storage is
+    # built, so if it is not loaded by now this storage cannot be one.
+    cls = storage.__class__
+    module = sys.modules.get("storages.backends.s3")
+    return module is not None and issubclass(cls, module.S3Storage)
+
+
+def s3_client(storage=None):
+    storage = storage or default_storage
+    shared = getattr(storage, "shared_client", None)
+    return shared if shared is not None else storage.connection.meta.client
+
+
+def s3_key(storage, name: str) -> str:
+    from storages.utils import clean_name
+
+    return storage._normalize_name(clean_name(name))
+
+
+class _S3Writer:
+    """Streams bytes into an S3 multipart upload holding at most one part in
+    memory; small objects fall back to a single PutObject."""
+
+    def __init__(self, storage, name, part_size):
+        self.storage = storage
+        self.name = name
+        self.part_size = part_size
+        self._client = s3_client(storage)
+        self._bucket = storage.bucket_name
+        self._key = s3_key(storage, name)
+        self._params = storage._get_write_parameters(self._key)
+        self._upload_id = None
+        self._parts = []
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        while len(self._buf) >= self.part_size:
+            self._flush(self.part_size)
+
+    def _flush(self, size):
+        if self._upload_id is None:
+            resp = self._client.create_multipart_upload(
+                Bucket=self._bucket, Key=self._key, **self._params
+            )
+            self._upload_id = resp["UploadId"]
+        number = len(self._parts) + 1
+        resp = self._client.upload_part(
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            PartNumber=number,
+            Body=bytes(self._buf[:size]),
+        )
+        self._parts.append({"PartNumber": number, "ETag": resp["ETag"]})
+        del self._buf[:size]
+
+    def close(self) -> str:
+        if self._upload_id is None:
+            self._client.put_object(
+                Bucket=self._bucket, Key=self._key, Body=bytes(self._buf), **self._params
+            )
+        else:
+            if self._buf:
+                self._flush(len(self._buf))
+            self._client.complete_multipart_upload(
+                Bucket=self._bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        self._buf = bytearray()
+        return self.name
+
+    def abort(self):
+        self._buf = bytearray()
+        if self._upload_id is not None:
+            self._client.abort_multipart_upload(
+                Bucket=self._bucket, Key=self._key, UploadId=self._upload_id
+            )
+            self._upload_id = None
+
+
+class _LocalWriter:
+    """Writes directly to the final path of a FileSystemStorage."""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        while True:
+            self.name = storage.get_available_name(name)
+            path = storage.path(self.name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                self._file = open(path, "xb")
+                break
+            except FileExistsError:
+                continue
+        self._path = path
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self) -> str:
+        self._file.close()
+        if self.storage.file_permissions_mode is not None:
+            os.chmod(self._path, self.storage.file_permissions_mode)
+        return self.name
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+
+class _SpooledWriter:
+    """Fallback for storages without a native streaming write."""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self._file = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self) -> str:
+        self._file.seek(0)
+        self.name = self.storage.save(self.name, DjangoFile(self._file, name=self.name))
+        self._file.close()
+        return self.name
+
+    def abort(self):
+        self._file.close()
+
+
+def open_writer(storage, name, part_size=None):
+    """Return a writer with ``write(bytes)``, ``close() -> stored name`` and
+    ``abort()`` that puts data into ``storage`` as it arrives."""
+    if is_s3(storage):
+        part_size = part_size or getattr(settings, "UPLOAD_PART_SIZE", 8 * 1024 * 1024)
+        return _S3Writer(storage, storage.get_available_name(name), part_size)
+    if isinstance(storage, FileSystemStorage):
+        return _LocalWriter(storage, name)
+    return _SpooledWriter(storage, name)
+
+
+class RangedReader(io.RawIOBase):
+    """Seekable read-only view of a stored object that fetches only the byte
+    ranges actually read (one ranged GET per miss on S3), with a read-ahead
+    block so many small reads do not turn into many requests."""
+
+    def __init__(self, storage, name, size, block_size=64 * 1024):
+        self.size = size
+        self.block_size = block_size
+        self.requests = 0
+        self.bytes_fetched = 0
+        self._pos = 0
+        self._buf = b""
+        self._buf_start = 0
+        self._fh = None
+        if is_s3(storage):
+            self._client = s3_client(storage)
+            self._bucket = storage.bucket_name
+            self._key = s3_key(storage, name)
+        else:
+            self._fh = storage.open(name, "rb")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return self._pos
+
+    def _fetch(self, start, length):
+        self.requests += 1
+        if self._fh is None:
+            resp = self._client.get_object(
+                Bucket=self._bucket, Key=self._key, Range=f"bytes={start}-{start + length - 1}"
+            )
+            data = resp["Body"].read()
+        else:
+            self._fh.seek(start)
+            data = self._fh.read(length)
+        self.bytes_fetched += len(data)
+        return data
+
+    def readinto(self, b):
+        want = min(len(b), self.size - self._pos)
+        if want <= 0:
+            return 0
+        offset = self._pos - self._buf_start
+        if not (0 <= offset and offset + want <= len(self._buf)):
+            length = min(max(want, self.block_size), self.size - self._pos)
+            self._buf = self._fetch(self._pos, length)
+            self._buf_start = self._pos
+            offset = 0
+        data = self._buf[offset:offset + want]
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        super().close()
+
+
+def copy_object(storage, source: str, target: str) -> str:
+    """Copy inside the storage without streaming through this process when
+    the backend can do it natively. Returns the stored target name."""
+    if is_s3(storage):
+        client = s3_client(storage)
+        client.copy(
+            {"Bucket": storage.bucket_name, "Key": s3_key(storage, source)},
+            storage.bucket_name,
+            s3_key(storage, target),
+            Config=storage.transfer_config,
+        )
+        return target
+    if isinstance(storage, FileSystemStorage):
+        target = storage.get_available_name(target)
+        path = storage.path(target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(storage.path(source), path)
+        return target
+    with storage.open(source, "rb") as fh:
+        return storage.save(target, fh)
+
+
+def _walk_sorted(root, prefix=""):
+    # Directories sort as "name/" so the yielded paths come out in plain
+    # string order, the same order S3 lists keys in.
+    try:
+        entries = list(os.scandir(os.path.join(root, prefix)))
+    except FileNotFoundError:
+        return
+    keyed = sorted((e.name + "/" if e.is_dir(follow_symlinks=False) else e.name, e) for e in entries)
+    for key, entry in keyed:
+        if key.endswith("/"):
+            yield from _walk_sorted(root, prefix + key)
+        else:
+            stat = entry.stat(follow_symlinks=False)
+            yield prefix + key, stat.st_size, stat.st_mtime
+
+
+def iter_stored_keys(storage, prefix=""):
+    """Yield ``(name, size, mtime)`` for every object under ``prefix`` in
+    ascending name order, one listing page at a time."""
+    if is_s3(storage):
+        base = storage.location.strip("/")
+        strip = len(base) + 1 if base else 0
+        paginator = s3_client(storage).get_paginator("list_objects_v2")
+        pages = paginator.paginate(
+            Bucket=storage.bucket_name,
+            Prefix=f"{base}/{prefix}" if base else prefix,
+            PaginationConfig={"PageSize": 1000},
+        )
+        for page in pages:
+            for item in page.get("Contents", ()):
+                yield item["Key"][strip:], item["Size"], item["LastModified"].timestamp()
+        return
+    if isinstance(storage, FileSystemStorage):
+        directory, _, _ = prefix.rpartition("/")
+        start = directory + "/" if directory else ""
+        for name, size, mtime in _walk_sorted(storage.location, start):
+            if name.startswith(prefix):
+                yield name, size, mtime
+        return
+    raise NotImplementedError(f"Listing is not supported for {type(storage).__name__}")
+
+
+def delete_objects(storage, names):
+    """Delete many objects, batching requests where the backend allows it."""
+    if is_s3(storage):
+        client = s3_client(storage)
+        keys = [{"Key": s3_key(storage, name)} for name in names]
+        for start in range(0, len(keys), 1000):
+            client.delete_objects(
+                Bucket=storage.bucket_name,
+                Delete={"Objects": keys[start:start + 1000], "Quiet": True},
+            )
+        return
+    for name in names:
+        storage.delete(name)
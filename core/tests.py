@@ -1,12 +1,55 @@
+import asyncio
+import gzip
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock, skipUnless
 from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.storage import Storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.db import connection, connections
+from django.template import engines
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from .models import DropFile, PromoCode, PromoRedemption
+from . import archives, delta, media
+from .signing import make_download_token, signed_download_url
+from .keys import HashedLayout, LegacyLayout
+from .library import library_version
+from .middleware import PRIMARY_COOKIE
+from .routers import ReplicaRouter, routing
+from .events import astream, broker, publish
+from .staticfiles import serve as serve_static
+from .warmup import warm_up
+from .storage import RangedReader
+from .models import (
+    ChangeEvent,
+    DropFile,
+    File,
+    Folder,
+    MediaInfo,
+    PromoCode,
+    PromoRedemption,
+    RequestProfile,
+    Transcode,
+    UsageRollup,
+)
 
 
 class DropFileTests(TestCase):
@@ -27,6 +70,14 @@ class DropFileTests(TestCase):
         self.assertAlmostEqual(lifetime.total_seconds(), 72 * 3600, delta=120)
         self.assertFalse(stored.is_expired)
 
+    def test_replica_miss_is_rechecked_on_primary(self):
+        obj = DropFile.objects.create(file=SimpleUploadedFile("new.txt", b"fresh"))
+        with mock.patch("core.models.replica_aliases", return_value=["replica0"]), \
+                mock.patch.object(DropFile.objects, "filter", return_value=DropFile.objects.none()):
+            meta = DropFile.resolve(obj.token)
+        self.assertEqual(meta["name"], "new.txt")
+        self.assertNotEqual(cache.get(DropFile.cache_key(obj.token)), DropFile.MISSING)
+
     def test_download_and_expiration_cleanup(self):
         obj = DropFile.objects.create(
             file=SimpleUploadedFile("doc.txt", b"data", content_type="text/plain"),
@@ -45,6 +96,22 @@ class DropFileTests(TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertFalse(DropFile.objects.filter(pk=obj.pk).exists())
 
+    def test_repeat_downloads_are_served_from_cache(self):
+        obj = DropFile.objects.create(
+            file=SimpleUploadedFile("hot.txt", b"hot", content_type="text/plain"),
+        )
+        url = reverse("drop_download", args=[obj.token])
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(b"".join(response.streaming_content), b"hot")
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("Expires", response)
+
+        obj.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
 
 class PricingViewTests(TestCase):
     def setUp(self):
@@ -146,4 +213,1237 @@ class PromoCodeDeletionTests(TestCase):
         self.user.refresh_from_db()
         self.assertTrue(self.user.is_subscribed)
         self.assertEqual(self.user.storage_quota, initial_quota + 2048)
-        self.assertFalse(PromoRedemption.objects.filter(promo_id=first_id).exists())
\ No newline at end of file
+        self.assertFalse(PromoRedemption.objects.filter(promo_id=first_id).exists())
+
+
+class FolderTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="folders@example.com", password="strong-pass"
+        )
+        self.root = Folder.objects.create(owner=self.user, name="root")
+        self.child = Folder.objects.create(owner=self.user, parent=self.root, name="child")
+        self.leaf = Folder.objects.create(owner=self.user, parent=self.child, name="leaf")
+
+    def make_file(self, folder, name="a.txt", data=b"12345"):
+        return File.objects.create(
+            owner=self.user,
+            folder=folder,
+            file=SimpleUploadedFile(name, data, content_type="text/plain"),
+        )
+
+    def test_paths_and_move_rewrite_subtree(self):
+        self.assertEqual(self.leaf.path, f"/{self.root.pk}/{self.child.pk}/{self.leaf.pk}/")
+        self.assertEqual(self.leaf.depth, 2)
+
+        other = Folder.objects.create(owner=self.user, name="other")
+        self.assertFalse(self.root.can_move_to(self.leaf))
+        self.child.move_to(other)
+
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f"/{other.pk}/{self.child.pk}/{self.leaf.pk}/")
+        self.assertEqual(self.leaf.depth, 2)
+        self.assertEqual(
+            list(self.leaf.ancestors().values_list("pk", flat=True)),
+            [other.pk, self.child.pk],
+        )
+
+    def test_recursive_size_and_trash_restore(self):
+        self.make_file(self.root, data=b"1")
+        self.make_file(self.leaf, data=b"22")
+        loose = self.make_file(self.child, data=b"333")
+        loose.is_deleted = True
+        loose.deleted_at = timezone.now() - timedelta(days=1)
+        loose.save(update_fields=["is_deleted", "deleted_at"])
+        self.assertEqual(self.root.total_size(), 3)
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("folder_delete", args=[self.root.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Folder.objects.filter(is_deleted=True).count(), 3)
+        self.assertFalse(File.objects.filter(is_deleted=False).exists())
+
+        response = self.client.get(reverse("trash"))
+        self.assertEqual([d.pk for d in response.context["folders"]], [self.root.pk])
+
+        response = self.client.post(reverse("folder_restore", args=[self.root.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Folder.objects.filter(is_deleted=True).exists())
+        self.assertEqual(File.objects.filter(is_deleted=False).count(), 2)
+        loose.refresh_from_db()
+        self.assertTrue(loose.is_deleted)
+
+    def test_folder_listing_is_paged(self):
+        for i in range(5):
+            self.make_file(self.root, name=f"{i}.txt")
+        self.client.force_login(self.user)
+        with mock.patch("core.views.FILES_PAGE_SIZE", 2):
+            names = []
+            params = {"folder": self.root.pk}
+            while True:
+                response = self.client.get(reverse("files"), params)
+                page = response.context["recent"]
+                names += [f.name for f in page]
+                if not page.next_cursor:
+                    break
+                params["before"] = page.next_cursor
+        self.assertEqual(names, ["4.txt", "3.txt", "2.txt", "1.txt", "0.txt"])
+
+    def test_create_and_move_share_depth_limit(self):
+        other = Folder.objects.create(owner=self.user, name="other")
+        self.client.force_login(self.user)
+        with mock.patch.object(Folder, "MAX_DEPTH", 3):
+            response = self.client.post(reverse("folder_create"), {"name": "deep", "parent": self.leaf.pk})
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(other.can_move_to(self.leaf))
+            response = self.client.post(reverse("folder_create"), {"name": "ok", "parent": self.child.pk})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(other.can_move_to(self.child))
+
+    def test_listing_is_scoped_to_folder(self):
+        self.make_file(None, name="top.txt")
+        self.make_file(self.root, name="inner.txt")
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("files"))
+        self.assertEqual([f.name for f in response.context["recent"]], ["top.txt"])
+        self.assertEqual([d.pk for d in response.context["folders"]], [self.root.pk])
+
+        response = self.client.get(reverse("files"), {"folder": self.root.pk})
+        self.assertEqual([f.name for f in response.context["recent"]], ["inner.txt"])
+        self.assertEqual([d.pk for d in response.context["folders"]], [self.child.pk])
+
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="sync@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+
+    def test_lifecycle_is_journaled_and_paged(self):
+        payload = SimpleUploadedFile("a.txt", b"abc", content_type="text/plain")
+        self.client.post(reverse("upload"), {"file": payload})
+        obj = File.objects.get()
+        self.client.post(reverse("file_delete", args=[obj.pk]))
+        self.client.post(reverse("file_restore", args=[obj.pk]))
+        self.client.post(reverse("file_delete", args=[obj.pk]))
+        self.client.post(reverse("file_purge", args=[obj.pk]))
+
+        response = self.client.get(reverse("changes"), {"since": 0, "limit": 3})
+        data = response.json()
+        self.assertEqual(
+            [c["kind"] for c in data["changes"]],
+            [ChangeEvent.CREATE, ChangeEvent.DELETE, ChangeEvent.RESTORE],
+        )
+        self.assertTrue(data["has_more"])
+        self.assertEqual(data["changes"][0]["id"], obj.pk)
+
+        response = self.client.get(reverse("changes"), {"since": data["cursor"]})
+        data = response.json()
+        self.assertEqual(
+            [c["kind"] for c in data["changes"]],
+            [ChangeEvent.DELETE, ChangeEvent.PURGE],
+        )
+        self.assertFalse(data["has_more"])
+        self.assertEqual(data["cursor"], 5)
+
+    def test_cursor_is_per_user(self):
+        other = get_user_model().objects.create_user(email="other@example.com")
+        Folder.objects.create(owner=other, name="x")
+        folder = Folder.objects.create(owner=self.user, name="mine")
+        ChangeEvent.record(other.pk, ChangeEvent.CREATE, folder)
+        ChangeEvent.record(self.user.pk, ChangeEvent.CREATE, folder)
+
+        data = self.client.get(reverse("changes")).json()
+        self.assertEqual([c["cursor"] for c in data["changes"]], [1])
+        self.assertEqual(data["changes"][0]["type"], ChangeEvent.FOLDER)
+
+
+
+class DeltaUploadTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="delta@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+
+    def test_only_missing_chunks_are_uploaded(self):
+        rng = random.Random(7)
+        base = rng.randbytes(1024 * 1024)
+        obj = File.objects.create(
+            owner=self.user, file=SimpleUploadedFile("big.bin", base)
+        )
+        modified = base[:800_000] + b"inserted" + base[800_000:]
+        manifest = delta.compute_signatures(io.BytesIO(modified))
+        self.assertEqual(delta.load_manifest(obj), [])
+        call_command("index_chunks", "--once", stdout=io.StringIO())
+
+        response = self.client.post(
+            reverse("file_delta_plan", args=[obj.pk]),
+            data=json.dumps({"chunks": manifest}),
+            content_type="application/json",
+        )
+        plan = response.json()
+        self.assertTrue(plan["missing"])
+        self.assertLess(plan["upload_bytes"], len(modified) // 2)
+
+        upload = {"base": plan["base"], "manifest": json.dumps(manifest)}
+        for item in manifest:
+            if item["digest"] in plan["missing"]:
+                start = item["offset"]
+                upload[item["digest"]] = SimpleUploadedFile(
+                    item["digest"], modified[start:start + item["size"]]
+                )
+        response = self.client.post(reverse("file_delta_commit", args=[obj.pk]), upload)
+        self.assertEqual(response.status_code, 200)
+
+        obj.refresh_from_db()
+        self.assertEqual(obj.size, len(modified))
+        with obj.file.open("rb") as fh:
+            self.assertEqual(fh.read(), modified)
+        self.assertEqual(obj.chunks.count(), len(manifest))
+
+        response = self.client.post(reverse("file_delta_commit", args=[obj.pk]), upload)
+        self.assertEqual(response.status_code, 409)
+
+    def test_growth_is_checked_against_quota(self):
+        obj = File.objects.create(owner=self.user, file=SimpleUploadedFile("a.bin", b"a" * 10))
+        self.user.storage_quota = 15
+        self.user.save(update_fields=["storage_quota"])
+        data = b"b" * 20
+        manifest = delta.compute_signatures(io.BytesIO(data))
+        upload = {
+            "base": delta.manifest_version([]),
+            "manifest": json.dumps(manifest),
+            manifest[0]["digest"]: SimpleUploadedFile("chunk", data),
+        }
+        response = self.client.post(reverse("file_delta_commit", args=[obj.pk]), upload)
+        self.assertEqual(response.status_code, 400)
+        obj.refresh_from_db()
+        self.assertEqual(obj.size, 10)
+
+    def test_archive_lists_after_delta_commit(self):
+        def bundle(*members):
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, "w") as zf:
+                for name in members:
+                    zf.writestr(name, name * 100)
+            return buf.getvalue()
+
+        base = bundle("a.txt")
+        obj = File.objects.create(
+            owner=self.user, file=SimpleUploadedFile("bundle.zip", base), name="bundle.zip",
+            size=len(base), stored_size=len(base),
+        )
+        data = bundle("a.txt", "b.txt")
+        manifest = delta.compute_signatures(io.BytesIO(data))
+        upload = {"base": delta.manifest_version([]), "manifest": json.dumps(manifest)}
+        for item in manifest:
+            upload[item["digest"]] = SimpleUploadedFile(
+                "chunk", data[item["offset"]:item["offset"] + item["size"]]
+            )
+        response = self.client.post(reverse("file_delta_commit", args=[obj.pk]), upload)
+        self.assertEqual(response.status_code, 200)
+
+        obj.refresh_from_db()
+        self.assertEqual(obj.stored_size, len(data))
+        response = self.client.get(reverse("file_archive", args=[obj.pk]), {"format": "json"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e["name"] for e in response.json()["entries"]], ["a.txt", "b.txt"])
+
+
+
+class SignedDownloadTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="signed@example.com", password="strong-pass"
+        )
+        self.obj = File.objects.create(
+            owner=self.user,
+            file=SimpleUploadedFile("clip.txt", b"0123456789", content_type="text/plain"),
+        )
+
+    def test_download_without_queries(self):
+        url = reverse("signed_download", args=[make_download_token(self.obj, inline=True)])
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+            body = b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, b"0123456789")
+        self.assertTrue(response["Content-Disposition"].startswith("inline"))
+        self.assertIn("private", response["Cache-Control"])
+
+        response = self.client.get(url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+
+    def test_signed_in_download_without_queries(self):
+        self.client.force_login(self.user)
+        for inline in (True, False):
+            url = reverse("signed_download", args=[make_download_token(self.obj, inline=inline)])
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_RANGE="bytes=0-3")
+                self.assertEqual(b"".join(response.streaming_content), b"0123")
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+                self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+
+    def test_tampered_or_expired_token_is_rejected(self):
+        token = make_download_token(self.obj)
+        response = self.client.get(reverse("signed_download", args=[token[:-2] + "xx"]))
+        self.assertEqual(response.status_code, 404)
+
+        with self.settings(DOWNLOAD_TOKEN_TTL=1):
+            token = make_download_token(self.obj)
+        with mock.patch("core.signing.time.time", return_value=time.time() + 10):
+            response = self.client.get(reverse("signed_download", args=[token]))
+        self.assertEqual(response.status_code, 404)
+
+
+def _stored_names(storage):
+    names = set()
+    for root, _, files in os.walk(storage.location):
+        names.update(os.path.relpath(os.path.join(root, f), storage.location) for f in files)
+    return names
+
+
+class StreamingUploadTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="stream@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+
+    @mock.patch(
+        "django.core.files.uploadhandler.TemporaryUploadedFile",
+        side_effect=AssertionError("upload was spooled to a temp file"),
+    )
+    def test_upload_is_written_straight_to_storage(self, _):
+        payload = SimpleUploadedFile("stream.bin", b"x" * 200_000)
+        with self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0):
+            response = self.client.post(reverse("upload"), {"file": payload})
+        self.assertEqual(response.status_code, 302)
+        obj = File.objects.get()
+        self.assertEqual(obj.size, 200_000)
+        with obj.file.open("rb") as fh:
+            self.assertEqual(fh.read(), b"x" * 200_000)
+
+    def test_quota_violation_aborts_and_leaves_nothing(self):
+        self.user.storage_quota = 1024
+        self.user.save(update_fields=["storage_quota"])
+        storage = File._meta.get_field("file").storage
+        before = _stored_names(storage)
+
+        payload = SimpleUploadedFile("big.bin", b"x" * 10_000)
+        response = self.client.post(reverse("upload"), {"file": payload})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(File.objects.exists())
+        self.assertEqual(_stored_names(storage), before)
+
+
+class StorageKeyMigrationTests(TestCase):
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.old_keys = os.path.join(workdir.name, "old-keys.tsv")
+
+    def test_migrates_legacy_keys_to_hashed_layout(self):
+        user = get_user_model().objects.create_user(email="keys@example.com", password="strong-pass")
+        with mock.patch("core.models.get_layout", return_value=LegacyLayout()):
+            obj = File.objects.create(
+                owner=user, file=SimpleUploadedFile("report.pdf", b"payload"), name="report.pdf", size=7
+            )
+        old = obj.file.name
+        storage = obj.file.storage
+        self.assertTrue(old.startswith(f"u/{user.pk}/"))
+
+        version = library_version(user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                "migrate_storage_keys", "--model", "file", "--old-keys", self.old_keys, stdout=io.StringIO()
+            )
+
+        obj.refresh_from_db()
+        self.assertTrue(HashedLayout().is_current(obj.file.name))
+        self.assertNotIn("report", obj.file.name)
+        self.assertNotEqual(library_version(user.pk), version)
+        with obj.file.open("rb") as fh:
+            self.assertEqual(fh.read(), b"payload")
+
+        # Links signed before the switch still work until the window passes.
+        call_command("migrate_storage_keys", "--delete-old", "--old-keys", self.old_keys, stdout=io.StringIO())
+        self.assertTrue(storage.exists(old))
+        later = time.time() + 2 * settings.DOWNLOAD_TOKEN_TTL + 1
+        with mock.patch("core.management.commands.migrate_storage_keys.time.time", return_value=later):
+            call_command(
+                "migrate_storage_keys", "--delete-old", "--old-keys", self.old_keys, stdout=io.StringIO()
+            )
+        self.assertFalse(storage.exists(old))
+        with open(self.old_keys) as log:
+            self.assertEqual(log.read(), "")
+
+    def test_row_changed_during_copy_keeps_its_key(self):
+        user = get_user_model().objects.create_user(email="race@example.com", password="strong-pass")
+        with mock.patch("core.models.get_layout", return_value=LegacyLayout()):
+            obj = File.objects.create(owner=user, file=SimpleUploadedFile("a.txt", b"old"))
+            drop = DropFile.objects.create(file=SimpleUploadedFile("d.txt", b"drop"))
+        storage = obj.file.storage
+        old = obj.file.name
+        drop_old = drop.file.name
+        newer = storage.save("f/00/00/newer.txt", SimpleUploadedFile("newer.txt", b"new"))
+        before = _stored_names(storage)
+        self.assertIsNotNone(DropFile.resolve(drop.token))
+
+        from core.storage import copy_object
+
+        def copy_then_change(storage, source, target):
+            copied = copy_object(storage, source, target)
+            File.objects.filter(pk=obj.pk).update(file=newer)
+            return copied
+
+        class Inline:
+            # Runs the copies on this thread, which sees the test transaction.
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def map(self, fn, items):
+                return map(fn, items)
+
+        command = "core.management.commands.migrate_storage_keys"
+        with mock.patch(f"{command}.copy_object", copy_then_change), \
+                mock.patch(f"{command}.ThreadPoolExecutor", Inline):
+            call_command(
+                "migrate_storage_keys", "--model", "file", "--old-keys", self.old_keys, stdout=io.StringIO()
+            )
+        obj.refresh_from_db()
+        self.assertEqual(obj.file.name, newer)
+        self.assertTrue(storage.exists(old))
+        self.assertEqual(_stored_names(storage), before)
+
+        call_command(
+            "migrate_storage_keys", "--model", "drop", "--old-keys", self.old_keys, stdout=io.StringIO()
+        )
+        drop.refresh_from_db()
+        self.assertEqual(DropFile.resolve(drop.token)["key"], drop.file.name)
+        self.assertTrue(storage.exists(drop_old))
+        storage.delete(drop_old)
+        storage.delete(old)
+        storage.delete(newer)
+
+
+class ReconcileStorageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_finds_and_deletes_orphans_and_dangling_rows(self):
+        user = get_user_model().objects.create_user(email="scan@example.com", password="strong-pass")
+        kept = File.objects.create(owner=user, file=SimpleUploadedFile("kept.txt", b"kept"))
+        storage = kept.file.storage
+        orphan = storage.save("f/00/00/orphan.bin", io.BytesIO(b"lost bytes"))
+        dangling = File.objects.create(owner=user, name="gone.txt", size=3)
+        File.objects.filter(pk=dangling.pk).update(file="f/ff/ff/missing.txt")
+
+        out = io.StringIO()
+        call_command(
+            "reconcile_storage", "--min-age", "0", "--delete-orphans", "--delete-dangling",
+            stdout=out,
+        )
+
+        self.assertIn("orphans: 1", out.getvalue())
+        self.assertIn("dangling rows: 1", out.getvalue())
+        self.assertFalse(storage.exists(orphan))
+        self.assertTrue(storage.exists(kept.file.name))
+        self.assertEqual(list(File.objects.values_list("pk", flat=True)), [kept.pk])
+
+    def test_rows_rekeyed_during_the_scan_are_kept(self):
+        from core.management.commands.reconcile_storage import Command
+
+        user = get_user_model().objects.create_user(email="rekey@example.com", password="strong-pass")
+        moved = File.objects.create(owner=user, file=SimpleUploadedFile("moved.txt", b"new"))
+        storage = moved.file.storage
+        gone = File.objects.create(owner=user, name="gone.txt", size=3)
+        File.objects.filter(pk=gone.pk).update(file="f/ff/ff/missing.txt")
+
+        with mock.patch.object(storage, "delete") as delete:
+            Command._delete_rows(storage, [
+                (File, moved.pk, "f/00/00/stale.txt"),
+                (File, gone.pk, "f/ff/ff/missing.txt"),
+            ])
+        delete.assert_not_called()
+        self.assertEqual(list(File.objects.values_list("pk", flat=True)), [moved.pk])
+        self.assertTrue(storage.exists(moved.file.name))
+
+
+class FileOperationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="ops@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+        self.obj = File.objects.create(owner=self.user, file=SimpleUploadedFile("notes.txt", b"hello"))
+
+    def test_rename_and_move_keep_storage_key(self):
+        folder = Folder.objects.create(owner=self.user, name="Docs")
+        key = self.obj.file.name
+
+        response = self.client.post(reverse("file_rename", args=[self.obj.pk]), {"name": "todo.txt"})
+        self.assertEqual(response.json()["name"], "todo.txt")
+        response = self.client.post(reverse("file_move", args=[self.obj.pk]), {"folder": folder.pk})
+        self.assertEqual(response.status_code, 200)
+
+        self.obj.refresh_from_db()
+        self.assertEqual((self.obj.name, self.obj.folder_id, self.obj.file.name), ("todo.txt", folder.pk, key))
+        self.assertEqual(
+            list(ChangeEvent.objects.filter(user=self.user).values_list("kind", flat=True)),
+            [ChangeEvent.RENAME, ChangeEvent.MOVE],
+        )
+
+    def test_duplicate_copies_object_in_storage(self):
+        response = self.client.post(reverse("file_duplicate", args=[self.obj.pk]))
+
+        copy = File.objects.get(pk=response.json()["id"])
+        self.assertEqual(copy.name, "notes (копия).txt")
+        self.assertNotEqual(copy.file.name, self.obj.file.name)
+        with copy.file.open("rb") as fh:
+            self.assertEqual(fh.read(), b"hello")
+        self.assertTrue(self.obj.file.storage.exists(self.obj.file.name))
+
+    def test_duplicate_respects_quota(self):
+        self.user.storage_quota = 8
+        self.user.save(update_fields=["storage_quota"])
+        response = self.client.post(reverse("file_duplicate", args=[self.obj.pk]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(File.objects.count(), 1)
+
+
+class CompressedStorageTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="zip@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+        self.payload = b"time,level,message\n" + b"2024-01-01,INFO,all good\n" * 4000
+
+    def upload(self, name, data):
+        with self.settings(STORAGE_COMPRESSION="zstd"):
+            self.client.post(reverse("upload"), {"file": SimpleUploadedFile(name, data, "text/csv")})
+        return File.objects.get(name=name)
+
+    def test_text_upload_is_stored_compressed_but_counted_logically(self):
+        obj = self.upload("log.csv", self.payload)
+
+        self.assertIn(obj.codec, ("zstd", "gzip"))
+        self.assertEqual(obj.size, len(self.payload))
+        self.assertLess(obj.stored_size, len(self.payload) // 10)
+        self.assertEqual(obj.file.storage.size(obj.file.name), obj.stored_size)
+
+    def test_download_decodes_or_passes_encoding_through(self):
+        obj = self.upload("log.csv", self.payload)
+
+        response = self.client.get(reverse("download", args=[obj.pk]))
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(b"".join(response.streaming_content), self.payload)
+
+        response = self.client.get(
+            reverse("download", args=[obj.pk]), HTTP_ACCEPT_ENCODING=f"br, {obj.codec}"
+        )
+        self.assertEqual(response["Content-Encoding"], obj.codec)
+        self.assertEqual(int(response["Content-Length"]), obj.stored_size)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="zip@example.com", password="strong-pass")
+        self.client.force_login(self.user)
+
+    def store(self, name, data):
+        return File.objects.create(owner=self.user, file=SimpleUploadedFile(name, data), name=name)
+
+    def test_zip_listing_reads_only_the_directory(self):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("big.bin", random.Random(1).randbytes(3 * 1024 * 1024))
+            zf.writestr("docs/readme.txt", "hello", compress_type=zipfile.ZIP_DEFLATED)
+        obj = self.store("bundle.zip", buf.getvalue())
+        readers = []
+
+        def spy(*args, **kwargs):
+            readers.append(RangedReader(*args, **kwargs))
+            return readers[-1]
+
+        with mock.patch("core.archives.RangedReader", side_effect=spy):
+            response = self.client.get(reverse("file_archive", args=[obj.pk]), {"format": "json"})
+            self.client.get(reverse("file_archive", args=[obj.pk]), {"format": "json"})
+
+        names = [entry["name"] for entry in response.json()["entries"]]
+        self.assertEqual(names, ["big.bin", "docs/readme.txt"])
+        self.assertEqual(len(readers), 1)  # second request served from cache
+        self.assertLess(readers[0].bytes_fetched, 2 * archives.LIST_BLOCK)
+
+        response = self.client.get(
+            reverse("file_archive_member", args=[obj.pk]), {"name": "docs/readme.txt"}
+        )
+        self.assertEqual(b"".join(response.streaming_content), b"hello")
+
+    def test_tar_member_extraction(self):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tf:
+            for name, data in (("a.txt", b"first"), ("b.txt", b"second")):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+        obj = self.store("backup.tar", buf.getvalue())
+
+        response = self.client.get(reverse("file_archive", args=[obj.pk]))
+        self.assertContains(response, "b.txt")
+        self.assertEqual(archives.list_archive(obj)["format"], "tar")
+        response = self.client.get(reverse("file_archive_member", args=[obj.pk]), {"name": "b.txt"})
+        self.assertEqual(b"".join(response.streaming_content), b"second")
+        response = self.client.get(reverse("file_archive_member", args=[obj.pk]), {"name": "c.txt"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_tar_member_is_read_from_cached_offset(self):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tf:
+            for i in range(200):
+                data = f"member {i}".encode()
+                info = tarfile.TarInfo(f"m{i}.txt")
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+        obj = self.store("many.tar", buf.getvalue())
+        archives.list_archive(obj)
+        readers = []
+
+        def spy(*args, **kwargs):
+            readers.append(RangedReader(*args, **kwargs))
+            return readers[-1]
+
+        with mock.patch("core.archives.RangedReader", side_effect=spy):
+            stream, size = archives.open_member(obj, "m199.txt")
+            data = stream.read()
+            stream.close()
+        self.assertEqual((data, size), (b"member 199", 10))
+        self.assertEqual(len(readers), 1)
+        self.assertLess(readers[0].bytes_fetched, len(buf.getvalue()) // 10)
+
+
+def _fake_ffmpeg(cmd, **kwargs):
+    if "-show_streams" in cmd:
+        streams = [{"codec_type": "video", "height": 720}, {"codec_type": "audio"}]
+        return mock.Mock(returncode=0, stdout=json.dumps({"streams": streams}).encode(), stderr=b"")
+    outdir = os.path.dirname(os.path.dirname(cmd[-1]))
+    variants = cmd[cmd.index("-var_stream_map") + 1].split()
+    master = ["#EXTM3U"]
+    for i, _ in enumerate(variants):
+        os.makedirs(os.path.join(outdir, f"stream_{i}"))
+        with open(os.path.join(outdir, f"stream_{i}", "index.m3u8"), "w") as fh:
+            fh.write("#EXTM3U\n#EXTINF:6,\nseg_00000.ts\n#EXT-X-ENDLIST\n")
+        with open(os.path.join(outdir, f"stream_{i}", "seg_00000.ts"), "wb") as fh:
+            fh.write(b"\x47" * 188)
+        master.append(f"stream_{i}/index.m3u8")
+    with open(os.path.join(outdir, "master.m3u8"), "w") as fh:
+        fh.write("\n".join(master))
+    return mock.Mock(returncode=0, stdout=b"", stderr=b"")
+
+
+class TranscodeTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="video@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+        payload = SimpleUploadedFile("clip.mp4", b"\x00" * 1000, content_type="video/mp4")
+        self.client.post(reverse("upload"), {"file": payload})
+        self.obj = File.objects.get()
+
+    @mock.patch("core.transcode.subprocess.run", side_effect=_fake_ffmpeg)
+    def test_worker_builds_renditions_and_player_switches_to_hls(self, _):
+        response = self.client.get(reverse("file_play", args=[self.obj.pk]))
+        self.assertEqual(response.context["hls_url"], "")
+
+        call_command("transcode_videos", "--once", stdout=io.StringIO())
+
+        job = Transcode.objects.get(file=self.obj)
+        self.assertEqual(job.status, Transcode.READY)
+        self.assertEqual([r["height"] for r in job.renditions], [360, 720])
+        response = self.client.get(reverse("file_play", args=[self.obj.pk]))
+        master_url = response.context["hls_url"]
+        self.assertTrue(master_url.endswith("/master.m3u8"))
+
+        self.client.logout()
+        response = self.client.get(master_url)
+        self.assertEqual(response["Content-Type"], "application/vnd.apple.mpegurl")
+        self.assertIn("max-age", response["Cache-Control"])
+        self.assertIn(b"stream_1/index.m3u8", b"".join(response.streaming_content))
+        segment = master_url.replace("master.m3u8", "stream_1/seg_00000.ts")
+        self.assertIn(self.client.get(segment).status_code, (200, 302))  # 302: presigned on S3
+        self.assertEqual(self.client.get(master_url.replace("master.m3u8", "../x")).status_code, 404)
+
+    @mock.patch("core.transcode.subprocess.run", side_effect=_fake_ffmpeg)
+    def test_purge_removes_renditions(self, _):
+        call_command("transcode_videos", "--once", stdout=io.StringIO())
+        job = Transcode.objects.get(file=self.obj)
+        storage = self.obj.file.storage
+        self.assertTrue(storage.exists(job.prefix + "master.m3u8"))
+
+        self.obj.trash()
+        self.obj.purge()
+        self.assertFalse(storage.exists(job.prefix + "master.m3u8"))
+        self.assertFalse(storage.exists(job.prefix + "stream_0/seg_00000.ts"))
+
+    @mock.patch("core.transcode.subprocess.run", side_effect=_fake_ffmpeg)
+    def test_purge_during_transcode_leaves_no_renditions(self, _):
+        from core import transcode as transcoding
+
+        storage = self.obj.file.storage
+        prefix = transcoding.hls_prefix(self.obj.file.name)
+
+        def transcode_then_purge(obj):
+            result = transcoding.transcode(obj)
+            self.obj.trash()
+            self.obj.purge()
+            return result
+
+        with mock.patch("core.management.commands.transcode_videos.transcode", transcode_then_purge):
+            call_command("transcode_videos", "--once", stdout=io.StringIO())
+        self.assertFalse(Transcode.objects.exists())
+        self.assertFalse(storage.exists(prefix + "master.m3u8"))
+        self.assertFalse(storage.exists(prefix + "stream_0/seg_00000.ts"))
+
+
+def _jpeg(taken, orientation=1, size=(40, 30)):
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[274] = orientation
+    exif.get_ifd(0x8769)[36867] = taken
+    buf = io.BytesIO()
+    Image.new("RGB", size, "red").save(buf, "JPEG", exif=exif)
+    return buf.getvalue()
+
+
+@skipUnless(media.Image is not None, "Pillow is not installed")
+class GalleryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="photos@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+        for name, taken, orientation in (
+            ("new.jpg", "2021:08:01 09:30:00", 6),
+            ("old.jpg", "2019:07:01 10:00:00", 1),
+        ):
+            payload = SimpleUploadedFile(name, _jpeg(taken, orientation), content_type="image/jpeg")
+            self.client.post(reverse("upload"), {"file": payload})
+
+    def test_extraction_fills_index_and_gallery_reads_only_the_index(self):
+        call_command("extract_media", "--once", stdout=io.StringIO())
+        info = MediaInfo.objects.get(file__name="new.jpg")
+        self.assertTrue(info.extracted)
+        self.assertEqual((info.width, info.height, info.orientation), (40, 30, 6))
+        self.assertEqual(info.display_size, (30, 40))
+        self.assertEqual(timezone.localtime(info.taken_at).year, 2021)
+
+        with mock.patch.object(Storage, "open", side_effect=AssertionError("storage read")):
+            data = self.client.get(reverse("gallery"), {"format": "json"}).json()
+            self.assertEqual(self.client.get(reverse("gallery")).status_code, 200)
+        self.assertEqual(
+            [(g["date"], [i["name"] for i in g["items"]]) for g in data["groups"]],
+            [("2021-08-01", ["new.jpg"]), ("2019-07-01", ["old.jpg"])],
+        )
+
+    def test_missing_pillow_leaves_rows_queued(self):
+        with mock.patch("core.media.Image", None), self.assertRaisesMessage(CommandError, "Pillow"):
+            call_command("extract_media", "--once", stdout=io.StringIO())
+        self.assertFalse(MediaInfo.objects.filter(extracted=True).exists())
+
+        call_command("extract_media", "--once", stdout=io.StringIO())
+        self.assertFalse(MediaInfo.objects.filter(extracted=False).exists())
+
+    def test_gallery_pages_with_keyset_cursor(self):
+        with mock.patch("core.views.GALLERY_PAGE_SIZE", 1):
+            first = self.client.get(reverse("gallery"), {"format": "json"}).json()
+            second = self.client.get(reverse("gallery"), {"format": "json", "before": first["next"]}).json()
+        names = [g["items"][0]["name"] for g in first["groups"] + second["groups"]]
+        self.assertEqual(sorted(names), ["new.jpg", "old.jpg"])
+        self.assertEqual(second["next"], "")
+
+
+@skipUnless(connection.vendor == "sqlite" and settings.DB_TUNING, "SQLite tuning is off")
+class DatabaseTuningTests(TestCase):
+    def test_sqlite_connections_are_tuned(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = type(connections["default"])(
+                {**connection.settings_dict, "NAME": os.path.join(tmp, "tuned.sqlite3")},
+                alias="tuning",
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], "wal")
+                    cursor.execute("PRAGMA synchronous")
+                    self.assertEqual(cursor.fetchone()[0], 1)
+                self.assertEqual(wrapper.transaction_mode, "IMMEDIATE")
+            finally:
+                wrapper.close()
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    @override_settings(DATABASE_REPLICAS=["replica1"])
+    def test_reads_stay_on_primary_after_a_write(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(File), "default")
+        with routing(replica_ok=False):
+            self.assertEqual(router.db_for_read(File), "default")
+        with routing(replica_ok=True):
+            self.assertEqual(router.db_for_read(File), "replica1")
+            self.assertEqual(router.db_for_write(File), "default")
+            self.assertEqual(router.db_for_read(File), "default")
+        self.assertFalse(router.allow_migrate("replica1", "core"))
+
+
+# The primary stands in for the replica: the test database has one alias.
+@override_settings(DATABASE_REPLICAS=["default"])
+class ReplicaStickinessTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="replica@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+
+    def test_writes_pin_client_to_primary(self):
+        response = self.client.get(reverse("files"))
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+        response = self.client.post(reverse("upload"), {"file": SimpleUploadedFile("a.txt", b"hello")})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]["max-age"], 10)
+
+
+@override_settings(ADMISSION_RULES={
+    "drop_upload": {"per_minute": 1, "burst": 2},
+    "download": {"per_minute": 600, "burst": 100, "concurrency": 1},
+})
+class AdmissionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_drop_uploads_are_rate_limited(self):
+        for _ in range(2):
+            response = self.client.post(reverse("drop_upload"), {"file": SimpleUploadedFile("a.txt", b"hi")})
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse("drop_upload"), {"file": SimpleUploadedFile("a.txt", b"hi")})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 29)
+        self.assertIn("error", response.json())
+
+        # Another address has its own bucket.
+        response = self.client.post(
+            reverse("drop_upload"), {"file": SimpleUploadedFile("a.txt", b"hi")}, REMOTE_ADDR="10.0.0.2"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(DROP_MAX_UPLOAD_SIZE=1024)
+    def test_oversized_drop_upload_is_rejected_before_reading(self):
+        with mock.patch("core.views.StorageUploadHandler") as handler:
+            response = self.client.post(
+                reverse("drop_upload"), {"file": SimpleUploadedFile("big.bin", b"x" * 200_000)}
+            )
+        self.assertEqual(response.status_code, 413)
+        handler.assert_not_called()
+        self.assertFalse(DropFile.objects.exists())
+
+    def test_concurrent_downloads_are_capped(self):
+        obj = DropFile.objects.create(file=SimpleUploadedFile("doc.txt", b"data"))
+        url = reverse("drop_download", args=[obj.token])
+
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 429)
+        first.close()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_previews_do_not_use_the_download_budget(self):
+        user = get_user_model().objects.create_user(email="gallery@example.com", password="strong-pass")
+        obj = File.objects.create(owner=user, file=SimpleUploadedFile("a.png", b"png", content_type="image/png"))
+        held = [self.client.get(obj.preview_url) for _ in range(5)]
+        self.assertEqual({response.status_code for response in held}, {200})
+        held.append(self.client.get(signed_download_url(obj)))
+        self.assertEqual(held[-1].status_code, 200)
+        self.assertEqual(self.client.get(signed_download_url(obj)).status_code, 429)
+        for response in held:
+            response.close()
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="staff@example.com", password="strong-pass", is_staff=True, is_superuser=True
+        )
+        self.client.force_login(self.user)
+        self.obj = File.objects.create(owner=self.user, file=SimpleUploadedFile("a.txt", b"hello"))
+
+    def test_staff_request_is_profiled_on_demand(self):
+        self.client.get(reverse("files"))
+        self.assertFalse(RequestProfile.objects.exists())
+
+        with override_settings(PROFILE_SAMPLE_INTERVAL=0.0005):
+            response = self.client.get(reverse("files"), {"_profile": "1"})
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual((profile.method, profile.status), ("GET", 200))
+        self.assertGreater(profile.query_count, 0)
+        self.assertTrue(any("core_file" in q["sql"] for q in profile.queries))
+
+        response = self.client.get(reverse("download", args=[self.obj.pk]), HTTP_X_PROFILE="1")
+        response.close()
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertIn("open", [c["op"] for c in profile.storage_calls])
+
+        response = self.client.get(reverse("admin:core_requestprofile_speedscope", args=[profile.pk]))
+        data = json.loads(response.content)
+        self.assertEqual(data["profiles"][0]["type"], "sampled")
+        self.assertEqual(self.client.get(reverse("admin:core_requestprofile_change", args=[profile.pk])).status_code, 200)
+
+    def test_header_from_regular_user_is_ignored(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.client.get(reverse("files"), HTTP_X_PROFILE="1")
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class StaticAssetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        tmp = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(tmp.cleanup)
+        override = override_settings(STATIC_ROOT=tmp.name)
+        override.enable()
+        cls.addClassCleanup(override.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_pages_link_hashed_bundles(self):
+        user = get_user_model().objects.create_user(email="static@example.com", password="strong-pass")
+        self.client.force_login(user)
+        html = self.client.get(reverse("files")).content.decode()
+        self.assertNotIn("<style>", html)
+        self.assertRegex(html, r"/static/css/base\.[0-9a-f]{12}\.css")
+        self.assertRegex(html, r"/static/js/files\.[0-9a-f]{12}\.js")
+
+    def test_hashed_assets_are_precompressed_and_immutable(self):
+        name = staticfiles_storage.stored_name("css/files.css")
+        response = serve_static(self.factory.get("/", HTTP_ACCEPT_ENCODING="gzip, br"), name)
+        encoding = response["Content-Encoding"]
+        self.assertIn(encoding, ("br", "gzip"))
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        body = b"".join(response.streaming_content)
+        if encoding == "gzip":
+            self.assertIn(b".grid", gzip.decompress(body))
+
+        response = serve_static(self.factory.get("/"), "css/files.css")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(response["Cache-Control"], "public, max-age=300")
+        response.close()
+
+
+@override_settings(FRAGMENT_CACHE=True)
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email="grid@example.com", password="strong-pass")
+        self.client.force_login(self.user)
+        self.obj = File.objects.create(owner=self.user, file=SimpleUploadedFile("notes.txt", b"hello"))
+
+    def test_grid_is_cached_until_library_changes(self):
+        self.assertContains(self.client.get(reverse("files")), "notes.txt")
+        # A change that bypasses ChangeEvent is not seen: the grid came from cache.
+        File.objects.filter(pk=self.obj.pk).update(name="stale.txt")
+        self.assertContains(self.client.get(reverse("files")), "notes.txt")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("file_rename", args=[self.obj.pk]), {"name": "todo.txt"})
+        self.assertContains(self.client.get(reverse("files")), "todo.txt")
+
+        self.assertNotContains(self.client.get(reverse("trash")), "todo.txt")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("file_delete", args=[self.obj.pk]))
+        self.assertNotContains(self.client.get(reverse("files")), "todo.txt")
+        self.assertContains(self.client.get(reverse("trash")), "todo.txt")
+
+
+class LargeTableAdminTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user(
+            email="root@example.com", password="strong-pass", is_staff=True, is_superuser=True
+        )
+        self.client.force_login(self.admin)
+        self.owner = get_user_model().objects.create_user(email="bob@example.com", password="strong-pass")
+        for name in ("report.pdf", "=cmd.txt", "photo.jpg"):
+            File.objects.create(owner=self.owner, name=name, file=SimpleUploadedFile(name, b"x"))
+
+    def test_unfiltered_count_uses_planner_statistics(self):
+        url = reverse("admin:core_file_changelist")
+        self.assertEqual(self.client.get(url).context["cl"].result_count, 3)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute("UPDATE sqlite_stat1 SET stat = '5000000 1' WHERE tbl = 'core_file'")
+        with override_settings(ADMIN_EXACT_COUNT_LIMIT=1000):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+        self.assertFalse([q for q in queries if "COUNT(" in q["sql"]])
+        self.assertEqual(response.context["cl"].result_count, 5000000)
+        self.assertEqual(len(response.context["cl"].result_list), 3)
+
+    def test_prefix_search_and_csv_export(self):
+        url = reverse("admin:core_file_changelist")
+        names = lambda r: sorted(f.name for f in r.context["cl"].result_list)
+        self.assertEqual(names(self.client.get(url, {"q": "rep"})), ["report.pdf"])
+        self.assertEqual(names(self.client.get(url, {"q": "bob@"})), ["=cmd.txt", "photo.jpg", "report.pdf"])
+        self.assertEqual(names(self.client.get(url, {"q": "port"})), [])
+
+        File.objects.create(owner=self.owner, name="\tcalc.txt", file=SimpleUploadedFile("calc.txt", b"x"))
+        response = self.client.post(url, {
+            "action": "export_csv",
+            "_selected_action": list(File.objects.values_list("pk", flat=True)),
+        })
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "owner__email", "folder_id"])
+        self.assertEqual(len(lines), 5)
+        self.assertIn(",'=cmd.txt,", lines[2])
+        self.assertIn(",'\tcalc.txt,", lines[4])
+
+    def test_promo_search_matches_code_prefix_and_description(self):
+        PromoCode.objects.create(code="SPRING25", description="Весенняя рассылка")
+        PromoCode.objects.create(code="WINTER", description="Partner fair")
+        url = reverse("admin:core_promocode_changelist")
+        codes = lambda r: sorted(p.code for p in r.context["cl"].result_list)
+        self.assertEqual(codes(self.client.get(url, {"q": "SPR"})), ["SPRING25"])
+        self.assertEqual(codes(self.client.get(url, {"q": "FAIR"})), ["WINTER"])
+        self.assertEqual(codes(self.client.get(url, {"q": "рассылка"})), ["SPRING25"])
+
+
+class StartupTests(TestCase):
+    def test_setup_does_not_import_boto3(self):
+        code = "import sys, django; django.setup(); import core.views; print('boto3' in sys.modules)"
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "cloudstorage.settings"}
+        out = subprocess.run([sys.executable, "-c", code], cwd=settings.BASE_DIR, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        self.assertEqual(out.strip(), "False")
+
+    def test_warm_up_compiles_project_templates(self):
+        timings = warm_up()
+        self.assertEqual(list(timings), ["urls", "templates", "databases", "storage"])
+        loader = engines["django"].engine.template_loaders[0]
+        self.assertIn("files.html", loader.get_template_cache)
+
+
+@override_settings(EVENTS_HEARTBEAT=0.05, EVENTS_STREAM_TIMEOUT=0.3)
+@override_settings(EVENTS_ENABLED=True)
+class LiveEventsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="live@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+        self.obj = File.objects.create(owner=self.user, file=SimpleUploadedFile("notes.txt", b"hello"))
+
+    @staticmethod
+    def _frames(response):
+        body = b"".join(response.streaming_content).decode()
+        response.close()
+        frames = []
+        for block in body.split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+            if "event" in fields:
+                frames.append((fields["event"], fields.get("id"), json.loads(fields["data"])))
+        return frames
+
+    def test_stream_replays_missed_changes_then_pushes_live_ones(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("file_rename", args=[self.obj.pk]), {"name": "a.txt"})
+        response = self.client.get(reverse("events"), HTTP_LAST_EVENT_ID="0")
+        self.assertEqual(response["Content-Type"], "text/event-stream; charset=utf-8")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("file_delete", args=[self.obj.pk]))
+
+        frames = self._frames(response)
+        self.assertEqual([(e, i, d.get("kind")) for e, i, d in frames], [
+            ("change", "1", "rename"),
+            ("change", "2", "delete"),
+            ("usage", None, None),
+        ])
+        self.assertEqual(frames[2][2]["used"], 0)
+        self.assertFalse(broker.may_deliver(self.user.pk))
+
+    def test_upload_progress_reaches_the_stream(self):
+        response = self.client.get(reverse("events"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("upload") + "?upload_id=u1",
+                {"file": SimpleUploadedFile("big.bin", b"x" * 1000)},
+            )
+        frames = self._frames(response)
+        progress = [d for e, _, d in frames if e == "upload"]
+        self.assertEqual([(p["id"], p["state"]) for p in progress], [("u1", "running"), ("u1", "stored")])
+        self.assertEqual(progress[-1]["received"], 1000)
+        self.assertIn(("change", "1"), [(e, i) for e, i, _ in frames])
+
+    def test_pages_open_streams_only_when_enabled(self):
+        self.assertContains(self.client.get(reverse("files")), 'data-events="/events"')
+        with self.settings(EVENTS_ENABLED=False):
+            self.assertNotContains(self.client.get(reverse("files")), "data-events")
+            self.assertEqual(self.client.get(reverse("events")).status_code, 404)
+
+    def test_async_stream_wakes_on_events_from_other_threads(self):
+        subscription = broker.subscribe(self.user.pk)
+
+        async def collect():
+            frames = []
+            async for frame in astream(subscription, [], False, 0):
+                frames.append(frame)
+                if frame.startswith("retry"):
+                    threading.Timer(0.02, publish, (self.user.pk, "upload", {"id": "x"})).start()
+            return "".join(frames)
+
+        body = asyncio.run(collect())
+        self.assertIn('event: upload\ndata: {"id":"x"}', body)
+        self.assertFalse(broker.may_deliver(self.user.pk))
+
+
+class ServiceWorkerTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="sw@example.com", password="strong-pass")
+        self.client.force_login(self.user)
+        self.obj = File.objects.create(owner=self.user, file=SimpleUploadedFile("cat.png", b"png"))
+
+    def test_worker_script_lists_the_shell(self):
+        response = self.client.get(reverse("service_worker"))
+        self.assertEqual(response["Content-Type"], "text/javascript; charset=utf-8")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertContains(response, json.dumps(staticfiles_storage.url("css/base.css")))
+        self.assertContains(self.client.get(reverse("files")), 'data-sw="/sw.js"')
+
+    def test_library_pages_are_stamped_and_previews_keyed_by_content(self):
+        response = self.client.get(reverse("files"))
+        stamp = response["X-Library-Version"]
+        self.assertContains(response, self.obj.preview_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("file_rename", args=[self.obj.pk]), {"name": "dog.png"})
+        self.assertNotEqual(self.client.get(reverse("files"))["X-Library-Version"], stamp)
+
+        preview = self.obj.preview_url
+        with mock.patch("core.signing.time.time", return_value=time.time() + 3 * settings.DOWNLOAD_TOKEN_TTL):
+            later = self.obj.preview_url
+        self.assertNotEqual(later.split("?")[0], preview.split("?")[0])
+        self.assertEqual(later.split("?")[1], preview.split("?")[1])
+        self.obj.file.name = "other/key.png"
+        self.assertNotEqual(self.obj.preview_url.split("?")[1], preview.split("?")[1])
+
+        # A page showing one-off messages is not kept by the worker.
+        self.client.post(reverse("apply_promo_code"), {"code": "NOPE"})
+        self.assertNotIn("X-Library-Version", self.client.get(reverse("trash")))
+        self.assertIn("X-Library-Version", self.client.get(reverse("trash")))
+
+
+class UsageRollupTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="rollup@example.com", password="strong-pass", is_subscribed=True
+        )
+        self.client.force_login(self.user)
+
+    def upload(self, name, data, content_type, folder=None):
+        payload = SimpleUploadedFile(name, data, content_type=content_type)
+        self.client.post(reverse("upload"), {"file": payload, **({"folder": folder.pk} if folder else {})})
+        return File.objects.get(name=name)
+
+    def snapshot(self):
+        return sorted(
+            (r.family, r.month, r.live_bytes, r.live_files, r.trash_bytes, r.trash_files)
+            for r in UsageRollup.objects.filter(user=self.user)
+            if r.live_files or r.trash_files
+        )
+
+    def assert_matches_rebuild(self):
+        kept = self.snapshot()
+        call_command("rebuild_usage_rollups", "--user", str(self.user.pk), stdout=io.StringIO())
+        self.assertEqual(kept, self.snapshot())
+        return kept
+
+    def test_lifecycle_keeps_rollups_current(self):
+        folder = Folder.objects.create(owner=self.user, name="docs")
+        photo = self.upload("a.png", b"1234", "image/png")
+        self.upload("b.txt", b"12", "text/plain", folder)
+        self.upload("c.pdf", b"123", "application/pdf", folder)
+        month = timezone.localdate().replace(day=1)
+        self.assertEqual(self.assert_matches_rebuild(), [
+            ("document", month, 3, 1, 0, 0),
+            ("image", month, 4, 1, 0, 0),
+            ("text", month, 2, 1, 0, 0),
+        ])
+
+        self.client.post(reverse("file_delete", args=[photo.pk]))
+        self.client.post(reverse("folder_delete", args=[folder.pk]))
+        self.assertEqual(self.assert_matches_rebuild(), [
+            ("document", month, 0, 0, 3, 1),
+            ("image", month, 0, 0, 4, 1),
+            ("text", month, 0, 0, 2, 1),
+        ])
+
+        self.client.post(reverse("folder_restore", args=[folder.pk]))
+        self.client.post(reverse("file_purge", args=[photo.pk]))
+        self.client.post(reverse("file_duplicate", args=[File.objects.get(name="b.txt").pk]))
+        self.assertEqual(self.assert_matches_rebuild(), [
+            ("document", month, 3, 1, 0, 0),
+            ("text", month, 4, 2, 0, 0),
+        ])
+
+        self.client.post(reverse("folder_delete", args=[folder.pk]))
+        self.client.post(reverse("folder_purge", args=[folder.pk]))
+        self.assertEqual(self.assert_matches_rebuild(), [])
+
+    def test_report_and_rebuild_backfill(self):
+        old = File.objects.create(
+            owner=self.user,
+            file=SimpleUploadedFile("old.mp4", b"x" * 10, content_type="video/mp4"),
+            uploaded_at=timezone.now() - timedelta(days=62),
+            is_deleted=True,
+        )
+        File.objects.create(owner=self.user, file=SimpleUploadedFile("new.zip", b"x" * 5))
+        self.assertFalse(UsageRollup.objects.exists())
+
+        out = io.StringIO()
+        call_command("rebuild_usage_rollups", stdout=out)
+        self.assertIn("rollup rows: 2", out.getvalue())
+
+        data = self.client.get(reverse("usage_report")).json()
+        self.assertEqual(data["totals"], {"live_bytes": 5, "live_files": 1, "trash_bytes": 10, "trash_files": 1})
+        self.assertEqual([f["family"] for f in data["families"]], ["archive", "video"])
+        self.assertEqual(
+            [m["month"] for m in data["months"]],
+            [f"{timezone.localdate():%Y-%m}", f"{timezone.localtime(old.uploaded_at):%Y-%m}"],
+        )
+
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save(update_fields=["is_staff", "is_superuser"])
+        response = self.client.get(reverse("admin:core_usagerollup_changelist"), {"family": "video"})
+        self.assertEqual(response.context["cl"].result_count, 1)
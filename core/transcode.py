@@ -0,0 +1,153 @@
+import json
+import os
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import File as DjangoFile
+
+from .storage import is_s3
+
+# (height, video bitrate, audio bitrate); rungs taller than the source are
+# skipped, the lowest one is always produced.
+DEFAULT_LADDER = [
+    (360, 800_000, 96_000),
+    (720, 2_800_000, 128_000),
+    (1080, 5_000_000, 128_000),
+]
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def hls_prefix(name: str) -> str:
+    return os.path.splitext(name)[0] + ".hls/"
+
+
+def _ladder():
+    return getattr(settings, "HLS_LADDER", DEFAULT_LADDER)
+
+
+def source_url(storage, name):
+    # ffmpeg reads S3 objects over HTTP with range requests, so the original
+    # is never copied to local disk first.
+    if is_s3(storage):
+        return storage.url(name, expire=getattr(settings, "HLS_SOURCE_URL_TTL", 6 * 3600))
+    return storage.path(name)
+
+
+def ffprobe(source: str) -> dict:
+    result = subprocess.run(
+        [
+            getattr(settings, "FFPROBE_BINARY", "ffprobe"),
+            "-v", "error", "-print_format", "json", "-show_format", "-show_streams", source,
+        ],
+        capture_output=True,
+        check=False,
+        timeout=120,
+    )
+    if result.returncode != 0:
+        raise TranscodeError(result.stderr.decode(errors="replace")[-2000:] or "ffprobe failed")
+    return json.loads(result.stdout or b"{}")
+
+
+def probe(source: str) -> dict:
+    streams = ffprobe(source).get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise TranscodeError("no video stream")
+    return {
+        "height": int(video.get("height") or 0),
+        "audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+
+def plan_renditions(height: int):
+    ladder = sorted(_ladder())
+    rungs = [rung for rung in ladder if rung[0] <= height] or ladder[:1]
+    return [{"height": h, "bitrate": v, "audio_bitrate": a} for h, v, a in rungs]
+
+
+def build_command(source, outdir, renditions, audio, segment_seconds=6):
+    cmd = [
+        getattr(settings, "FFMPEG_BINARY", "ffmpeg"),
+        "-hide_banner", "-loglevel", "error", "-y", "-i", source,
+    ]
+    for _ in renditions:
+        cmd += ["-map", "0:v:0"]
+        if audio:
+            cmd += ["-map", "0:a:0"]
+    cmd += [
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-pix_fmt", "yuv420p",
+        "-sc_threshold", "0",
+        # Key frames on segment boundaries keep every rendition switchable.
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+    ]
+    for i, rendition in enumerate(renditions):
+        bitrate = rendition["bitrate"]
+        cmd += [
+            f"-filter:v:{i}", f"scale=-2:{rendition['height']}",
+            f"-b:v:{i}", str(bitrate),
+            f"-maxrate:v:{i}", str(int(bitrate * 1.07)),
+            f"-bufsize:v:{i}", str(int(bitrate * 1.5)),
+        ]
+        if audio:
+            cmd += [f"-b:a:{i}", str(rendition["audio_bitrate"])]
+    if audio:
+        cmd += ["-c:a", "aac", "-ac", "2"]
+    stream_map = " ".join(
+        f"v:{i},a:{i}" if audio else f"v:{i}" for i in range(len(renditions))
+    )
+    cmd += [
+        "-f", "hls",
+        "-hls_time", str(segment_seconds),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(outdir, "stream_%v", "seg_%05d.ts"),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", stream_map,
+        os.path.join(outdir, "stream_%v", "index.m3u8"),
+    ]
+    return cmd
+
+
+def _store_tree(storage, outdir, prefix):
+    for root, _, files in os.walk(outdir):
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            name = prefix + os.path.relpath(path, outdir).replace(os.sep, "/")
+            # Left over from an interrupted run of the same job.
+            if storage.exists(name):
+                storage.delete(name)
+            with open(path, "rb") as fh:
+                stored = storage.save(name, DjangoFile(fh, name=filename))
+            if stored != name:
+                storage.delete(stored)
+                raise TranscodeError(f"could not store {name}")
+
+
+def transcode(obj) -> tuple[str, list[dict]]:
+    """Produce HLS renditions for ``obj`` and store them next to it. Returns
+    the storage prefix and the renditions made."""
+    storage = obj.file.storage
+    source = source_url(storage, obj.file.name)
+    info = probe(source)
+    renditions = plan_renditions(info["height"])
+    prefix = hls_prefix(obj.file.name)
+    with tempfile.TemporaryDirectory(prefix="hls-") as outdir:
+        result = subprocess.run(
+            build_command(
+                source, outdir, renditions, info["audio"],
+                getattr(settings, "HLS_SEGMENT_SECONDS", 6),
+            ),
+            capture_output=True,
+            check=False,
+            timeout=getattr(settings, "HLS_TIMEOUT", 6 * 3600),
+        )
+        if result.returncode != 0:
+            raise TranscodeError(result.stderr.decode(errors="replace")[-2000:] or "ffmpeg failed")
+        if not os.path.exists(os.path.join(outdir, "master.m3u8")):
+            raise TranscodeError("ffmpeg produced no master playlist")
+        _store_tree(storage, outdir, prefix)
+    return prefix, renditions
@@ -0,0 +1,121 @@
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+
+from .compression import CompressingWriter, upload_codec
+from .storage import open_writer
+
+
+class StoredUploadedFile(UploadedFile):
+    """An upload that already lives in storage under ``stored_name``."""
+
+    def __init__(self, storage, stored_name, name, content_type, size, charset,
+                 content_type_extra=None, codec="", stored_size=None):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.storage = storage
+        self.stored_name = stored_name
+        self.codec = codec
+        self.stored_size = size if stored_size is None else stored_size
+
+    def open(self, mode="rb"):
+        self.file = self.storage.open(self.stored_name, mode)
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class StorageUploadHandler(FileUploadHandler):
+    """Pipes the ``field_name`` part of a multipart body into its final
+    storage location while it is being received, instead of spooling it to a
+    temp file first. Stored files that the view does not ``keep()`` are
+    removed by ``cleanup()``. With ``compress`` set, compressible types are
+    stored with the STORAGE_COMPRESSION codec; ``limit`` still counts the
+    uncompressed bytes. ``progress``, if given, is called as
+    ``progress(name, received, state)`` while the file arrives."""
+
+    QUOTA_EXCEEDED = "quota"
+
+    def __init__(self, request, instance, field_name="file", limit=None, compress=False, progress=None):
+        super().__init__(request)
+        self.instance = instance
+        self.field = instance._meta.get_field(field_name)
+        self.field_name = field_name
+        self.limit = limit
+        self.compress = compress
+        self.progress = progress
+        self.error = None
+        self.writer = None
+        self.received = 0
+        self._stored = []
+        self._kept = set()
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        if field_name != self.field_name:
+            return
+        name = self.field.generate_filename(self.instance, file_name)
+        self.writer = open_writer(self.field.storage, name)
+        codec = upload_codec(self.content_type, file_name) if self.compress else None
+        if codec is not None:
+            self.writer = CompressingWriter(self.writer, codec)
+        self.received = 0
+        if self.progress:
+            self.progress(self.file_name, 0)
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.writer is None:
+            return raw_data
+        self.received += len(raw_data)
+        if self.limit is not None and self.received > self.limit:
+            self.error = self.QUOTA_EXCEEDED
+            self._abort()
+            raise StopUpload(connection_reset=True)
+        self.writer.write(raw_data)
+        if self.progress:
+            self.progress(self.file_name, self.received)
+        return None
+
+    def file_complete(self, file_size):
+        if self.writer is None:
+            return None
+        writer, self.writer = self.writer, None
+        stored_name = writer.close()
+        codec = getattr(writer, "codec", None)
+        self._stored.append(stored_name)
+        if self.limit is not None:
+            self.limit -= file_size
+        if self.progress:
+            self.progress(self.file_name, file_size, "stored")
+        return StoredUploadedFile(
+            self.field.storage,
+            stored_name,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.content_type_extra,
+            codec=codec.name if codec else "",
+            stored_size=writer.stored_size if codec else file_size,
+        )
+
+    def upload_interrupted(self):
+        self._abort()
+
+    def _abort(self):
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
+            if self.progress:
+                self.progress(self.file_name, self.received, "failed")
+
+    def keep(self, uploaded):
+        self._kept.add(uploaded.stored_name)
+
+    def cleanup(self):
+        self._abort()
+        for name in self._stored:
+            if name not in self._kept:
+                self.field.storage.delete(name)
+        self._stored = []
@@ -4,14 +4,36 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('files', views.files, name='files'),
+    path('gallery', views.gallery, name='gallery'),
     path('trash', views.trash, name='trash'),
     path('pricing', views.pricing, name='pricing'),
     path('pricing/apply-promo', views.apply_promo_code, name='apply_promo_code'),
     path('upload', views.upload, name='upload'),
     path('d/<int:pk>', views.download, name='download'),
+    path('t/<str:token>', views.signed_download, name='signed_download'),
+    path('hls/<str:token>/<path:path>', views.hls_asset, name='hls_asset'),
     path('f/<int:pk>/delete', views.delete_file, name='file_delete'),
     path('f/<int:pk>/restore', views.restore_file, name='file_restore'),
     path('f/<int:pk>/purge', views.purge_file, name='file_purge'),
+    path('f/<int:pk>/rename', views.file_rename, name='file_rename'),
+    path('f/<int:pk>/move', views.file_move, name='file_move'),
+    path('f/<int:pk>/duplicate', views.file_duplicate, name='file_duplicate'),
+    path('f/<int:pk>/play', views.file_play, name='file_play'),
+    path('f/<int:pk>/archive', views.file_archive, name='file_archive'),
+    path('f/<int:pk>/archive/member', views.file_archive_member, name='file_archive_member'),
+    path('f/<int:pk>/delta', views.delta_plan, name='file_delta_plan'),
+    path('f/<int:pk>/delta/commit', views.delta_commit, name='file_delta_commit'),
+    path('folders/create', views.folder_create, name='folder_create'),
+    path('folders/<int:pk>/rename', views.folder_rename, name='folder_rename'),
+    path('folders/<int:pk>/move', views.folder_move, name='folder_move'),
+    path('folders/<int:pk>/delete', views.folder_delete, name='folder_delete'),
+    path('folders/<int:pk>/restore', views.folder_restore, name='folder_restore'),
+    path('folders/<int:pk>/purge', views.folder_purge, name='folder_purge'),
+    path('folders/<int:pk>/size', views.folder_size, name='folder_size'),
+    path('changes', views.changes, name='changes'),
+    path('usage', views.usage_report, name='usage_report'),
+    path('events', views.events, name='events'),
+    path('sw.js', views.service_worker, name='service_worker'),
     path('drop/upload/', views.drop_upload, name='drop_upload'),
     path('s/<str:token>/', views.drop_download, name='drop_download'),
     path('promo/generate', views.generate_promocodes, name='generate_promocodes'),
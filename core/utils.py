@@ -1,7 +1,13 @@
-from django.http import HttpResponseForbidden
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import content_disposition_header
 from functools import wraps
+import re
 
+from .compression import accepts_encoding, iter_decompressed
 from .models import DropFile
 
 def require_subscription(view):
@@ -13,7 +19,87 @@ def require_subscription(view):
     return wrapped
 
 
-def cleanup_expired_dropfiles():
+def cleanup_expired_dropfiles(force=False):
+    # The sweep is a full scan, so run it at most once per interval across
+    # all workers sharing the cache.
+    interval = getattr(settings, "DROP_CLEANUP_INTERVAL", 300)
+    if not force and not cache.add("drop:cleanup", 1, interval):
+        return
     expired = DropFile.objects.filter(expires_at__lt=timezone.now())
     for item in expired:
-        item.delete()
\ No newline at end of file
+        item.delete()
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _iter_range(fileobj, length, block_size=64 * 1024):
+    try:
+        while length > 0:
+            data = fileobj.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        fileobj.close()
+
+
+def ranged_file_response(request, fileobj, size, content_type, filename, as_attachment=True):
+    """FileResponse with single byte-range support, so media elements can seek."""
+    match = RANGE_RE.match(request.headers.get("Range", ""))
+    if not match or not size or match.groups() == ("", ""):
+        response = FileResponse(
+            fileobj,
+            as_attachment=as_attachment,
+            filename=filename,
+            content_type=content_type,
+        )
+        response["Accept-Ranges"] = "bytes"
+        return response
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end:
+        fileobj.close()
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    fileobj.seek(start)
+    response = StreamingHttpResponse(
+        _iter_range(fileobj, end - start + 1),
+        status=206,
+        content_type=content_type or "application/octet-stream",
+    )
+    response["Content-Length"] = str(end - start + 1)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    response["Content-Disposition"] = content_disposition_header(as_attachment, filename)
+    return response
+
+def encoded_file_response(request, fileobj, codec, size, content_type, filename, as_attachment=True):
+    """Response for an object stored compressed with ``codec``: passed through
+    with Content-Encoding when the client accepts it, decoded while streaming
+    otherwise. Byte ranges are not offered for these."""
+    if accepts_encoding(request, codec.content_encoding):
+        response = FileResponse(
+            fileobj,
+            as_attachment=as_attachment,
+            filename=filename,
+            content_type=content_type,
+        )
+        response["Content-Encoding"] = codec.content_encoding
+    else:
+        response = StreamingHttpResponse(
+            iter_decompressed(fileobj, codec),
+            content_type=content_type or "application/octet-stream",
+        )
+        response["Content-Length"] = str(size)
+        response["Content-Disposition"] = content_disposition_header(as_attachment, filename)
+    response["Accept-Ranges"] = "none"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
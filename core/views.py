@@ -1,19 +1,57 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal, ROUND_HALF_UP
+import hashlib
+import json
+import os
+import re
+import time
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.db import IntegrityError, transaction
-from django.db.models import Sum
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q, Sum
 from django.shortcuts import render, redirect
-from django.http import FileResponse, Http404, JsonResponse
+from django.templatetags.static import static
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.utils import timezone
-from django.views.decorators.csrf import ensure_csrf_cookie
+from django.utils.cache import patch_cache_control
+from django.utils.functional import cached_property
+from django.utils.http import content_disposition_header, http_date
+from django.views.decorators.csrf import csrf_exempt, csrf_protect, ensure_csrf_cookie
 from django.views.decorators.http import require_POST
 
-from .models import DropFile, File, PromoCode, PromoRedemption
-from .forms import PromoCodeApplyForm, PromoCodeGenerateForm, UploadForm
-from .utils import cleanup_expired_dropfiles, require_subscription
+from . import delta, rollups
+from .admission import admission, client_ip
+from .archives import ArchiveError, list_archive, open_member
+from .compression import get_codec
+from .events import UploadProgress, astream, broker, stream
+from .library import fragment_context
+from .models import (
+    ChangeEvent,
+    DropFile,
+    File,
+    Folder,
+    MediaInfo,
+    PromoCode,
+    PromoRedemption,
+    Transcode,
+    UsageRollup,
+)
+from .forms import FileNameForm, FolderForm, PromoCodeApplyForm, PromoCodeGenerateForm, UploadForm
+from .signing import HLS_SALT, hls_url, read_download_token
+from .storage import is_s3
+from .uploadhandlers import StorageUploadHandler, StoredUploadedFile
+from .utils import (
+    cleanup_expired_dropfiles,
+    encoded_file_response,
+    ranged_file_response,
+    require_subscription,
+)
 
 
 @ensure_csrf_cookie
@@ -161,67 +199,448 @@ def generate_promocodes(request):
         'active_menu': 'pricing',
     })
 
+def _get_folder(user, pk, **filters):
+    try:
+        return Folder.objects.get(pk=pk, owner=user, **filters)
+    except (Folder.DoesNotExist, ValueError, TypeError):
+        raise Http404("Folder not found")
+
+
+LIBRARY_VERSION_HEADER = "X-Library-Version"
+SERVICE_WORKER_SHELL = (
+    "css/base.css", "css/files.css", "css/trash.css",
+    "js/base.js", "js/files.js", "js/trash.js", "favicon.ico",
+)
+
+
+def _stamp_library_page(request, response, fragment):
+    # The service worker keeps only pages carrying the stamp and compares it
+    # to tell a stale copy. Pages showing messages are one-off and unstamped.
+    if not len(messages.get_messages(request)):
+        response[LIBRARY_VERSION_HEADER] = f"{fragment['library_version']}.{fragment['url_window']}"
+    return response
+
+
+def service_worker(request):
+    shell = [static(name) for name in SERVICE_WORKER_SHELL]
+    config = {
+        # Hashed static names change with their content, so the list of
+        # them versions the shell cache.
+        "version": hashlib.sha256("\n".join(shell).encode()).hexdigest()[:12],
+        "immutable": bool(getattr(staticfiles_storage, "hashed_files", None)),
+        "shell": shell,
+        "static": settings.STATIC_URL,
+        "pages": [reverse("files"), reverse("trash")],
+        "account": reverse("account_login").rsplit("/", 2)[0] + "/",
+        "header": LIBRARY_VERSION_HEADER,
+        "previewLimit": getattr(settings, "SERVICE_WORKER_PREVIEW_LIMIT", 500),
+    }
+    response = render(request, "sw.js", {"config": json.dumps(config)}, content_type="text/javascript; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+FILES_PAGE_SIZE = 60
+
+
+class _FilePage:
+    """One page of a folder listing, read only when the template iterates
+    it, i.e. when the cached grid fragment is missing or stale."""
+
+    def __init__(self, qs, size):
+        self.qs = qs
+        self.size = size
+
+    @cached_property
+    def _rows(self):
+        return list(self.qs[: self.size + 1])
+
+    def __iter__(self):
+        return iter(self._rows[: self.size])
+
+    def __len__(self):
+        return min(len(self._rows), self.size)
+
+    @property
+    def next_cursor(self) -> str:
+        if len(self._rows) <= self.size:
+            return ""
+        last = self._rows[self.size - 1]
+        return _keyset_cursor(last.uploaded_at, last.pk)
+
+
 @login_required
 def files(request):
-    qs = File.objects.filter(owner=request.user, is_deleted=False).order_by('-uploaded_at')
-    used = qs.aggregate(s=Sum('size'))['s'] or 0
+    folder = None
+    breadcrumbs = []
+    if request.GET.get("folder"):
+        folder = _get_folder(request.user, request.GET["folder"], is_deleted=False)
+        breadcrumbs = list(folder.ancestors())
+    active_qs = File.objects.filter(owner=request.user, is_deleted=False)
+    used = active_qs.aggregate(s=Sum('size'))['s'] or 0
     quota = request.user.storage_quota
     percent = 0 if quota == 0 else min(int(used * 100 / quota), 100)
-    recent = list(qs[:12])
-    return render(request, 'files.html', {
+    # Left lazy: they are only evaluated when the cached grid fragment in
+    # the template is missing or stale.
+    qs = active_qs.filter(folder=folder).order_by('-uploaded_at', '-pk')
+    cursor = request.GET.get("before", "") if folder else ""
+    if folder is None:
+        recent = qs[:12]
+    else:
+        if cursor:
+            try:
+                uploaded, pk = _parse_keyset_cursor(cursor)
+            except ValueError:
+                return JsonResponse({"error": "invalid cursor"}, status=400)
+            qs = qs.filter(Q(uploaded_at__lt=uploaded) | Q(uploaded_at=uploaded, pk__lt=pk))
+        recent = _FilePage(qs, FILES_PAGE_SIZE)
+    folders = Folder.objects.filter(owner=request.user, parent=folder, is_deleted=False)
+    fragment = fragment_context(request.user.pk)
+    response = render(request, 'files.html', {
         'recent': recent,
+        'folders': folders,
+        'folder': folder,
+        'cursor': cursor,
+        'breadcrumbs': breadcrumbs,
+        'section_title': folder.name if folder else None,
         'used': used,
         'quota': quota,
         'percent': percent,
         'active_menu': 'files',
+        **fragment,
     })
+    return _stamp_library_page(request, response, fragment)
+
+GALLERY_PAGE_SIZE = 60
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
 
+def _keyset_cursor(moment, pk) -> str:
+    # Exact microseconds, so the keyset comparison never skips a row.
+    return f"{(moment - _EPOCH) // timedelta(microseconds=1)}_{pk}"
+
+
+def _parse_keyset_cursor(value):
+    micros, pk = (int(part) for part in value.split("_"))
+    return _EPOCH + timedelta(microseconds=micros), pk
+
+
+def _gallery_cursor(media) -> str:
+    return _keyset_cursor(media.taken_at, media.file_id)
+
+
+@login_required
+def gallery(request):
+    # Served from the MediaInfo index only: ordering, grouping and paging
+    # never touch storage.
+    qs = (
+        MediaInfo.objects.filter(owner=request.user, file__is_deleted=False)
+        .select_related("file")
+        .order_by("-taken_at", "-file_id")
+    )
+    if request.GET.get("before"):
+        try:
+            taken, pk = _parse_keyset_cursor(request.GET["before"])
+        except ValueError:
+            return JsonResponse({"error": "invalid cursor"}, status=400)
+        qs = qs.filter(Q(taken_at__lt=taken) | Q(taken_at=taken, file_id__lt=pk))
+    items = list(qs[: GALLERY_PAGE_SIZE + 1])
+    has_more = len(items) > GALLERY_PAGE_SIZE
+    items = items[:GALLERY_PAGE_SIZE]
+    cursor = _gallery_cursor(items[-1]) if has_more else ""
+    groups = []
+    for media in items:
+        day = timezone.localtime(media.taken_at).date()
+        if not groups or groups[-1][0] != day:
+            groups.append((day, []))
+        groups[-1][1].append(media)
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "groups": [
+                {
+                    "date": day.isoformat(),
+                    "items": [
+                        {
+                            "id": m.file_id,
+                            "name": m.file.name,
+                            "taken_at": m.taken_at.isoformat(),
+                            "width": m.display_size[0],
+                            "height": m.display_size[1],
+                            "duration": m.duration,
+                            "kind": "video" if m.file.is_video else "image",
+                        }
+                        for m in group
+                    ],
+                }
+                for day, group in groups
+            ],
+            "next": cursor,
+        })
+    return render(request, "gallery.html", {
+        "groups": groups,
+        "next_cursor": cursor,
+        "active_menu": "gallery",
+    })
+
+
+# Multipart framing around the file part; Content-Length above the remaining
+# quota by more than this is rejected before the body is read.
+UPLOAD_OVERHEAD = 64 * 1024
+
+
+def _content_length(request) -> int:
+    try:
+        return int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return 0
+
+
+UPLOAD_ID_RE = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+
+
+def _upload_progress(request):
+    # The page picks an id and passes it in the query string, so it can
+    # match the "upload" events on its event stream to this request.
+    upload_id = request.GET.get("upload_id", "")
+    if not UPLOAD_ID_RE.match(upload_id):
+        return None
+    return UploadProgress(request.user.pk, upload_id, _content_length(request))
+
+
+def _stream_uploads(request, instance, limit=None, compress=False, progress=None):
+    # Must run before anything touches request.POST/FILES, which is why the
+    # upload views are csrf_exempt and re-apply CSRF checks on the inner view.
+    handler = StorageUploadHandler(request, instance, limit=limit, compress=compress, progress=progress)
+    request.upload_handlers.insert(0, handler)
+    return handler
+
+
+@csrf_exempt
 @login_required
 @require_subscription
 def upload(request):
+    handler = None
+    if request.method == "POST":
+        used = (
+            File.objects.filter(owner=request.user, is_deleted=False)
+            .aggregate(s=Sum('size'))['s'] or 0
+        )
+        remaining = max(request.user.storage_quota - used, 0)
+        if _content_length(request) > remaining + UPLOAD_OVERHEAD:
+            messages.error(request, "Недостаточно места в хранилище.")
+            return redirect('upload')
+        handler = _stream_uploads(
+            request, File(owner=request.user), limit=remaining, compress=True,
+            progress=_upload_progress(request),
+        )
+    try:
+        return _upload(request, handler)
+    finally:
+        if handler:
+            handler.cleanup()
+
+
+@csrf_protect
+def _upload(request, handler):
+    folder = None
+    folder_id = request.POST.get("folder") or request.GET.get("folder")
+    if folder_id:
+        folder = _get_folder(request.user, folder_id, is_deleted=False)
     if request.method == "POST":
+        if handler.error == StorageUploadHandler.QUOTA_EXCEEDED:
+            messages.error(request, "Недостаточно места в хранилище.")
+            return redirect('upload')
         form = UploadForm(request.POST, request.FILES)
         if form.is_valid():
             f = form.cleaned_data["file"]
             obj = File(
                 owner=request.user,
-                file=f,
+                folder=folder,
+                file=f.stored_name if isinstance(f, StoredUploadedFile) else f,
                 name=getattr(f, "name", ""),
                 size=getattr(f, "size", 0),
+                codec=getattr(f, "codec", ""),
+                stored_size=getattr(f, "stored_size", 0) or 0,
                 content_type=getattr(f, "content_type", "") or "",
             )
-            obj.save()
+            with transaction.atomic():
+                obj.save()
+                ChangeEvent.record(request.user.pk, ChangeEvent.CREATE, obj)
+                rollups.apply(request.user.pk, added=[rollups.file_row(obj)])
+                if obj.is_video:
+                    Transcode.objects.create(file=obj)
+                if obj.is_image or obj.is_video:
+                    MediaInfo.objects.create(file=obj, owner=request.user, taken_at=obj.uploaded_at)
+            if isinstance(f, StoredUploadedFile):
+                handler.keep(f)
             messages.success(request, "Файл загружен.")
+            if folder:
+                return redirect(f"{reverse('files')}?folder={folder.pk}")
             return redirect('files')
     else:
         form = UploadForm()
-    return render(request, 'upload.html', {"form": form})
+    return render(request, 'upload.html', {"form": form, "folder": folder})
 
 @login_required
+@admission("download")
 def download(request, pk: int):
     try:
         obj = File.objects.get(pk=pk, owner=request.user, is_deleted=False)
     except File.DoesNotExist:
         raise Http404("File not found")
+    if obj.codec:
+        return encoded_file_response(
+            request,
+            obj.file.open("rb"),
+            get_codec(obj.codec),
+            obj.size,
+            obj.content_type or None,
+            obj.name,
+        )
     resp = FileResponse(obj.file.open("rb"), as_attachment=True, filename=obj.name)
     return resp
 
 
+def _presigned_url(token, storage, payload, as_attachment, content_type, remaining):
+    # Presigning is local HMAC work, but a page of thumbnails asks for dozens
+    # at once; each URL is reused until shortly before it would expire.
+    key = "presign:" + hashlib.sha256(token.encode()).hexdigest()
+    url = cache.get(key)
+    if url is None:
+        url = storage.url(
+            payload["k"],
+            parameters={
+                "ResponseContentDisposition": content_disposition_header(
+                    as_attachment, payload["n"]
+                ),
+                "ResponseContentType": content_type,
+            },
+            expire=remaining,
+        )
+        timeout = remaining - getattr(settings, "PRESIGN_CACHE_MARGIN", 60)
+        if timeout > 0:
+            cache.set(key, url, timeout)
+    return url
+
+
+def _signed_download_scope(request, token):
+    payload = read_download_token(token)
+    if request.headers.get("Range") or (payload is not None and payload["d"]):
+        return "inline"
+    return "download"
+
+
+def _signed_download_clients(request, token):
+    # Charged to the link's owner rather than request.user, which would cost
+    # a session and a user query.
+    clients = [f"ip:{client_ip(request)}"]
+    payload = read_download_token(token)
+    if payload is not None:
+        clients.append(f"user:{payload['o']}")
+    return clients
+
+
+@admission(_signed_download_scope, clients=_signed_download_clients)
+def signed_download(request, token):
+    # Everything needed is inside the signed token: no session, user or File
+    # lookup happens here.
+    payload = read_download_token(token)
+    if payload is None:
+        raise Http404("Ссылка недействительна")
+    storage = File._meta.get_field("file").storage
+    as_attachment = not payload["d"]
+    content_type = payload["t"] or "application/octet-stream"
+    remaining = max(int(payload["e"] - time.time()), 0)
+    codec = get_codec(payload.get("c", ""))
+    # Compressed objects go through here so they can be decoded for clients
+    # that do not accept the codec; a presigned URL would hand out raw bytes.
+    if is_s3(storage) and codec is None:
+        response = redirect(_presigned_url(token, storage, payload, as_attachment, content_type, remaining))
+    else:
+        try:
+            fileobj = storage.open(payload["k"], "rb")
+        except FileNotFoundError:
+            raise Http404("File not found")
+        if codec is not None:
+            response = encoded_file_response(
+                request, fileobj, codec, payload["s"], content_type, payload["n"], as_attachment
+            )
+        else:
+            response = ranged_file_response(
+                request, fileobj, payload["s"], content_type, payload["n"], as_attachment
+            )
+    patch_cache_control(response, private=True, max_age=remaining)
+    return response
+
+
+HLS_PATH_RE = re.compile(r"^(master\.m3u8|stream_\d+/(index\.m3u8|seg_\d+\.ts))$")
+HLS_CONTENT_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/mp2t"}
+
+
+def hls_asset(request, token, path):
+    # Like signed_download: the token carries the rendition prefix, so
+    # playlists and segments are served without touching the database.
+    payload = read_download_token(token, salt=HLS_SALT)
+    if payload is None or not HLS_PATH_RE.match(path):
+        raise Http404("Ссылка недействительна")
+    storage = File._meta.get_field("file").storage
+    name = payload["p"] + path
+    content_type = HLS_CONTENT_TYPES[os.path.splitext(path)[1]]
+    remaining = max(int(payload["e"] - time.time()), 0)
+    if is_s3(storage) and path.endswith(".ts"):
+        response = redirect(storage.url(
+            name, parameters={"ResponseContentType": content_type}, expire=remaining
+        ))
+    else:
+        try:
+            fileobj = storage.open(name, "rb")
+        except FileNotFoundError:
+            raise Http404("File not found")
+        response = FileResponse(fileobj, content_type=content_type)
+    patch_cache_control(response, private=True, max_age=remaining)
+    return response
+
+
+@login_required
+def file_play(request, pk: int):
+    obj = _get_file(request.user, pk)
+    job = Transcode.objects.filter(file=obj).first()
+    return render(request, "video.html", {
+        "file": obj,
+        "hls_url": hls_url(job) if job and job.is_ready else "",
+        "transcode": job,
+        "active_menu": "files",
+    })
+
+
 @login_required
 def trash(request):
-    qs = File.objects.filter(owner=request.user, is_deleted=True).order_by('-deleted_at')
+    # Items trashed together with a folder are shown through that folder.
+    qs = (
+        File.objects.filter(owner=request.user, is_deleted=True)
+        .exclude(folder__is_deleted=True)
+        .order_by('-deleted_at')
+    )
+    folders = (
+        Folder.objects.filter(owner=request.user, is_deleted=True)
+        .exclude(parent__is_deleted=True)
+        .order_by('-deleted_at')
+    )
     active_qs = File.objects.filter(owner=request.user, is_deleted=False)
     used = active_qs.aggregate(s=Sum('size'))['s'] or 0
     quota = request.user.storage_quota
     percent = 0 if quota == 0 else min(int(used * 100 / quota), 100)
-    trashed = list(qs)
-    return render(request, 'trash.html', {
-        'items': trashed,
+    fragment = fragment_context(request.user.pk)
+    response = render(request, 'trash.html', {
+        'items': qs,
+        'folders': folders,
         'used': used,
         'quota': quota,
         'percent': percent,
         'active_menu': 'trash',
+        **fragment,
     })
+    return _stamp_library_page(request, response, fragment)
 
 
 @login_required
@@ -231,25 +650,42 @@ def delete_file(request, pk: int):
         obj = File.objects.get(pk=pk, owner=request.user, is_deleted=False)
     except File.DoesNotExist:
         raise Http404("File not found")
-    obj.is_deleted = True
-    obj.deleted_at = timezone.now()
-    obj.save(update_fields=["is_deleted", "deleted_at"])
+    obj.trash()
     return JsonResponse({"status": "ok"})
 
 
+@csrf_exempt
 @require_POST
+@admission("drop_upload", as_json=True)
 def drop_upload(request):
+    # Rejected from the header alone, before any of the body is read; the
+    # handler limit catches bodies longer than they claimed.
+    max_size = settings.DROP_MAX_UPLOAD_SIZE
+    if _content_length(request) > max_size + UPLOAD_OVERHEAD:
+        return JsonResponse({"error": "Файл слишком большой"}, status=413)
     cleanup_expired_dropfiles()
+    obj = DropFile()
+    handler = _stream_uploads(request, obj, limit=max_size)
+    try:
+        return _drop_upload(request, obj, handler)
+    finally:
+        handler.cleanup()
+
+
+@csrf_protect
+def _drop_upload(request, obj, handler):
     uploaded = request.FILES.get("file")
+    if handler.error == StorageUploadHandler.QUOTA_EXCEEDED:
+        return JsonResponse({"error": "Файл слишком большой"}, status=413)
     if not uploaded:
         return JsonResponse({"error": "Файл не найден"}, status=400)
-    obj = DropFile(
-        file=uploaded,
-        name=getattr(uploaded, "name", ""),
-        size=getattr(uploaded, "size", 0),
-        content_type=getattr(uploaded, "content_type", "") or "",
-    )
+    obj.file = uploaded.stored_name if isinstance(uploaded, StoredUploadedFile) else uploaded
+    obj.name = getattr(uploaded, "name", "")
+    obj.size = getattr(uploaded, "size", 0)
+    obj.content_type = getattr(uploaded, "content_type", "") or ""
     obj.save()
+    if isinstance(uploaded, StoredUploadedFile):
+        handler.keep(uploaded)
     download_url = request.build_absolute_uri(reverse('drop_download', args=[obj.token]))
     return JsonResponse({
         "url": download_url,
@@ -259,22 +695,31 @@ def drop_upload(request):
     })
 
 
+@admission("download")
 def drop_download(request, token):
     cleanup_expired_dropfiles()
-    try:
-        obj = DropFile.objects.get(token=token)
-    except DropFile.DoesNotExist:
+    meta = DropFile.resolve(token)
+    if meta is None:
         raise Http404("Ссылка не найдена")
-    if obj.is_expired:
-        obj.delete()
+    remaining = int(meta["expires_at"] - time.time())
+    if remaining <= 0:
+        for obj in DropFile.objects.filter(token=token):
+            obj.delete()
         raise Http404("Ссылка устарела")
-    response = FileResponse(
-        obj.file.open("rb"),
-        as_attachment=True,
-        filename=obj.name or obj.file.name,
+    storage = DropFile._meta.get_field("file").storage
+    try:
+        fileobj = storage.open(meta["key"], "rb")
+    except FileNotFoundError:
+        raise Http404("Ссылка не найдена")
+    response = ranged_file_response(
+        request,
+        fileobj,
+        meta["size"],
+        meta["content_type"] or None,
+        meta["name"] or os.path.basename(meta["key"]),
     )
-    if obj.content_type:
-        response["Content-Type"] = obj.content_type
+    patch_cache_control(response, public=True, max_age=remaining)
+    response["Expires"] = http_date(meta["expires_at"])
     return response
 
 
@@ -285,9 +730,7 @@ def restore_file(request, pk: int):
         obj = File.objects.get(pk=pk, owner=request.user, is_deleted=True)
     except File.DoesNotExist:
         raise Http404("File not found")
-    obj.is_deleted = False
-    obj.deleted_at = None
-    obj.save(update_fields=["is_deleted", "deleted_at"])
+    obj.restore()
     return JsonResponse({"status": "ok"})
 
 
@@ -298,7 +741,327 @@ def purge_file(request, pk: int):
         obj = File.objects.get(pk=pk, owner=request.user, is_deleted=True)
     except File.DoesNotExist:
         raise Http404("File not found")
-    if obj.file:
-        obj.file.delete(save=False)
-    obj.delete()
-    return JsonResponse({"status": "ok"})
\ No newline at end of file
+    obj.purge()
+    return JsonResponse({"status": "ok"})
+
+
+@login_required
+@require_POST
+def folder_create(request):
+    form = FolderForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"error": "Введите название папки"}, status=400)
+    parent = None
+    if request.POST.get("parent"):
+        parent = _get_folder(request.user, request.POST["parent"], is_deleted=False)
+        if not Folder.fits_under(parent):
+            return JsonResponse({"error": "Слишком глубокая вложенность"}, status=400)
+    with transaction.atomic():
+        folder = Folder.objects.create(
+            owner=request.user,
+            parent=parent,
+            name=form.cleaned_data["name"],
+        )
+        ChangeEvent.record(request.user.pk, ChangeEvent.CREATE, folder)
+    return JsonResponse({
+        "status": "ok",
+        "id": folder.pk,
+        "name": folder.name,
+        "url": f"{reverse('files')}?folder={folder.pk}",
+    })
+
+
+@login_required
+@require_POST
+def folder_rename(request, pk: int):
+    folder = _get_folder(request.user, pk, is_deleted=False)
+    form = FolderForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"error": "Введите название папки"}, status=400)
+    folder.name = form.cleaned_data["name"]
+    with transaction.atomic():
+        folder.save(update_fields=["name"])
+        ChangeEvent.record(request.user.pk, ChangeEvent.RENAME, folder)
+    return JsonResponse({"status": "ok", "name": folder.name})
+
+
+@login_required
+@require_POST
+def folder_move(request, pk: int):
+    folder = _get_folder(request.user, pk, is_deleted=False)
+    parent = None
+    if request.POST.get("parent"):
+        parent = _get_folder(request.user, request.POST["parent"], is_deleted=False)
+    if not folder.can_move_to(parent):
+        return JsonResponse({"error": "Нельзя переместить папку сюда"}, status=400)
+    folder.move_to(parent)
+    return JsonResponse({"status": "ok"})
+
+
+@login_required
+@require_POST
+def folder_delete(request, pk: int):
+    folder = _get_folder(request.user, pk, is_deleted=False)
+    folder.trash()
+    return JsonResponse({"status": "ok"})
+
+
+@login_required
+@require_POST
+def folder_restore(request, pk: int):
+    folder = _get_folder(request.user, pk, is_deleted=True)
+    folder.restore()
+    return JsonResponse({"status": "ok"})
+
+
+@login_required
+@require_POST
+def folder_purge(request, pk: int):
+    folder = _get_folder(request.user, pk, is_deleted=True)
+    folder.purge()
+    return JsonResponse({"status": "ok"})
+
+
+@login_required
+def folder_size(request, pk: int):
+    folder = _get_folder(request.user, pk)
+    return JsonResponse({"id": folder.pk, "size": folder.total_size()})
+
+
+CHANGES_PAGE_SIZE = 500
+
+
+@login_required
+def changes(request):
+    try:
+        since = max(int(request.GET.get("since", 0)), 0)
+        limit = min(max(int(request.GET.get("limit", CHANGES_PAGE_SIZE)), 1), CHANGES_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "invalid cursor"}, status=400)
+    events = list(
+        ChangeEvent.objects.filter(user=request.user, seq__gt=since).order_by("seq")[: limit + 1]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+    return JsonResponse({
+        "changes": [event.as_dict() for event in events],
+        "cursor": events[-1].seq if events else since,
+        "has_more": has_more,
+    })
+
+
+@login_required
+def usage_report(request):
+    """The user's storage broken down by content type family and upload
+    month, live and in the trash, read from the usage rollups."""
+    rows = [row.as_dict() for row in UsageRollup.objects.filter(user=request.user).order_by("-month", "family")]
+    by_family, by_month = {}, {}
+    totals = dict.fromkeys(rollups.FIELDS, 0)
+    for row in rows:
+        for key, group in ((row["family"], by_family), (row["month"], by_month)):
+            bucket = group.setdefault(key, dict.fromkeys(rollups.FIELDS, 0))
+            for field in rollups.FIELDS:
+                bucket[field] += row[field]
+        for field in rollups.FIELDS:
+            totals[field] += row[field]
+    return JsonResponse({
+        "totals": totals,
+        "families": [{"family": key, **value} for key, value in sorted(by_family.items())],
+        "months": [{"month": key, **value} for key, value in by_month.items()],
+        "rows": rows,
+    })
+
+
+@login_required
+def events(request):
+    """Server-Sent Events stream of the user's library changes, usage and
+    upload progress. A reconnecting client sends Last-Event-ID and first
+    gets the changes it missed from the change log."""
+    if not settings.EVENTS_ENABLED:
+        raise Http404("Live updates are off")
+    try:
+        since = int(request.headers.get("Last-Event-ID") or request.GET.get("since") or -1)
+    except ValueError:
+        return JsonResponse({"error": "invalid cursor"}, status=400)
+    # Subscribed before the backlog is read, so nothing falls in between.
+    subscription = broker.subscribe(request.user.pk)
+    backlog, has_more = [], False
+    if since >= 0:
+        backlog = list(
+            ChangeEvent.objects.filter(user=request.user, seq__gt=since).order_by("seq")[: CHANGES_PAGE_SIZE + 1]
+        )
+        has_more = len(backlog) > CHANGES_PAGE_SIZE
+        backlog = backlog[:CHANGES_PAGE_SIZE]
+    if isinstance(request, ASGIRequest):
+        body = astream(subscription, backlog, has_more, max(since, 0))
+    else:
+        # A WSGI stream holds its thread for its whole life; it must not
+        # hold a database connection as well.
+        for connection in connections.all(initialized_only=True):
+            if not connection.in_atomic_block:
+                connection.close()
+        body = stream(subscription, backlog, has_more, max(since, 0))
+    response = StreamingHttpResponse(body, content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    response._resource_closers.append(subscription.close)
+    return response
+
+
+def _get_file(user, pk):
+    try:
+        return File.objects.get(pk=pk, owner=user, is_deleted=False)
+    except File.DoesNotExist:
+        raise Http404("File not found")
+
+
+def _copy_name(name):
+    stem, ext = os.path.splitext(name)
+    return f"{stem} (копия){ext}"
+
+
+@login_required
+@require_POST
+def file_rename(request, pk: int):
+    obj = _get_file(request.user, pk)
+    form = FileNameForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"error": form.errors["name"][0]}, status=400)
+    obj.rename(form.cleaned_data["name"])
+    return JsonResponse({"status": "ok", "name": obj.name})
+
+
+@login_required
+@require_POST
+def file_move(request, pk: int):
+    obj = _get_file(request.user, pk)
+    folder = None
+    if request.POST.get("folder"):
+        folder = _get_folder(request.user, request.POST["folder"], is_deleted=False)
+    obj.move_to(folder)
+    return JsonResponse({"status": "ok"})
+
+
+@login_required
+@require_subscription
+@require_POST
+def file_duplicate(request, pk: int):
+    obj = _get_file(request.user, pk)
+    used = (
+        File.objects.filter(owner=request.user, is_deleted=False)
+        .aggregate(s=Sum('size'))['s'] or 0
+    )
+    if used + obj.size > request.user.storage_quota:
+        return JsonResponse({"error": "Недостаточно места в хранилище."}, status=400)
+    copy = obj.duplicate(_copy_name(obj.name))
+    return JsonResponse({"status": "ok", "id": copy.pk, "name": copy.name})
+
+
+@login_required
+def file_archive(request, pk: int):
+    obj = _get_file(request.user, pk)
+    try:
+        listing = list_archive(obj)
+    except ArchiveError:
+        if request.GET.get("format") == "json":
+            return JsonResponse({"error": "Формат архива не поддерживается"}, status=400)
+        return render(request, "archive.html", {
+            "file": obj, "error": "Формат архива не поддерживается", "active_menu": "files",
+        })
+    if request.GET.get("format") == "json":
+        return JsonResponse(listing)
+    return render(request, "archive.html", {"file": obj, "listing": listing, "active_menu": "files"})
+
+
+@login_required
+@admission("download")
+def file_archive_member(request, pk: int):
+    obj = _get_file(request.user, pk)
+    name = request.GET.get("name", "")
+    try:
+        stream, size = open_member(obj, name)
+    except ArchiveError:
+        raise Http404("File not found")
+    response = FileResponse(stream, as_attachment=True, filename=os.path.basename(name.rstrip("/")))
+    response["Content-Length"] = str(size)
+    return response
+
+
+@login_required
+@require_subscription
+@require_POST
+def delta_plan(request, pk: int):
+    obj = _get_file(request.user, pk)
+    if obj.codec:
+        return JsonResponse({"error": "compressed files take full uploads only"}, status=400)
+    try:
+        payload = json.loads(request.body or b"{}")
+        manifest = delta.parse_manifest(payload.get("chunks"))
+    except (ValueError, AttributeError, delta.DeltaError):
+        return JsonResponse({"error": "invalid manifest"}, status=400)
+    rows = delta.load_manifest(obj)
+    known = delta.chunk_index(rows)
+    missing = []
+    upload_bytes = 0
+    for item in manifest:
+        if item["digest"] in known or item["digest"] in missing:
+            continue
+        missing.append(item["digest"])
+        upload_bytes += item["size"]
+    return JsonResponse({
+        "base": delta.manifest_version(rows),
+        "missing": missing,
+        "upload_bytes": upload_bytes,
+        "total_bytes": sum(item["size"] for item in manifest),
+    })
+
+
+@login_required
+@require_subscription
+@require_POST
+def delta_commit(request, pk: int):
+    obj = _get_file(request.user, pk)
+    if obj.codec:
+        return JsonResponse({"error": "compressed files take full uploads only"}, status=400)
+    rows = delta.load_manifest(obj)
+    if request.POST.get("base") != delta.manifest_version(rows):
+        return JsonResponse({"error": "file changed, request a new plan"}, status=409)
+    try:
+        manifest = delta.parse_manifest(request.POST.get("manifest"))
+        segments = delta.build_plan(manifest, delta.chunk_index(rows), request.FILES)
+    except delta.DeltaError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    old_size = obj.size
+    new_size = sum(item["size"] for item in manifest)
+    if new_size > old_size:
+        used = (
+            File.objects.filter(owner=request.user, is_deleted=False)
+            .aggregate(s=Sum('size'))['s'] or 0
+        )
+        if used + new_size - old_size > request.user.storage_quota:
+            return JsonResponse({"error": "Недостаточно места в хранилище."}, status=400)
+    storage = obj.file.storage
+    old_name = obj.file.name
+    new_name = obj.file.field.generate_filename(obj, obj.name)
+    stored_name = delta.assemble(storage, old_name, new_name, segments)
+    try:
+        with transaction.atomic():
+            obj.file.name = stored_name
+            obj.size = new_size
+            # Assembled output is stored as is, never compressed.
+            obj.codec = ""
+            obj.stored_size = new_size
+            obj.save(update_fields=["file", "size", "codec", "stored_size"])
+            delta.store_manifest(obj, manifest)
+            ChangeEvent.record(request.user.pk, ChangeEvent.UPDATE, obj)
+            rollups.apply(request.user.pk, added=[rollups.file_row(obj, bytes=obj.size - old_size, files=0)])
+            # Renditions of the old content stay in place until the new
+            # ones replace them.
+            Transcode.objects.filter(file=obj).update(status=Transcode.PENDING, attempts=0)
+    except Exception:
+        if stored_name != old_name:
+            storage.delete(stored_name)
+        raise
+    if stored_name != old_name:
+        storage.delete(old_name)
+    return JsonResponse({"status": "ok", "size": obj.size})
\ No newline at end of file
@@ -0,0 +1,117 @@
+import io
+import logging
+import os
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+
+from .storage import is_s3, s3_client
+
+logger = logging.getLogger(__name__)
+
+
+def _host() -> str:
+    for host in settings.ALLOWED_HOSTS:
+        if host != "*":
+            return host.lstrip(".")
+    return "localhost"
+
+
+def get(handler, path: str) -> int:
+    """GET ``path`` through a WSGI handler the way a server would and return
+    the status code. Used to run the first requests before real traffic."""
+    path, _, query = path.partition("?")
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": _host(),
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": _host(),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    status = []
+    result = handler(environ, lambda s, headers, exc_info=None: status.append(int(s[:3])))
+    try:
+        for _ in result:
+            pass
+    finally:
+        result.close()
+    return status[0]
+
+
+def _project_templates():
+    for directory in settings.TEMPLATES[0].get("DIRS", []):
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith((".html", ".txt")):
+                    yield os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+
+
+def _templates():
+    # Fills the cached loader, so requests skip parsing.
+    engine = engines["django"]
+    for name in _project_templates():
+        engine.get_template(name)
+
+
+def _databases():
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def _storage():
+    # Resolving the lazy default storage imports its backend; for S3 this
+    # builds the boto3 session and client, the slowest part of a first
+    # download.
+    if is_s3(default_storage):
+        s3_client(default_storage)
+    getattr(staticfiles_storage, "hashed_files", None)
+
+
+def _requests(handler):
+    for path in getattr(settings, "WARMUP_PATHS", []):
+        status = get(handler, path)
+        if status >= 500:
+            logger.warning("Warm-up request to %s returned %s", path, status)
+
+
+def warm_up(handler=None) -> dict:
+    """Do the work a worker's first requests would otherwise pay for:
+    URLconf import, template compilation, database connections, the storage
+    client and, with a WSGI ``handler``, a GET of each of WARMUP_PATHS.
+
+    Call it once per worker process after it is forked and before it
+    accepts traffic (connections must not be shared across a fork). A step
+    that fails is logged and skipped; the worker still starts. Returns the
+    milliseconds spent per step."""
+    steps = [
+        ("urls", lambda: get_resolver().url_patterns),
+        ("templates", _templates),
+        ("databases", _databases),
+        ("storage", _storage),
+    ]
+    if handler is not None:
+        steps.append(("requests", lambda: _requests(handler)))
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step %s failed", name)
+        timings[name] = (time.perf_counter() - started) * 1000
+    return timings
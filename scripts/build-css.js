@@ -0,0 +1,59 @@
+// Builds static/src/css/*.css into static/css/. Every stylesheet goes
+// through Tailwind and is minified; base.css also pulls in the Tailwind and
+// DaisyUI classes that the templates and scripts actually use.
+//
+//   npm run build          build once
+//   npm run watch          rebuild on change
+const fs = require('fs');
+const path = require('path');
+const postcss = require('postcss');
+const atImport = require('postcss-import');
+const tailwind = require('tailwindcss');
+
+const root = path.resolve(__dirname, '..');
+const srcDir = path.join(root, 'static', 'src', 'css');
+const outDir = path.join(root, 'static', 'css');
+const config = require(path.join(root, 'tailwind.config.js'));
+
+// Comments and whitespace only; property values are left as written.
+function minify(css) {
+  return css
+    .replace(/\/\*[\s\S]*?\*\//g, '')
+    .replace(/\s+/g, ' ')
+    .replace(/\s*([{};,>])\s*/g, '$1')
+    .replace(/;}/g, '}')
+    .trim() + '\n';
+}
+
+async function build(name) {
+  const from = path.join(srcDir, name);
+  const result = await postcss([atImport(), tailwind(config)]).process(
+    fs.readFileSync(from, 'utf8'),
+    { from }
+  );
+  fs.writeFileSync(path.join(outDir, name), minify(result.css));
+  return name;
+}
+
+async function buildAll() {
+  fs.mkdirSync(outDir, { recursive: true });
+  const names = fs.readdirSync(srcDir).filter((name) => name.endsWith('.css'));
+  const built = await Promise.all(names.map(build));
+  console.log(`built ${built.length} stylesheets into static/css`);
+}
+
+buildAll().catch((error) => {
+  console.error(error);
+  process.exitCode = 1;
+});
+
+if (process.argv.includes('--watch')) {
+  let timer = null;
+  const rebuild = () => {
+    clearTimeout(timer);
+    timer = setTimeout(() => buildAll().catch((error) => console.error(error.message)), 100);
+  };
+  for (const dir of [srcDir, path.join(root, 'templates'), path.join(root, 'static', 'js')]) {
+    fs.watch(dir, { recursive: true }, rebuild);
+  }
+}
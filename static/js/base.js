@@ -0,0 +1,115 @@
+// user menu (без изменений)
+document.addEventListener('click', e=>{
+  const btn=document.getElementById('avatarBtn');
+  const menu=document.getElementById('userMenu');
+  if(!menu) return;
+  if(e.target===btn){ menu.classList.toggle('open'); return; }
+  if(!menu.contains(e.target)) menu.classList.remove('open');
+});
+
+// theme: A -> ☀ -> 🌙 с подсказкой
+(function(){
+  const key='theme';
+  const root=document.documentElement;
+  const btn=document.getElementById('themeBtn');
+  const order=['system','light','dark'];
+  const titles={
+    system:'Тема: системная',
+    light:'Тема: светлая',
+    dark:'Тема: тёмная'
+  };
+
+  function setIcon(mode){
+    btn.innerHTML = '';
+    btn.style.fontWeight = '';
+    btn.style.fontSize = '';
+
+    if (mode === 'light') {
+      // Материальное "солнце": цельный path, fill=currentColor
+      btn.innerHTML =
+        '<svg class="ic" viewBox="0 0 24 24" width="18" height="18" fill="currentColor" aria-hidden="true">' +
+        '<path d="M6.76 4.84l-1.8-1.79L3.17 4.84l1.79 1.79 1.8-1.79zM1 13h3v-2H1v2zm10 10h-2v-3h2v3zm8.83-7.37l-1.79-1.79-1.8 1.79 1.79 1.8 1.8-1.8zM20 11h3v2h-3v-2zm-8-7h-2V1h2v3zm-6.24 14.24l-1.79 1.79 1.41 1.41 1.8-1.79-1.42-1.41zM17.66 6.62l1.79-1.79-1.41-1.41-1.8 1.79 1.42 1.41zM12 6a6 6 0 100 12 6 6 0 000-12z"/>' +
+        '</svg>';
+    } else if (mode === 'dark') {
+      // Луна: цельный path, fill=currentColor
+      btn.innerHTML =
+        '<svg class="ic" viewBox="0 0 24 24" width="18" height="18" fill="currentColor" aria-hidden="true">' +
+        '<path d="M21 12.79A9 9 0 1 1 11.21 3 7 7 0 1 0 21 12.79Z"/>' +
+        '</svg>';
+    } else {
+      // Системная: буква A
+      btn.textContent = 'A';
+      btn.style.fontWeight = '700';
+      btn.style.fontSize = '16px';
+    }
+
+    btn.title = titles[mode];
+  }
+
+  function apply(mode){
+    if(mode==='light') root.setAttribute('data-theme','light');
+    else if(mode==='dark') root.setAttribute('data-theme','dark');
+    else root.removeAttribute('data-theme');
+    setIcon(mode);
+  }
+
+  function load(){ return localStorage.getItem(key) || 'dark'; }
+  function save(v){ localStorage.setItem(key,v); }
+
+  let current=load();
+  apply(current);
+
+  btn?.addEventListener('click', ()=>{
+    const idx=order.indexOf(current);
+    current=order[(idx+1)%order.length];
+    save(current);
+    apply(current);
+  });
+})();
+
+// toasts autohide
+(function(){
+  const toasts=[...document.querySelectorAll('#toasts .toast')];
+  toasts.forEach((t,i)=>{
+    const timeout=3500+i*200;
+    setTimeout(()=>t.classList.add('fade-out'),timeout);
+    setTimeout(()=>t.remove(),timeout+220);
+  });
+})();
+
+// live updates: library changes, storage usage and upload progress arrive
+// as server-sent events and are re-dispatched as live:* DOM events
+(function(){
+  const url=document.body.dataset.events;
+  if(!url||typeof EventSource!=='function') return;
+  const source=new EventSource(url);
+  ['change','usage','upload','resync'].forEach(name=>{
+    source.addEventListener(name,e=>{
+      let detail={};
+      try{ detail=JSON.parse(e.data); }catch(err){ return; }
+      document.dispatchEvent(new CustomEvent('live:'+name,{detail}));
+    });
+  });
+  addEventListener('pagehide',()=>source.close());
+
+  document.addEventListener('live:usage',e=>{
+    const text=document.querySelector('.usage .usage-top .muted');
+    const bar=document.querySelector('.usage .bar-fill');
+    if(text) text.textContent=e.detail.display;
+    if(bar) bar.style.width=e.detail.percent+'%';
+  });
+})();
+
+// offline cache for the file pages and previews (templates/sw.js); removed
+// again when the server stops offering it
+(function(){
+  if(!('serviceWorker' in navigator)) return;
+  const url=document.body.dataset.sw;
+  if(url){
+    navigator.serviceWorker.register(url).catch(()=>{});
+  }else if('signedIn' in document.body.dataset){
+    navigator.serviceWorker.getRegistrations()
+      .then(regs=>regs.forEach(reg=>reg.unregister()))
+      .catch(()=>{});
+  }
+})();
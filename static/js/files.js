@@ -0,0 +1,290 @@
+(function(){
+  const grid=document.getElementById('fileGrid');
+  const menu=document.getElementById('ctxMenu');
+  let current=null;
+
+  function getCsrfToken(){
+    const match=document.cookie.match(/(?:^|; )csrftoken=([^;]+)/);
+    return match?decodeURIComponent(match[1]):'';
+  }
+
+  function pushToast(text,type='success'){
+    const wrap=document.getElementById('toasts');
+    if(!wrap) return;
+    const toast=document.createElement('div');
+    toast.className='toast'+(type==='error'?' error':' success');
+    toast.textContent=text;
+    wrap.appendChild(toast);
+    setTimeout(()=>toast.classList.add('fade-out'),2800);
+    setTimeout(()=>toast.remove(),3200);
+  }
+
+  function handleEmptyGrid(){
+    if(!grid) return;
+    if(grid.children.length===0){
+      const msg=grid.dataset.empty||'Здесь появятся ваши файлы.';
+      grid.innerHTML='<div class="tile muted">'+msg+'</div>';
+    }
+  }
+
+  function postForm(url,body){
+    return fetch(url,{
+      method:'POST',
+      headers:{'X-CSRFToken':getCsrfToken()},
+      body
+    }).then(res=>res.json().catch(()=>({})).then(data=>{
+      if(!res.ok) throw new Error(data.error||'');
+      return data;
+    }));
+  }
+
+  function moveTile(tile,folder){
+    const body=new FormData();
+    body.append(tile.dataset.moveField,folder||'');
+    postForm(tile.dataset.move,body)
+      .then(()=>{
+        tile.remove();
+        pushToast('Перемещено.');
+        handleEmptyGrid();
+      })
+      .catch(err=>pushToast(err.message||'Не удалось переместить.','error'));
+  }
+
+  // Drag a tile onto a folder tile or a breadcrumb to move it there.
+  let dragged=null;
+  addEventListener('dragstart',e=>{
+    const tile=e.target.closest&&e.target.closest('.tile[data-move]');
+    dragged=tile||null;
+    if(tile) e.dataTransfer.effectAllowed='move';
+  });
+  addEventListener('dragend',()=>{dragged=null;});
+  addEventListener('dragover',e=>{
+    const target=e.target.closest&&e.target.closest('[data-drop]');
+    if(!dragged||!target||target===dragged) return;
+    e.preventDefault();
+    target.classList.add('drop-over');
+  });
+  addEventListener('dragleave',e=>{
+    const target=e.target.closest&&e.target.closest('[data-drop]');
+    if(target) target.classList.remove('drop-over');
+  });
+  addEventListener('drop',e=>{
+    const target=e.target.closest&&e.target.closest('[data-drop]');
+    if(!dragged||!target||target===dragged) return;
+    e.preventDefault();
+    target.classList.remove('drop-over');
+    moveTile(dragged,target.dataset.drop);
+    dragged=null;
+  });
+
+  // Other tabs and devices change the library too: re-read this page (its
+  // grid is served from the fragment cache) and swap the tiles in place.
+  let refreshTimer=null;
+  let refreshWhenVisible=false;
+  function refreshGrid(){
+    if(document.hidden){
+      if(!refreshWhenVisible) document.addEventListener('visibilitychange',refreshGrid,{once:true});
+      refreshWhenVisible=true;
+      return;
+    }
+    refreshWhenVisible=false;
+    fetch(location.href,{credentials:'same-origin'})
+      .then(res=>res.ok?res.text():null)
+      .then(html=>{
+        if(html===null) return;
+        const fresh=new DOMParser().parseFromString(html,'text/html').getElementById('fileGrid');
+        if(grid&&fresh) grid.replaceChildren(...fresh.childNodes);
+        else if(grid||fresh) location.reload();
+      })
+      .catch(()=>{});
+  }
+  document.addEventListener('live:change',()=>{
+    clearTimeout(refreshTimer);
+    refreshTimer=setTimeout(refreshGrid,250);
+  });
+  document.addEventListener('live:resync',refreshGrid);
+  // The service worker served a cached copy and found it out of date.
+  navigator.serviceWorker?.addEventListener('message',e=>{
+    if(e.data&&e.data.type==='stale') refreshGrid();
+  });
+
+  function hide(){
+    menu.classList.remove('open');
+    menu.setAttribute('aria-hidden','true');
+    current=null;
+  }
+
+  function show(x,y){
+    menu.style.left=Math.min(x,innerWidth-menu.offsetWidth-8)+'px';
+    menu.style.top=Math.min(y,innerHeight-menu.offsetHeight-8)+'px';
+    menu.classList.add('open');
+    menu.setAttribute('aria-hidden','false');
+  }
+
+  const newFolder=document.getElementById('newFolder');
+  if(newFolder){
+    newFolder.addEventListener('click',()=>{
+      const name=prompt('Название папки');
+      if(!name||!name.trim()) return;
+      const body=new FormData();
+      body.append('name',name.trim());
+      if(newFolder.dataset.parent) body.append('parent',newFolder.dataset.parent);
+      fetch(newFolder.dataset.url,{
+        method:'POST',
+        headers:{'X-CSRFToken':getCsrfToken()},
+        body
+      })
+        .then(res=>{
+          if(!res.ok) throw new Error('fail');
+          return res.json();
+        })
+        .then(data=>{location=data.url;})
+        .catch(()=>pushToast('Не удалось создать папку.','error'));
+    });
+  }
+
+  if(grid){
+    grid.addEventListener('click',e=>{
+      const tile=e.target.closest('.tile');
+      if(!tile) return;
+      if(tile.dataset.open){
+        location=tile.dataset.open;
+        return;
+      }
+      const kind=tile.dataset.kind;
+      const view=tile.dataset.view;
+      const dl=tile.dataset.download;
+      const url=(kind==='image'||kind==='video'||kind==='pdf')?view:dl;
+      if(e.metaKey||e.ctrlKey){
+        window.open(url,'_blank');
+      }else{
+        location=url;
+      }
+    });
+
+    grid.addEventListener('contextmenu',e=>{
+      const tile=e.target.closest('.tile');
+      if(!tile) return;
+      e.preventDefault();
+      current=tile;
+      menu.querySelector('[data-action="archive"]').style.display=tile.dataset.archive?'':'none';
+      show(e.clientX,e.clientY);
+    });
+  }
+
+  menu.addEventListener('click',e=>{
+    const item=e.target.closest('.ctx-item');
+    if(!item||item.getAttribute('aria-disabled')==='true'||!current) return;
+    const action=item.dataset.action;
+    const dl=current.dataset.download;
+
+    if(action==='archive'){
+      if(current.dataset.archive) location=current.dataset.archive;
+      hide();
+      return;
+    }
+
+    if(action==='download'){
+      if(dl) location=dl;
+      hide();
+      return;
+    }
+
+    if(action==='rename'&&current.dataset.rename){
+      const tile=current;
+      const name=prompt('Новое название',tile.dataset.name||'');
+      hide();
+      if(!name||!name.trim()) return;
+      const body=new FormData();
+      body.append('name',name.trim());
+      fetch(tile.dataset.rename,{
+        method:'POST',
+        headers:{'X-CSRFToken':getCsrfToken()},
+        body
+      })
+        .then(res=>{
+          if(!res.ok) throw new Error('fail');
+          return res.json();
+        })
+        .then(data=>{
+          tile.dataset.name=data.name;
+          tile.querySelector('.tile-name').textContent=data.name;
+        })
+        .catch(()=>pushToast('Не удалось переименовать.','error'));
+      return;
+    }
+
+    if(action==='delete'){
+      const url=current.dataset.delete;
+      if(!url){
+        hide();
+        return;
+      }
+      const tile=current;
+      fetch(url,{
+        method:'POST',
+        headers:{'X-CSRFToken':getCsrfToken()}
+      })
+        .then(res=>{
+          if(!res.ok) throw new Error('fail');
+          return res.json();
+        })
+        .then(()=>{
+          tile.remove();
+          pushToast(tile.dataset.kind==='folder'?'Папка перемещена в корзину.':'Файл перемещён в корзину.');
+          handleEmptyGrid();
+        })
+        .catch(()=>{
+          pushToast('Не удалось удалить файл.','error');
+        })
+        .finally(()=>hide());
+      return;
+    }
+
+    if(action==='move'&&current.dataset.move){
+      const tile=current;
+      hide();
+      const targets=[...grid.querySelectorAll('.tile.folder')].filter(t=>t!==tile);
+      const names=targets.map(t=>t.dataset.name);
+      if(menu.dataset.folder) names.unshift('..');
+      if(!names.length){
+        pushToast('Некуда перемещать: создайте папку.','error');
+        return;
+      }
+      const answer=prompt('Куда переместить? '+names.join(', '),names[0]);
+      if(answer===null) return;
+      if(answer.trim()==='..'){
+        moveTile(tile,menu.dataset.parent);
+        return;
+      }
+      const target=targets.find(t=>t.dataset.name===answer.trim());
+      if(!target){
+        pushToast('Папка не найдена.','error');
+        return;
+      }
+      moveTile(tile,target.dataset.drop);
+      return;
+    }
+
+    if(action==='copy'&&current.dataset.duplicate){
+      const url=current.dataset.duplicate;
+      hide();
+      postForm(url)
+        .then(()=>location.reload())
+        .catch(err=>pushToast(err.message||'Не удалось скопировать файл.','error'));
+      return;
+    }
+
+    alert('Функция «'+action+'» появится позже.');
+    hide();
+  });
+
+  addEventListener('click',e=>{
+    if(!menu.contains(e.target)) hide();
+  });
+  addEventListener('scroll',hide,true);
+  addEventListener('resize',hide);
+  addEventListener('keydown',e=>{
+    if(e.key==='Escape') hide();
+  });
+})();
@@ -0,0 +1,153 @@
+(function() {
+  const dropArea = document.getElementById('dropzone');
+  if (!dropArea) {
+    return;
+  }
+  const fileInput = document.getElementById('drop-input');
+  const browseBtn = document.getElementById('drop-browse');
+  const status = document.getElementById('drop-status');
+  const result = document.getElementById('drop-result');
+  const note = document.getElementById('drop-note');
+
+  const preventDefaults = (event) => {
+    event.preventDefault();
+    event.stopPropagation();
+  };
+
+  ['dragenter', 'dragover', 'dragleave', 'drop'].forEach((eventName) => {
+    dropArea.addEventListener(eventName, preventDefaults, false);
+  });
+
+  ['dragenter', 'dragover'].forEach((eventName) => {
+    dropArea.addEventListener(eventName, () => dropArea.classList.add('dragover'), false);
+  });
+
+  ['dragleave', 'drop'].forEach((eventName) => {
+    dropArea.addEventListener(eventName, () => dropArea.classList.remove('dragover'), false);
+  });
+
+  dropArea.addEventListener('drop', (event) => {
+    const files = event.dataTransfer.files;
+    if (files && files.length) {
+      uploadFile(files[0]);
+    }
+  });
+
+  dropArea.addEventListener('click', (event) => {
+    if (event.target === dropArea || event.target === status) {
+      fileInput.click();
+    }
+  });
+  browseBtn.addEventListener('click', () => fileInput.click());
+
+  fileInput.addEventListener('change', (event) => {
+    if (event.target.files && event.target.files.length) {
+      uploadFile(event.target.files[0]);
+      event.target.value = '';
+    }
+  });
+
+  const uploadFile = async (file) => {
+    if (!file) {
+      return;
+    }
+    status.textContent = `Загружаем «${file.name}»…`;
+    dropArea.classList.add('loading');
+    result.hidden = true;
+    note.hidden = true;
+    try {
+      const payload = new FormData();
+      payload.append('file', file);
+      const response = await fetch(dropArea.dataset.uploadUrl, {
+        method: 'POST',
+        headers: {
+          'X-CSRFToken': getCookie('csrftoken') || ''
+        },
+        body: payload
+      });
+      if (!response.ok) {
+        const failure = await response.json().catch(() => ({}));
+        status.textContent = failure.error || 'Не удалось загрузить файл. Попробуй ещё раз.';
+        return;
+      }
+      const data = await response.json();
+      status.textContent = 'Готово! Скопируй ссылку ниже:';
+      renderResultLink(data.url);
+      result.hidden = false;
+      note.hidden = false;
+    } catch (error) {
+      console.error(error);
+      status.textContent = 'Не удалось загрузить файл. Попробуй ещё раз.';
+    } finally {
+      dropArea.classList.remove('loading');
+    }
+  };
+
+  const renderResultLink = (url) => {
+    result.innerHTML = '';
+    let displayUrl = url;
+    try {
+      const parsed = new URL(url);
+      displayUrl = `${parsed.origin}${parsed.pathname}`;
+    } catch (error) {
+      displayUrl = url.replace(/^https?:\/\//, '');
+    }
+
+    const link = document.createElement('a');
+    link.href = url;
+    link.target = '_blank';
+    link.rel = 'noopener';
+    link.textContent = displayUrl;
+
+    const copyBtn = document.createElement('button');
+    copyBtn.type = 'button';
+    copyBtn.className = 'drop-copy-btn';
+    copyBtn.textContent = 'Скопировать';
+    copyBtn.addEventListener('click', async (event) => {
+      event.stopPropagation();
+      const ok = await copyToClipboard(url);
+      copyBtn.textContent = ok ? 'Скопировано!' : 'Не вышло :(';
+      setTimeout(() => {
+        copyBtn.textContent = 'Скопировать';
+      }, 2000);
+    });
+
+    result.append(link, copyBtn);
+  };
+
+  const copyToClipboard = async (value) => {
+    if (navigator.clipboard && window.isSecureContext) {
+      try {
+        await navigator.clipboard.writeText(value);
+        return true;
+      } catch (error) {
+        return false;
+      }
+    }
+
+    const textarea = document.createElement('textarea');
+    textarea.value = value;
+    textarea.setAttribute('readonly', '');
+    textarea.style.position = 'absolute';
+    textarea.style.left = '-9999px';
+    document.body.appendChild(textarea);
+    textarea.select();
+    let copied = false;
+    try {
+      copied = document.execCommand('copy');
+    } catch (error) {
+      copied = false;
+    }
+    document.body.removeChild(textarea);
+    return copied;
+  };
+
+  const getCookie = (name) => {
+    const value = `; ${document.cookie}`;
+    const parts = value.split(`; ${name}=`);
+    if (parts.length === 2) {
+      return parts.pop().split(';').shift();
+    }
+    return null;
+  };
+})();
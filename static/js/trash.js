@@ -0,0 +1,85 @@
+(function(){
+  const grid=document.getElementById('trashGrid');
+  if(!grid) return;
+
+  function getCsrfToken(){
+    const match=document.cookie.match(/(?:^|; )csrftoken=([^;]+)/);
+    return match?decodeURIComponent(match[1]):'';
+  }
+
+  function pushToast(text,type='success'){
+    const wrap=document.getElementById('toasts');
+    if(!wrap) return;
+    const toast=document.createElement('div');
+    toast.className='toast'+(type==='error'?' error':' success');
+    toast.textContent=text;
+    wrap.appendChild(toast);
+    setTimeout(()=>toast.classList.add('fade-out'),2800);
+    setTimeout(()=>toast.remove(),3200);
+  }
+
+  function handleEmpty(){
+    if(grid.children.length===0){
+      const msg=grid.dataset.empty||'Корзина пуста.';
+      grid.innerHTML='<div class="tile muted">'+msg+'</div>';
+    }
+  }
+
+  // Other tabs and devices change the library too: re-read this page (its
+  // grid is served from the fragment cache) and swap the tiles in place.
+  let refreshTimer=null;
+  let refreshWhenVisible=false;
+  function refreshGrid(){
+    if(document.hidden){
+      if(!refreshWhenVisible) document.addEventListener('visibilitychange',refreshGrid,{once:true});
+      refreshWhenVisible=true;
+      return;
+    }
+    refreshWhenVisible=false;
+    fetch(location.href,{credentials:'same-origin'})
+      .then(res=>res.ok?res.text():null)
+      .then(html=>{
+        if(html===null) return;
+        const fresh=new DOMParser().parseFromString(html,'text/html').getElementById('trashGrid');
+        if(grid&&fresh) grid.replaceChildren(...fresh.childNodes);
+        else if(grid||fresh) location.reload();
+      })
+      .catch(()=>{});
+  }
+  document.addEventListener('live:change',()=>{
+    clearTimeout(refreshTimer);
+    refreshTimer=setTimeout(refreshGrid,250);
+  });
+  document.addEventListener('live:resync',refreshGrid);
+  // The service worker served a cached copy and found it out of date.
+  navigator.serviceWorker?.addEventListener('message',e=>{
+    if(e.data&&e.data.type==='stale') refreshGrid();
+  });
+
+  grid.addEventListener('click',e=>{
+    const btn=e.target.closest('button[data-action]');
+    if(!btn) return;
+    const tile=e.target.closest('.tile');
+    if(!tile) return;
+    const action=btn.dataset.action;
+    const urls={
+      restore: tile.dataset.restore,
+      purge: tile.dataset.purge,
+    };
+    const url=urls[action];
+    if(!url) return;
+    btn.disabled=true;
+    fetch(url,{method:'POST',headers:{'X-CSRFToken':getCsrfToken()}})
+      .then(res=>{if(!res.ok) throw new Error('fail'); return res.json();})
+      .then(()=>{
+        tile.remove();
+        if(action==='restore') pushToast('Файл восстановлен.');
+        else pushToast('Файл удалён навсегда.');
+        handleEmpty();
+      })
+      .catch(()=>{
+        pushToast('Не удалось выполнить действие.', 'error');
+        btn.disabled=false;
+      });
+  });
+})();
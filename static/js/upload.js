@@ -0,0 +1,80 @@
+(function(){
+  const form = document.getElementById('uploadForm');
+  const dropZone = document.getElementById('dropZone');
+  const fileInput = dropZone?.querySelector('input[type="file"]');
+  const fileInfo = document.getElementById('fileInfo');
+  if(!form || !dropZone || !fileInput) return;
+
+  // скрываем стандартный инпут, чтобы оставить доступность через label
+  fileInput.classList.add('drop-zone__input');
+
+  function formatBytes(bytes){
+    if(!bytes && bytes !== 0) return '';
+    const sizes = ['Б', 'КБ', 'МБ', 'ГБ'];
+    const i = Math.min(Math.floor(Math.log(bytes || 1) / Math.log(1024)), sizes.length - 1);
+    const value = bytes / Math.pow(1024, i);
+    return `${value.toFixed(value < 10 && i > 0 ? 1 : 0)} ${sizes[i]}`;
+  }
+
+  function showFile(file){
+    if(!file || !fileInfo) return;
+    fileInfo.style.display = 'block';
+    fileInfo.textContent = `${file.name} • ${formatBytes(file.size)}`;
+  }
+
+  dropZone.addEventListener('click', () => fileInput.click());
+
+  dropZone.addEventListener('dragover', (event) => {
+    event.preventDefault();
+    dropZone.classList.add('drop-zone--dragover');
+  });
+
+  ['dragleave', 'dragend', 'drop'].forEach((type) => {
+    dropZone.addEventListener(type, () => dropZone.classList.remove('drop-zone--dragover'));
+  });
+
+  dropZone.addEventListener('drop', (event) => {
+    event.preventDefault();
+    const files = event.dataTransfer?.files;
+    if(!files || !files.length) return;
+    const file = files[0];
+    if(typeof DataTransfer === 'function'){
+      const dt = new DataTransfer();
+      dt.items.add(file);
+      fileInput.files = dt.files;
+    }else{
+      try{ fileInput.files = files; }
+      catch(err){}
+    }
+    showFile(file);
+    if(typeof form.requestSubmit === 'function') form.requestSubmit();
+    else form.submit();
+  });
+
+  // Server-side progress: the id in the query string comes back on the
+  // live:upload events for this request (see base.js).
+  const uploadId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+  const action = new URL(form.getAttribute('action') || location.href, location.href);
+  action.searchParams.set('upload_id', uploadId);
+  form.action = action.toString();
+
+  document.addEventListener('live:upload', (event) => {
+    const info = event.detail;
+    if(info.id !== uploadId || !fileInfo) return;
+    fileInfo.style.display = 'block';
+    if(info.state === 'failed'){
+      fileInfo.textContent = `${info.name} • ошибка загрузки`;
+    }else if(info.state === 'stored'){
+      fileInfo.textContent = `${info.name} • сохранено`;
+    }else{
+      const percent = info.total ? Math.min(Math.round(info.received * 100 / info.total), 99) : 0;
+      fileInfo.textContent = `${info.name} • ${formatBytes(info.received)} из ${formatBytes(info.total)} (${percent}%)`;
+    }
+  });
+
+  fileInput.addEventListener('change', () => {
+    const file = fileInput.files?.[0];
+    if(!file) return;
+    showFile(file);
+  });
+})();
@@ -0,0 +1,25 @@
+(function(){
+  const video=document.getElementById('player');
+  const hls=video.dataset.hls;
+  if(!hls){
+    video.src=video.dataset.src;
+    return;
+  }
+  if(video.canPlayType('application/vnd.apple.mpegurl')){
+    video.src=hls;
+    return;
+  }
+  if(!window.MediaSource){
+    video.src=video.dataset.src;
+    return;
+  }
+  const script=document.createElement('script');
+  script.src='https://cdn.jsdelivr.net/npm/hls.js@1/dist/hls.min.js';
+  script.onload=()=>{
+    const player=new Hls();
+    player.loadSource(hls);
+    player.attachMedia(video);
+  };
+  script.onerror=()=>{video.src=video.dataset.src;};
+  document.head.appendChild(script);
+})();
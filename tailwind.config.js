@@ -1,13 +1,25 @@
+// Tailwind and DaisyUI classes are prefixed with tw- and Tailwind's reset is
+// off, so they can be used next to the hand-written styles in
+// static/src/css without changing them. Only classes found in content are
+// emitted.
 module.exports = {
   content: [
     "./templates/**/*.{html,js}",
     "./core/**/*.{html,js}",
+    "./static/js/**/*.js",
   ],
+  prefix: "tw-",
+  corePlugins: {
+    preflight: false,
+  },
   theme: {
     extend: {},
   },
   plugins: [require("daisyui")],
   daisyui: {
     themes: ["light", "dark", "cupcake"],
+    base: false,
+    prefix: "tw-",
+    logs: false,
   },
 }
@@ -0,0 +1,125 @@
+// Service worker for signed-in pages (served by core.views.service_worker).
+//  - static shell: cache-first when names are content-hashed, otherwise
+//    stale-while-revalidate;
+//  - /files and /trash: stale-while-revalidate; a copy is kept only when the
+//    server stamped it with X-Library-Version, and the page is told to
+//    refresh its grid when the revalidated stamp differs;
+//  - previews: kept under their pv stamp, which changes only with the file,
+//    so only new or changed tiles are downloaded.
+const CONFIG = {{ config|safe }};
+const SHELL = 'shell-' + CONFIG.version;
+const PAGES = 'pages-' + CONFIG.version;
+const PREVIEWS = 'previews-v1';
+// Pages right after a form post carry one-off messages; fetch those fresh.
+const MUTATION_WINDOW = 5000;
+let lastMutation = 0;
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(SHELL).then((cache) => cache.addAll(CONFIG.shell)).then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  const keep = [SHELL, PAGES, PREVIEWS];
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((key) => !keep.includes(key)).map((key) => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+function stamped(response){
+  return response.ok && response.headers.has(CONFIG.header);
+}
+
+async function notifyStale(clientId, url){
+  const client = clientId && await self.clients.get(clientId);
+  if(client) client.postMessage({type: 'stale', url});
+}
+
+async function fromShell(event, request){
+  const cache = await caches.open(SHELL);
+  const cached = await cache.match(request);
+  const network = fetch(request).then((response) => {
+    if(response.ok) cache.put(request, response.clone());
+    return response;
+  });
+  if(cached){
+    if(!CONFIG.immutable) event.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  return network;
+}
+
+async function page(event, request){
+  const cache = await caches.open(PAGES);
+  const cached = await cache.match(request);
+  const network = fetch(request).then(async (response) => {
+    if(stamped(response)){
+      await cache.put(request, response.clone());
+    }else{
+      await cache.delete(request);
+    }
+    if(cached && cached.headers.get(CONFIG.header) !== response.headers.get(CONFIG.header)){
+      await notifyStale(event.resultingClientId || event.clientId, request.url);
+    }
+    return response;
+  });
+  if(cached){
+    event.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  return network;
+}
+
+async function fresh(request){
+  const response = await fetch(request);
+  const cache = await caches.open(PAGES);
+  if(stamped(response)) await cache.put(request, response.clone());
+  else await cache.delete(request);
+  return response;
+}
+
+async function preview(request, url){
+  const cache = await caches.open(PREVIEWS);
+  const key = new URL('/__preview/' + url.searchParams.get('pv'), self.location.origin).href;
+  const cached = await cache.match(key);
+  if(cached) return cached;
+  let response;
+  try{
+    // CORS so the object stays readable after a redirect to the bucket;
+    // without CORS on the bucket previews still load, just uncached.
+    response = await fetch(url.href, {mode: 'cors', credentials: 'same-origin'});
+  }catch(err){
+    return fetch(request);
+  }
+  if(response.ok){
+    await cache.put(key, response.clone());
+    const keys = await cache.keys();
+    const extra = keys.length - CONFIG.previewLimit;
+    if(extra > 0) await Promise.all(keys.slice(0, extra).map((old) => cache.delete(old)));
+  }
+  return response;
+}
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if(url.origin !== self.location.origin) return;
+
+  if(request.method !== 'GET'){
+    lastMutation = Date.now();
+    // Signing in or out: pages of the previous user must not be shown.
+    if(url.pathname.startsWith(CONFIG.account)) event.waitUntil(caches.delete(PAGES));
+    return;
+  }
+  if(url.pathname.startsWith(CONFIG.static)){
+    event.respondWith(fromShell(event, request));
+  }else if(url.searchParams.has('pv') && request.destination === 'image'){
+    event.respondWith(preview(request, url));
+  }else if(CONFIG.pages.includes(url.pathname)){
+    const recent = Date.now() - lastMutation < MUTATION_WINDOW;
+    event.respondWith(request.mode === 'navigate' && !recent ? page(event, request) : fresh(request));
+  }
+});